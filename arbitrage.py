@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# Kraken's taker fee at the lowest volume tier, paid on every leg
+TAKER_FEE = 0.0026
+
+
+def _join(left, right):
+    """
+    Equi-join of two int64 key arrays. Returns (left index, right index) of every matching pair.
+    """
+    order = np.argsort(right, kind="stable")
+    keys = right[order]
+    low = np.searchsorted(keys, left, "left")
+    counts = np.searchsorted(keys, left, "right") - low
+    left_index = np.repeat(np.arange(len(left)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return left_index, order[np.repeat(low, counts) + offsets]
+
+
+def pair_edges(base_ids, quote_ids):
+    """
+    Directed edges of the currency graph, two per pair: edge 2 * pair sells the
+    base for the quote (at the bid), edge 2 * pair + 1 buys the base with the
+    quote (at the ask).
+
+    Returns:
+    - np.ndarray: Source asset of every edge.
+    - np.ndarray: Target asset of every edge.
+    """
+    sources = np.empty(2 * len(base_ids), dtype=np.int64)
+    targets = np.empty(2 * len(base_ids), dtype=np.int64)
+    sources[0::2], targets[0::2] = base_ids, quote_ids
+    sources[1::2], targets[1::2] = quote_ids, base_ids
+    return sources, targets
+
+
+def find_cycles(sources, targets, assets):
+    """
+    Every directed 3- and 4-cycle through distinct assets, each listed once
+    (starting from its lowest asset id), as rows of edge ids. 3-cycles are
+    padded with -1.
+    """
+    edges = np.arange(len(sources))
+
+    def keys(start, end):
+        return start * assets + end
+
+    # Paths a -> b -> c without going straight back
+    first, second = _join(targets, sources)
+    keep = targets[second] != sources[first]
+    first, second = first[keep], second[keep]
+    start, end = sources[first], targets[second]
+
+    # a -> b -> c -> a
+    path, closing = _join(keys(end, start), keys(sources, targets))
+    triangles = np.column_stack([first[path], second[path], edges[closing]])
+    members = np.column_stack([start[path], targets[first[path]], end[path]])
+    triangles = triangles[members[:, 0] == members.min(axis=1)]
+
+    # a -> b -> c -> d -> a, two paths meeting at a and c
+    left, right = _join(keys(start, end), keys(end, start))
+    b, d = targets[first[left]], targets[first[right]]
+    a = start[left]
+    keep = (b != d) & (a < b) & (a < end[left]) & (a < d)
+    left, right = left[keep], right[keep]
+    squares = np.column_stack([first[left], second[left], first[right], second[right]])
+
+    padded = np.column_stack([triangles, np.full(len(triangles), -1)])
+    return np.concatenate([padded, squares]).astype(np.int32)
+
+
+class ArbitrageScanner:
+    """
+    Triangular (and four-legged) arbitrage over the latest quotes of every pair.
+
+    The currency graph is built once from the registry: every pair is a sell
+    edge (base -> quote at the bid) and a buy edge (quote -> base at the ask),
+    and every 3- and 4-cycle is precomputed as a row of edge ids, plus an index
+    from each pair to the cycles using it. Edge weights are log rates net of
+    `fee`, so a cycle is profitable when its weights sum above zero.
+
+    Attached to a QuoteTable, every ticker message updates the weights of its
+    pairs and re-evaluates only the cycles touching them, in one vectorized
+    gather and sum. Cycles above `min_profit` are reported best first to
+    `on_opportunity(opportunities)` (called under the quote table's lock) and
+    kept in `opportunities`, with the latency from the message's receipt.
+
+    Pairs added to the registry after the scanner was built are not scanned.
+
+    Args:
+    - quotes (QuoteTable): Quote source, indexed by pair id.
+    - registry (PairRegistry): Pairs and assets, defaults to the quote table's.
+    - fee (float): Fee per leg.
+    - min_profit (float): Smallest net return reported (0.001 = 0.1%).
+    - on_opportunity (callable): Called with the ranked opportunities of an update.
+    - max_results (int): Most opportunities reported per update.
+    - history (int): Opportunities kept in `opportunities`.
+    """
+
+    def __init__(self, quotes, registry=None, fee=TAKER_FEE, min_profit=0.0, on_opportunity=None,
+                 max_results=10, history=1000):
+        self.quotes = quotes
+        self.registry = registry if registry is not None else quotes.registry
+        self.fee = fee
+        self.threshold = np.log1p(min_profit)
+        self.on_opportunity = on_opportunity
+        self.max_results = max_results
+        self.opportunities = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+        self.pairs = len(self.registry)
+        self.names = self.registry.to_symbols(np.arange(self.pairs))
+        self.sources, self.targets = pair_edges(self.registry.base_ids[:self.pairs],
+                                                self.registry.quote_ids[:self.pairs])
+        cycles = find_cycles(self.sources, self.targets, len(self.registry.assets))
+        # -1 (the missing fourth leg of a triangle) points at an extra edge of weight 0
+        self.cycles = np.where(cycles < 0, 2 * self.pairs, cycles)
+        self.lengths = (cycles >= 0).sum(axis=1)
+        self.weights = np.full(2 * self.pairs + 1, np.nan)
+        self.weights[-1] = 0.0
+        self.values = np.full(len(self.cycles), np.nan)  # Latest log return of every cycle
+
+        # Cycles using pair p: pair_cycles[pair_starts[p]:pair_starts[p + 1]]
+        owners, positions = np.nonzero(self.cycles < 2 * self.pairs)
+        legs = self.cycles[owners, positions] // 2
+        self.pair_cycles = owners[np.argsort(legs, kind="stable")]
+        self.pair_starts = np.concatenate([[0], np.cumsum(np.bincount(legs, minlength=self.pairs))])
+
+        self.updates = 0
+        self.evaluated = 0
+        self.found = 0
+        self.busy = 0.0
+        self.max_latency = 0
+
+    def __len__(self):
+        return len(self.cycles)
+
+    def _update_weights(self, ids):
+        rows = self.quotes.rows
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.weights[2 * ids] = np.log(rows["bid"][ids]) + np.log1p(-self.fee)
+            self.weights[2 * ids + 1] = np.log1p(-self.fee) - np.log(rows["ask"][ids])
+
+    def cycles_of(self, ids):
+        """
+        Ids of the cycles using any of the given pairs.
+        """
+        if len(ids) == 1:
+            return self.pair_cycles[self.pair_starts[ids[0]]:self.pair_starts[ids[0] + 1]]
+        return np.unique(np.concatenate([self.pair_cycles[self.pair_starts[pair]:self.pair_starts[pair + 1]]
+                                         for pair in ids.tolist()]))
+
+    def update(self, ids, received=None):
+        """
+        QuoteTable listener: re-evaluates the cycles touching the updated pairs.
+        """
+        started = time.perf_counter()
+        ids = np.asarray(ids)
+        ids = ids[ids < self.pairs]
+        if len(ids) == 0:
+            return []
+        with self.lock:
+            self._update_weights(ids)
+            touched = self.cycles_of(ids)
+            values = self.weights[self.cycles[touched]].sum(axis=1)
+            self.values[touched] = values
+            hits = touched[values > self.threshold]
+            self.updates += 1
+            self.evaluated += len(touched)
+            opportunities = self._report(hits, received) if len(hits) else []
+            self.busy += time.perf_counter() - started
+        if opportunities and self.on_opportunity is not None:
+            self.on_opportunity(opportunities)
+        return opportunities
+
+    def _report(self, hits, received):
+        hits = hits[np.argsort(-self.values[hits], kind="stable")][:self.max_results]
+        now = time.time_ns()
+        latency = now - received if received is not None else 0
+        self.max_latency = max(self.max_latency, latency)
+        opportunities = [self.describe(cycle, received, latency) for cycle in hits.tolist()]
+        self.found += len(opportunities)
+        self.opportunities.extend(opportunities)
+        return opportunities
+
+    def describe(self, cycle, received=None, latency=None):
+        """
+        Returns one cycle as a dict: the assets it goes through, the pairs and
+        sides of its legs, its net return after fees and, for a reported
+        opportunity, the receipt time of the quote that triggered it and the
+        latency (ns) from that receipt to the report.
+        """
+        edges = self.cycles[cycle][:self.lengths[cycle]]
+        return {
+            "assets": [self.registry.asset(asset) for asset in self.sources[edges].tolist()],
+            "pairs": self.names[edges // 2].tolist(),
+            "sides": ["sell" if edge % 2 == 0 else "buy" for edge in edges.tolist()],
+            "profit": float(np.expm1(self.values[cycle])),
+            "received": received,
+            "latency": latency,
+        }
+
+    def scan(self, limit=10):
+        """
+        Evaluates every cycle from the current quotes. Returns the best `limit` as dicts.
+        """
+        with self.lock:
+            self._update_weights(np.arange(self.pairs))
+            self.values = self.weights[self.cycles].sum(axis=1)
+            ranked = np.argsort(-np.nan_to_num(self.values, nan=-np.inf), kind="stable")[:limit]
+            return [self.describe(cycle) for cycle in ranked.tolist() if not np.isnan(self.values[cycle])]
+
+    def attach(self):
+        """
+        Evaluates the quotes already in the table, then follows its updates.
+        """
+        self.scan(0)
+        self.quotes.add_listener(self.update)
+
+    def detach(self):
+        self.quotes.remove_listener(self.update)
+
+    def metrics(self):
+        return {
+            "cycles": len(self.cycles),
+            "updates": self.updates,
+            "cycles_evaluated": self.evaluated,
+            "opportunities": self.found,
+            "busy_seconds": self.busy,
+            "max_latency_us": self.max_latency / 1000,
+        }
@@ -0,0 +1,96 @@
+"""
+asyncio connection engine for the 'ohlc' channel only.
+
+AsyncWebSocketHandler subscribes OHLC and nothing else: no trades, books or
+tickers, and a dropped connection is not reconnected or resubscribed (its
+task just ends). It exists to measure what one event loop costs against a
+thread per connection (see benchmark_engines.py); the collector itself runs
+on the threaded WebSocketHandler and its ShardSupervisor.
+"""
+import asyncio
+import json
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from fetch_pairs import WebSocketHandler
+
+
+class AsyncWebSocketHandler(WebSocketHandler):
+    """
+    Runs every shard connection on a single asyncio event loop instead of one
+    thread per connection. Subscriptions and on_message are shared with
+    WebSocketHandler, so both engines feed the same sink.
+
+    OHLC only, without reconnects: see the module docstring.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.trades is not None or self.books is not None or self.quotes is not None:
+            # Only the OHLC subscription is sent, the other channels would silently stay empty
+            raise ValueError("AsyncWebSocketHandler only subscribes the 'ohlc' channel")
+        self.tasks = []
+
+    async def run_connection(self, pair_group):
+        """
+        Open one connection, subscribe its pairs and hand every frame to on_message.
+        """
+        try:
+            async with connect(self.websocket_url, max_size=None) as ws:
+                self.sockets.append(ws)
+                subscription_message = self.subscription_message(pair_group)
+                await ws.send(json.dumps(subscription_message))
+                print(f"Subscribed to OHLC data for {len(subscription_message['params']['symbol'])} pairs")
+
+                async for message in ws:
+                    self.on_message(ws, message)
+        except ConnectionClosed as e:
+            self.on_close(None, e.code, e.reason)
+        except OSError as e:
+            self.on_error(None, e)
+
+    async def start_websockets(self):
+        """
+        Start one task per pair group on the running event loop.
+        """
+        self.tasks = [asyncio.create_task(self.run_connection(pair_group)) for pair_group in self.connections]
+        print("All WebSocket connections started.")
+
+    async def stop(self):
+        """
+        Close every connection and wait for their tasks to finish.
+        """
+        self.stop_event.set()
+        print("Stopping all WebSocket connections.")
+        for ws in self.sockets:
+            await ws.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.sockets = []
+        self.tasks = []
+
+    def stop_websockets(self):
+        """
+        Not usable from async code, call `await handler.stop()` instead.
+        """
+        raise RuntimeError("Use 'await handler.stop()' with AsyncWebSocketHandler")
+
+
+async def main():
+    handler = AsyncWebSocketHandler()
+    await handler.start_websockets()
+    try:
+        while True:
+            print("ohlc data:", handler.store.to_dataframe().head())
+            await asyncio.sleep(1)
+    finally:
+        await handler.stop()
+
+
+if __name__ == "__main__":
+    print("Initializing AsyncWebSocketHandler...")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Keyboard interrupt received. Shutting down...")
@@ -0,0 +1,115 @@
+import time
+import numpy as np
+
+from candle_store import STALE, to_nanos
+
+MINUTE_NS = 60 * 1_000_000_000
+
+
+def missing_minutes(store, symbol, since):
+    """
+    Returns the interval_begins (ns) after `since` and before the symbol's newest
+    stored candle that the store holds no candle for. Measured against the newest
+    candle rather than the clock, so a feed replaying old data works the same.
+    Minutes older than what the symbol's (full) buffer keeps are not reported.
+    """
+    step = store.interval * MINUTE_NS
+    with store.lock:
+        buffer = store.buffers.get(symbol)
+        if buffer is None or len(buffer) == 0:
+            return np.zeros(0, dtype=np.int64)
+        stored = buffer.snapshot(since=since)["interval_begin"]
+        newest = buffer.last_interval_begin()
+        if len(buffer) == buffer.capacity:
+            # A full buffer cannot take candles older than its oldest one, they are not missing
+            since = max(since, int(buffer.columns["interval_begin"][buffer.order()[0]]))
+    if newest <= since + step:
+        return np.zeros(0, dtype=np.int64)
+    expected = np.arange(since + step, newest, step, dtype=np.int64)
+    return expected[~np.isin(expected, stored)]
+
+
+def upsert_history(store, symbol, records, before=None):
+    """
+    Upserts REST candles older than `before` (ns), all of them when None.
+    Returns how many the store accepted.
+    """
+    count = 0
+    for record in records:
+        if before is None or to_nanos(record["interval_begin"]) < before:
+            count += store.upsert(record) != STALE
+    return count
+
+
+def backfill_gaps(store, last_seen, client, stop_event=None):
+    """
+    Fills the minutes missed while disconnected from the REST OHLC endpoint.
+
+    Gaps are only looked for once the live stream has delivered a newer candle,
+    and only the minutes missing before it are upserted, so a REST response
+    never overwrites a candle the WebSocket delivered, the open one included.
+
+    Args:
+    - store (CandleStore): Store to fill.
+    - last_seen (dict): {symbol: interval_begin (ns)} of the newest candle stored before the disconnect.
+    - client (KrakenRestClient): Client whose rate limit is shared by every caller.
+    - stop_event (threading.Event): Stop early when set.
+
+    Returns:
+    - int: Number of candles upserted.
+    """
+    gaps = {symbol: missing_minutes(store, symbol, since) for symbol, since in last_seen.items() if since is not None}
+    requests_ = [(symbol, last_seen[symbol]) for symbol, missing in gaps.items() if len(missing)]
+    filled = 0
+    for symbol, records, error in client.ohlc_many(requests_, store.interval, stop_event):
+        if error is not None:
+            print(f"Error backfilling {symbol}: {error}")
+            continue
+        # Only the missing minutes, the candles the stream delivered are left alone
+        missing = set(gaps[symbol].tolist())
+        filled += upsert_history(store, symbol, [record for record in records
+                                                 if to_nanos(record["interval_begin"]) in missing])
+    return filled
+
+
+def prime_history(store, client, symbols, minutes=60, stop_event=None):
+    """
+    Loads the last `minutes` candles of every pair at startup, oldest first per pair.
+    Pairs whose store (e.g. restored from the journal) is already current are skipped,
+    the others are fetched from their newest stored candle on.
+
+    The WebSocket is already streaming while the responses arrive, so only
+    candles older than the first one it delivered (and than the current
+    interval, the open candle REST ends with) are upserted: priming never
+    overwrites a streamed candle.
+
+    Returns:
+    - int: Number of candles upserted.
+    """
+    step = store.interval * MINUTE_NS
+    now = time.time_ns()
+    start = now - now % step - minutes * MINUTE_NS
+    requests_ = []
+    restored = {}  # Newest candle of every requested pair before the stream started
+    for symbol in symbols:
+        last = store.last_interval_begin(symbol)
+        if last is None or last < now - now % step - step:
+            requests_.append((symbol, start if last is None else max(last, start)))
+            restored[symbol] = last
+
+    started = time.monotonic()
+    primed = 0
+    failed = 0
+    for symbol, records, error in client.ohlc_many(requests_, store.interval, stop_event):
+        if error is not None:
+            failed += 1
+            print(f"Error priming {symbol}: {error}")
+            continue
+        now = time.time_ns()
+        before = now - now % step
+        streamed = store.columns([symbol], since=restored[symbol])
+        if streamed is not None:
+            before = min(before, int(streamed["interval_begin"].min()))
+        primed += upsert_history(store, symbol, records, before=before)
+    print(f"Primed {primed} candles for {len(requests_) - failed} pairs in {time.monotonic() - started:.1f}s")
+    return primed
@@ -0,0 +1,192 @@
+"""
+Benchmark of the threaded WebSocketHandler against the asyncio AsyncWebSocketHandler.
+
+A local WebSocket stand-in (run in its own process) answers the v2 subscribe
+request and then streams 'ohlc' update frames for the subscribed pairs. Every
+frame carries the monotonic time it was sent, so the sink can measure how long
+it took until the frame was stored.
+
+Only the 'ohlc' channel is compared, the one AsyncWebSocketHandler supports,
+and the stand-in keeps its connections up, so the threaded handler's
+reconnect supervisor is idle during the run.
+
+Usage:
+    python benchmark_engines.py --connections 2 --messages 20000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+import time
+import numpy as np
+
+from async_fetch_pairs import AsyncWebSocketHandler
+from fetch_pairs import WebSocketHandler
+
+
+def csv_symbols(path="./crypto_data"):
+    """
+    Returns the pairs that have a file in crypto_data/, e.g. 'ADA_USD_data.csv' -> 'ADA/USD'.
+    """
+    return sorted(name[:-len("_data.csv")].replace("_", "/") for name in os.listdir(path) if name.endswith("_data.csv"))
+
+
+def ohlc_frame(symbols, minute, step):
+    """
+    Builds a Kraken v2 'ohlc' update for the given symbols.
+    """
+    interval_begin = f"2025-02-03T{minute // 60 % 24:02d}:{minute % 60:02d}:00.000000000Z"
+    timestamp = f"2025-02-03T{(minute + 1) // 60 % 24:02d}:{(minute + 1) % 60:02d}:00.000000Z"
+    price = 100.0 + step % 50
+    return {
+        "channel": "ohlc",
+        "type": "update",
+        "data": [
+            {"symbol": symbol, "open": 100.0, "high": price + 1, "low": 99.0, "close": price,
+             "trades": step, "volume": 1.5 * step, "vwap": 100.5,
+             "interval_begin": interval_begin, "interval": 1, "timestamp": timestamp}
+            for symbol in symbols
+        ],
+    }
+
+
+async def stand_in_connection(ws, messages, records_per_message, rate, updates_per_candle):
+    from websockets.exceptions import ConnectionClosed
+
+    request = json.loads(await ws.recv())
+    symbols = request["params"]["symbol"]
+    await ws.send(json.dumps({"method": "subscribe", "success": True, "result": {"channel": "ohlc"}}))
+
+    delay = 1 / rate if rate else 0
+    try:
+        for step in range(messages):
+            start = (step * records_per_message) % len(symbols)
+            frame = ohlc_frame(symbols[start:start + records_per_message], step // updates_per_candle, step)
+            frame["sent_ns"] = time.monotonic_ns()
+            await ws.send(json.dumps(frame))
+            await asyncio.sleep(delay)
+        await ws.wait_closed()
+    except ConnectionClosed:
+        pass
+
+
+def run_stand_in(port, ready, messages, records_per_message, rate, updates_per_candle):
+    from websockets.asyncio.server import serve
+
+    async def handler(ws):
+        await stand_in_connection(ws, messages, records_per_message, rate, updates_per_candle)
+
+    async def serve_forever():
+        async with serve(handler, "127.0.0.1", port, max_size=None):
+            ready.set()
+            await asyncio.Future()
+
+    asyncio.run(serve_forever())
+
+
+class LatencySink:
+    """
+    Sink that stores each frame and records its send-to-stored latency.
+    """
+
+    def __init__(self, store, expected):
+        self.store = store
+        self.expected = expected
+        self.latencies = np.zeros(expected, dtype=np.int64)
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def __call__(self, data):
+        self.store.ingest(data)
+        now = time.monotonic_ns()
+        with self.lock:
+            if self.count < self.expected:
+                self.latencies[self.count] = now - data["sent_ns"]
+            self.count += 1
+            if self.first is None:
+                self.first = now
+            self.last = now
+            if self.count >= self.expected:
+                self.done.set()
+
+    def summary(self, name):
+        received = min(self.count, self.expected)
+        latencies = self.latencies[:received] / 1e6
+        elapsed = (self.last - self.first) / 1e9 if received > 1 else float("nan")
+        return {
+            "engine": name,
+            "messages": received,
+            "msgs_per_sec": received / elapsed if elapsed else float("nan"),
+            "p50_ms": float(np.percentile(latencies, 50)) if received else float("nan"),
+            "p99_ms": float(np.percentile(latencies, 99)) if received else float("nan"),
+        }
+
+
+def bench_threaded(url, pairs, chunk_size, expected, timeout):
+    handler = WebSocketHandler(websocket_url=url, chunk_size=chunk_size, pairs=pairs)
+    sink = LatencySink(handler.store, expected)
+    handler.sink = sink
+    handler.start_websockets()
+    sink.done.wait(timeout)
+    handler.stop_websockets()
+    return sink.summary("threaded")
+
+
+def bench_async(url, pairs, chunk_size, expected, timeout):
+    async def run():
+        handler = AsyncWebSocketHandler(websocket_url=url, chunk_size=chunk_size, pairs=pairs)
+        sink = LatencySink(handler.store, expected)
+        handler.sink = sink
+        await handler.start_websockets()
+        deadline = time.monotonic() + timeout
+        while not sink.done.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await handler.stop()
+        return sink.summary("asyncio")
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=2, help="number of shard connections")
+    parser.add_argument("--messages", type=int, default=20000, help="frames sent per connection")
+    parser.add_argument("--records", type=int, default=10, help="candle records per frame")
+    parser.add_argument("--rate", type=float, default=0, help="frames/sec per connection (0 = as fast as possible)")
+    parser.add_argument("--updates-per-candle", type=int, default=20, help="frames before interval_begin advances")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    pairs = csv_symbols()
+    chunk_size = -(-len(pairs) // args.connections)
+    expected = args.messages * args.connections
+    url = f"ws://127.0.0.1:{args.port}"
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=run_stand_in,
+        args=(args.port, ready, args.messages, args.records, args.rate, args.updates_per_candle),
+        daemon=True,
+    )
+    server.start()
+    ready.wait(10)
+
+    try:
+        results = [
+            bench_threaded(url, pairs, chunk_size, expected, args.timeout),
+            bench_async(url, pairs, chunk_size, expected, args.timeout),
+        ]
+    finally:
+        server.terminate()
+
+    print(f"\n{args.connections} connections x {args.messages} frames, {args.records} records per frame")
+    print(f"{'engine':<10}{'messages':>10}{'msgs/sec':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        print(f"{result['engine']:<10}{result['messages']:>10}{result['msgs_per_sec']:>12.0f}"
+              f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
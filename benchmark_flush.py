@@ -0,0 +1,69 @@
+"""
+Benchmark of one CsvAppendWriter flush against the size of the file on disk:
+the durable append (new finalized lines + fsync, open candle in an atomically
+replaced sidecar) against the previous atomic mode, which copied the whole
+unchanged prefix into a temp file on every flush.
+
+Usage:
+    python benchmark_flush.py --history 1000 10000 100000 --flushes 50
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from candle_store import MINUTE_NS, CandleStore
+from persistence import CsvAppendWriter, replace_file
+
+
+class PrefixCopyWriter(CsvAppendWriter):
+    """
+    The previous durable mode: every append rewrites the file through replace_file().
+    """
+
+    def _append(self, symbol, file_path, frame):
+        finalized = self._lines(frame.iloc[:-1])
+        replace_file(file_path, finalized, prefix_length=os.path.getsize(file_path))
+        self.bytes_written += len(finalized) + self._write_open(file_path, frame)
+
+
+def candle(minute):
+    close = 100.0 + minute % 7
+    return {"open": close, "high": close, "low": close, "close": close, "trades": 3, "volume": 1.5,
+            "vwap": close, "interval_begin": minute * MINUTE_NS, "timestamp": minute * MINUTE_NS + 1000}
+
+
+def flush_time(writer_class, history, flushes):
+    """
+    Mean seconds per flush of one symbol whose file already holds `history` candles.
+    """
+    with tempfile.TemporaryDirectory() as save_path:
+        store = CandleStore(capacity=history + 1)
+        for minute in range(history):
+            store.upsert_row("BENCH/USD", candle(minute))
+        writer = writer_class(save_path, durable=True)
+        writer.write(store)
+        # The store now only needs to hold what is not on disk yet
+        store.set_capacity("BENCH/USD", 60)
+        started = time.perf_counter()
+        for minute in range(history, history + flushes):
+            store.upsert_row("BENCH/USD", candle(minute))
+            writer.write(store)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(save_path, "BENCH_USD_data.csv"))
+    return elapsed / flushes, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="candles already in the file")
+    parser.add_argument("--flushes", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'candles':>10}{'file MB':>10}{'prefix copy ms':>16}{'append ms':>13}{'speedup':>9}")
+    for history in args.history:
+        copy_time, size = flush_time(PrefixCopyWriter, history, args.flushes)
+        append_time, _ = flush_time(CsvAppendWriter, history, args.flushes)
+        print(f"{history:>10}{size / 1e6:>10.2f}{copy_time * 1e3:>16.3f}{append_time * 1e3:>13.3f}"
+              f"{copy_time / append_time:>8.1f}x")
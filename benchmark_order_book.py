@@ -0,0 +1,97 @@
+"""
+Benchmark of the L2 order book engine.
+
+First the engine alone: synthetic snapshots and deltas (the simulator's
+BookReplay) are applied to a BookManager, with and without checksum
+validation, and updates/sec per book are reported.
+
+Then end to end on the local simulator, run in its own process: a
+WebSocketHandler subscribes the 'book' channel of every simulated pair and
+the applied updates/sec, per book and in total, and checksum mismatches are
+reported.
+
+Usage:
+    python benchmark_order_book.py --books 20 --updates 20000 --book-rate 5000 --seconds 20
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+import requests
+
+from fetch_pairs import WebSocketHandler
+from kraken_simulator import BookReplay, KrakenSimulator
+from order_book import BookManager
+
+
+def bench_engine(books, updates, depth, checked):
+    replays = [BookReplay(f"BOOK{index}/USD", 10 ** (index % 6 - 2) * 1.2345, depth, seed=index)
+               for index in range(books)]
+    precisions = {replay.symbol: (replay.price_decimals, replay.qty_decimals) for replay in replays} if checked else {}
+    manager = BookManager(depth, precisions)
+    for replay in replays:
+        manager.ingest({"channel": "book", "type": "snapshot", "data": [replay.snapshot()]})
+    messages = [{"channel": "book", "type": "update", "data": [replay.next_update()]}
+                for _ in range(updates // books) for replay in replays]
+    started = time.perf_counter()
+    for message in messages:
+        manager.ingest(message)
+    elapsed = time.perf_counter() - started
+    assert manager.mismatches == 0
+    return len(messages) / elapsed
+
+
+def run_simulator(port, symbols, book_rate):
+    simulator = KrakenSimulator(port=port, max_symbols=symbols, rate=1.0, book_rate=book_rate)
+    asyncio.run(simulator.serve_forever())
+
+
+def bench_simulator(port, symbols, book_rate, depth, seconds):
+    server = multiprocessing.Process(target=run_simulator, args=(port, symbols, book_rate), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                pairs = [pair["wsname"] for pair in requests.get(f"{url}/0/public/AssetPairs").json()["result"].values()]
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        handler = WebSocketHandler(websocket_url=f"ws://127.0.0.1:{port}", rest_url=url, pairs=pairs,
+                                   book_depth=depth)
+        handler.start_websockets()
+        time.sleep(2)  # Subscriptions and snapshots
+        before = handler.books.metrics()
+        time.sleep(seconds)
+        after = handler.books.metrics()
+        handler.stop_websockets()
+    finally:
+        server.terminate()
+    updates = after["updates"] - before["updates"]
+    return {
+        "books": after["books"],
+        "updates_per_sec": updates / seconds,
+        "per_book": updates / seconds / max(after["books"], 1),
+        "mismatches": after["mismatches"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20, help="books in the engine benchmark and pairs simulated")
+    parser.add_argument("--updates", type=int, default=20000, help="updates applied in the engine benchmark")
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--book-rate", type=float, default=5000, help="simulated book messages/sec")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"Engine: {args.books} books, depth {args.depth}")
+    for checked in (False, True):
+        rate = bench_engine(args.books, args.updates, args.depth, checked)
+        print(f"{'checksum' if checked else 'no checksum':>12}{rate:>12.0f} updates/sec")
+
+    result = bench_simulator(args.port, args.books, args.book_rate, args.depth, args.seconds)
+    print(f"\nSimulator: {result['books']} books at {args.book_rate:.0f} messages/sec offered")
+    print(f"{result['updates_per_sec']:.0f} updates/sec applied, {result['per_book']:.0f} per book, "
+          f"{result['mismatches']} checksum mismatches")
@@ -0,0 +1,69 @@
+"""
+Benchmark of ingest throughput with frames parsed on the ingest thread against
+frames parsed by a ParsePool of worker processes.
+
+Frames shaped like the simulator's 'ohlc' updates are put on an IngestPipeline
+as fast as possible and timed until the store has applied all of them. The
+final store contents are checked to be the same for every run.
+
+Usage:
+    python benchmark_parse_pool.py --frames 50000 --records 10 --processes 1 2 4 8
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmark_engines import csv_symbols, ohlc_frame
+from candle_store import CandleStore
+from ingest_queue import IngestPipeline
+from parse_pool import ParsePool
+
+
+def make_frames(symbols, count, records, updates_per_candle):
+    frames = []
+    for step in range(count):
+        start = (step * records) % len(symbols)
+        frames.append(json.dumps(ohlc_frame(symbols[start:start + records], step // updates_per_candle, step)))
+    return frames
+
+
+def run(frames, processes):
+    store = CandleStore()
+
+    def handle(frame, received=None):
+        data = json.loads(frame)
+        if data.get("channel") == "ohlc":
+            store.ingest(data)
+
+    pool = ParsePool(store.upsert_columns, processes) if processes else None
+    pipeline = IngestPipeline(handle, store.ingest, maxsize=len(frames), policy="block", pool=pool)
+    if pool is not None:
+        # Worker start-up is not part of the measurement
+        pool.start()
+        pool.executor.submit(int).result()
+    started = time.perf_counter()
+    pipeline.start()
+    for frame in frames:
+        pipeline.put(frame)
+    pipeline.stop(timeout=3600)
+    return time.perf_counter() - started, store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--records", type=int, default=10, help="candle records per frame")
+    parser.add_argument("--updates-per-candle", type=int, default=20, help="frames before interval_begin advances")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    frames = make_frames(csv_symbols(), args.frames, args.records, args.updates_per_candle)
+    print(f"{args.frames} frames, {args.records} records per frame, {os.cpu_count()} cores")
+    print(f"{'processes':>10}{'seconds':>10}{'frames/sec':>12}{'speedup':>9}")
+    baseline, expected = run(frames, 0)
+    print(f"{'inline':>10}{baseline:>10.2f}{args.frames / baseline:>12.0f}{1.0:>8.1f}x")
+    for processes in args.processes:
+        elapsed, store = run(frames, processes)
+        assert store.to_dataframe().equals(expected.to_dataframe())
+        print(f"{processes:>10}{elapsed:>10.2f}{args.frames / elapsed:>12.0f}{baseline / elapsed:>8.1f}x")
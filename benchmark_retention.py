@@ -0,0 +1,95 @@
+"""
+Benchmark of per-symbol retention: the old sort + groupby().head() trim against
+the argpartition based limit_symbol_instances, and against CandleStore, which
+enforces the limit at insert time.
+
+Usage:
+    python benchmark_retention.py --symbols 830 --rows 60 600 10000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from candle_store import CandleStore
+from data_operations import limit_symbol_instances
+
+MINUTE_NS = 60 * 1_000_000_000
+
+
+def sort_groupby_limit(df, max_instances=60):
+    """
+    The previous implementation of limit_symbol_instances.
+    """
+    df = df.sort_values(by=["symbol", "timestamp"], ascending=[True, False])
+    return df.groupby("symbol").head(max_instances).reset_index(drop=True)
+
+
+def make_frame(symbols, rows, string_timestamps, seed=0):
+    """
+    Long-format frame with `rows` candles per symbol in random order.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array([f"SYM{index}/USD" for index in range(symbols)], dtype=object)
+    start = np.datetime64("2025-02-03T00:00", "ns").astype(np.int64)
+    minutes = np.tile(np.arange(rows, dtype=np.int64), symbols)
+    df = pd.DataFrame({
+        "symbol": np.repeat(names, rows),
+        "close": rng.random(symbols * rows),
+        "timestamp": start + minutes * MINUTE_NS,
+    })
+    if string_timestamps:
+        df["timestamp"] = np.char.add(np.datetime_as_string(df["timestamp"].to_numpy().astype("datetime64[ns]"),
+                                                            unit="us"), "Z")
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def store_retention(symbols, rows, max_instances):
+    """
+    Time per upsert when the store keeps `max_instances` candles per symbol.
+    """
+    store = CandleStore(capacity=max_instances)
+    names = [f"SYM{index}/USD" for index in range(symbols)]
+    row = {"open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "trades": 1, "volume": 1.0, "vwap": 1.0,
+           "timestamp": 0}
+    # Rows are already normalized, so this measures the insert path itself
+    count = min(rows, 200)
+    started = time.perf_counter()
+    with store.lock:
+        for minute in range(count):
+            for name in names:
+                store._apply(name, dict(row, interval_begin=minute * MINUTE_NS))
+    return (time.perf_counter() - started) / (count * symbols)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=830)
+    parser.add_argument("--rows", type=int, nargs="+", default=[60, 600, 10000], help="rows per symbol")
+    parser.add_argument("--max-instances", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--string-timestamps", action="store_true",
+                        help="use Kraken's ISO strings instead of int64 ns")
+    args = parser.parse_args()
+
+    print(f"{args.symbols} symbols, keeping {args.max_instances} rows each "
+          f"({'string' if args.string_timestamps else 'int64'} timestamps)")
+    print(f"{'rows/symbol':>12}{'total rows':>12}{'sort+groupby s':>16}{'top-k s':>10}{'speedup':>9}{'store us/upsert':>17}")
+    for rows in args.rows:
+        df = make_frame(args.symbols, rows, args.string_timestamps)
+        old_time, old = best_of(lambda: sort_groupby_limit(df, args.max_instances), args.repeat)
+        new_time, new = best_of(lambda: limit_symbol_instances(df, args.max_instances), args.repeat)
+        # Same rows kept, in the same order
+        assert old[["symbol", "timestamp"]].equals(new[["symbol", "timestamp"]])
+        upsert = store_retention(args.symbols, rows, args.max_instances)
+        print(f"{rows:>12}{len(df):>12}{old_time:>16.4f}{new_time:>10.4f}{old_time / new_time:>8.1f}x"
+              f"{upsert * 1e6:>17.2f}")
@@ -0,0 +1,258 @@
+import os
+import numpy as np
+
+from candle_store import to_nanos
+from data_operations import symbol_file_path
+from persistence import archive_file, read_candle_csv
+
+MAGIC = b"KRKCNDL1"
+VERSION = 1
+
+# 64 byte header followed by 64 byte records
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("interval", "<i4"),
+    ("reserved", "<u4"),
+    ("symbol", "S40"),
+])
+RECORD_DTYPE = np.dtype([
+    ("interval_begin", "<i8"),  # ns since the epoch
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("vwap", "<f8"),
+    ("volume", "<f8"),
+    ("trades", "<i4"),
+    ("flags", "<i4"),
+])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+RECORD_SIZE = RECORD_DTYPE.itemsize
+
+FINALIZED = 1  # flags bit set once a later candle exists
+
+
+def candle_file_path(symbol, save_path="./candle_data"):
+    return symbol_file_path(symbol, save_path, extension="candles")
+
+
+def write_header(f, symbol, interval=1):
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["record_size"] = RECORD_SIZE
+    header["interval"] = interval
+    header["symbol"] = symbol.encode()
+    f.write(header.tobytes())
+
+
+def read_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} is not a candle file")
+    if header["record_size"][0] != RECORD_SIZE:
+        raise ValueError(f"{path} has {header['record_size'][0]} byte records, expected {RECORD_SIZE}")
+    return header[0]
+
+
+def to_records(columns):
+    """
+    Packs candle columns (as returned by CandleStore.columns()) into RECORD_DTYPE.
+    Every candle is marked finalized except the last one.
+    """
+    records = np.zeros(len(columns["interval_begin"]), dtype=RECORD_DTYPE)
+    for name in RECORD_DTYPE.names:
+        if name != "flags":
+            records[name] = columns[name]
+    records["flags"] = FINALIZED
+    if len(records):
+        records["flags"][-1] = 0
+    return records
+
+
+class CandleFile:
+    """
+    Read-only view of a candle file through numpy.memmap.
+
+    Slices are views into the mapped file, so reading the last N candles or a
+    time range touches only those records (plus a binary search for ranges).
+    Records appended after opening are picked up by reopen().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = read_header(path)
+        self.symbol = header["symbol"].decode()
+        self.interval = int(header["interval"])
+        self.records = None
+        self.reopen()
+
+    def reopen(self):
+        # A record that is still being written is ignored
+        count = (os.path.getsize(self.path) - HEADER_SIZE) // RECORD_SIZE
+        if count == 0:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.memmap(self.path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        return self
+
+    def __len__(self):
+        return len(self.records)
+
+    def tail(self, n):
+        """
+        Returns the last `n` candles without copying.
+        """
+        return self.records[max(len(self.records) - n, 0):]
+
+    def time_range(self, start=None, end=None):
+        """
+        Returns the candles with start <= interval_begin < end (ns or ISO strings) without copying.
+        """
+        begins = self.records["interval_begin"]
+        lo = 0 if start is None else np.searchsorted(begins, _nanos(start), side="left")
+        hi = len(begins) if end is None else np.searchsorted(begins, _nanos(end), side="left")
+        return self.records[lo:hi]
+
+    def finalized(self):
+        """
+        Returns the candles that can no longer change (everything but a trailing open candle).
+        """
+        if len(self.records) and not self.records["flags"][-1] & FINALIZED:
+            return self.records[:-1]
+        return self.records
+
+
+def _nanos(value):
+    if isinstance(value, (int, np.integer)):
+        return value
+    return to_nanos(str(value))
+
+
+def open_candles(symbol, save_path="./candle_data"):
+    """
+    Opens the candle file of a symbol.
+    """
+    return CandleFile(candle_file_path(symbol, save_path))
+
+
+class CandleFileWriter:
+    """
+    Storage backend writing one fixed-record candle file per symbol.
+
+    New candles are appended as records and the open candle (always the last
+    record) is overwritten in place, so every write touches only the records
+    that changed. Same write(store, symbols) interface as CsvAppendWriter.
+    """
+
+    def __init__(self, save_path="./candle_data"):
+        self.save_path = save_path
+        self.versions = {}
+
+        # Counters for the last call to write()
+        self.symbols_written = 0
+        self.bytes_written = 0
+
+    def write_symbol(self, store, symbol, rewrite_from=None):
+        """
+        Append the new candles of one symbol and overwrite its open candle.
+        With `rewrite_from` (ns) every record from that interval_begin on is written again.
+        """
+        path = candle_file_path(symbol, self.save_path)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                write_header(f, symbol, store.interval)
+
+        with open(path, "r+b") as f:
+            count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+            position = count
+            since = None
+            if count:
+                # Only the last two records are needed to find where to continue
+                first = max(count - 2, 0)
+                f.seek(HEADER_SIZE + first * RECORD_SIZE)
+                last = np.frombuffer(f.read((count - first) * RECORD_SIZE), dtype=RECORD_DTYPE)
+                if last["flags"][-1] & FINALIZED:
+                    since = int(last["interval_begin"][-1])
+                else:
+                    # Overwrite the open candle
+                    position = count - 1
+                    since = int(last["interval_begin"][-2]) if len(last) == 2 else None
+                if rewrite_from is not None:
+                    begins = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE,
+                                       shape=(count,))["interval_begin"]
+                    start = int(np.searchsorted(begins, rewrite_from))
+                    if start < position:
+                        position = start
+                        since = int(begins[start - 1]) if start else None
+                    del begins
+
+            columns = store.columns([symbol], since=since)
+            if columns is None:
+                return
+            data = to_records(columns).tobytes()
+            f.seek(HEADER_SIZE + position * RECORD_SIZE)
+            f.write(data)
+            f.truncate()
+        self.symbols_written += 1
+        self.bytes_written += len(data)
+
+    def write(self, store, symbols=None):
+        """
+        Write every symbol whose candles changed since the last write.
+
+        Returns:
+        - int: Number of files touched.
+        """
+        os.makedirs(self.save_path, exist_ok=True)
+        self.symbols_written = 0
+        self.bytes_written = 0
+
+        versions = store.versions()
+        for symbol in (versions if symbols is None else symbols):
+            version = versions.get(symbol)
+            if version is None or self.versions.get(symbol) == version:
+                continue
+            # Candles backfilled below the records already written
+            self.write_symbol(store, symbol, store.inserted_since(symbol, self.versions.get(symbol)))
+            self.versions[symbol] = version
+        return self.symbols_written
+
+    def retire(self, symbols, archive=True):
+        """
+        Forgets symbols that are no longer collected and, with archive=True,
+        moves their files to <save_path>/delisted/.
+        """
+        for symbol in symbols:
+            self.versions.pop(symbol, None)
+            if archive:
+                archive_file(candle_file_path(symbol, self.save_path))
+
+
+def convert_csv_dir(csv_path="./crypto_data", save_path="./candle_data"):
+    """
+    Converts every crypto_data/<SYMBOL>_data.csv file into a candle file.
+    The newest candle of each file is treated as still open.
+    """
+    os.makedirs(save_path, exist_ok=True)
+    converted = 0
+    for name in sorted(os.listdir(csv_path)):
+        if not name.endswith("_data.csv"):
+            continue
+        df = read_candle_csv(os.path.join(csv_path, name))
+        if df.empty:
+            continue
+        symbol = df["symbol"].iloc[0]
+        columns = {column: df[column].to_numpy() for column in RECORD_DTYPE.names if column != "flags"}
+        columns["interval_begin"] = np.array([to_nanos(value) for value in df["interval_begin"]], dtype=np.int64)
+        with open(candle_file_path(symbol, save_path), "wb") as f:
+            write_header(f, symbol, int(df["interval"].iloc[0]))
+            f.write(to_records(columns).tobytes())
+        converted += 1
+    print(f"Converted {converted} files to {save_path}")
+
+
+if __name__ == "__main__":
+    convert_csv_dir()
@@ -0,0 +1,584 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# Column order used by the CSV files in crypto_data/
+CANDLE_COLUMNS = ["symbol", "open", "high", "low", "close", "trades", "volume",
+                  "vwap", "interval_begin", "interval", "timestamp"]
+
+# Typed columns kept for every symbol (interval_begin/timestamp as int64 nanoseconds)
+COLUMN_DTYPES = {
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "trades": np.int64,
+    "volume": np.float64,
+    "vwap": np.float64,
+    "interval_begin": np.int64,
+    "timestamp": np.int64,
+}
+
+
+def to_nanos(value):
+    """
+    Converts a Kraken timestamp string (e.g. '2025-02-03T02:07:00.000000000Z')
+    to int64 nanoseconds since the epoch.
+    """
+    return int(np.datetime64(value.rstrip("Z"), "ns").astype(np.int64))
+
+
+def format_nanos(values, unit="ns"):
+    """
+    Converts an array of int64 nanoseconds back to Kraken's ISO strings.
+    Kraken sends interval_begin with 'ns' precision and timestamp with 'us'.
+    """
+    values = np.asarray(values, dtype=np.int64).astype("datetime64[ns]")
+    return np.char.add(np.datetime_as_string(values, unit=unit), "Z")
+
+
+MINUTE_NS = 60 * 1_000_000_000
+
+# Fewest rows of one symbol in upsert_columns() that are written as a block
+BLOCK_ROWS = 4
+
+# Results of SymbolBuffer.upsert
+UPDATED = "updated"    # Update to the current (open) candle, overwritten in place
+APPENDED = "appended"  # New interval_begin, the previous candle is now finalized
+REVISED = "revised"    # Late update to an older candle still held in the buffer
+INSERTED = "inserted"  # Older candle that was missing from the buffer, e.g. backfilled after a gap
+STALE = "stale"        # Update to a candle that has already left the buffer
+
+
+class SymbolBuffer:
+    """
+    Fixed-capacity ring buffer holding the candles of a single symbol.
+    Each field lives in its own NumPy column so appends are O(1).
+    """
+
+    def __init__(self, capacity=60):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        # A candle is finalized once a candle with a later interval_begin arrives
+        self.finalized = np.zeros(capacity, dtype=bool)
+        self.head = 0  # Slot the next candle will be written to
+        self.size = 0
+        self.version = 0  # Bumped on every accepted upsert
+        self.inserts = []  # (version, interval_begin) of every candle inserted behind the newest one
+
+    def __len__(self):
+        return self.size
+
+    def _write(self, slot, record):
+        for name, column in self.columns.items():
+            column[slot] = record[name]
+
+    def append(self, record):
+        """
+        Writes a candle into the next slot, overwriting the oldest one once full.
+        """
+        slot = self.head
+        self._write(slot, record)
+        self.finalized[slot] = False
+        self.head = (slot + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def upsert(self, record):
+        """
+        Inserts or updates the candle keyed by record['interval_begin'].
+
+        Returns:
+        - str: One of UPDATED, APPENDED, REVISED, INSERTED or STALE.
+        """
+        if self.size == 0:
+            self.append(record)
+            self.version += 1
+            return APPENDED
+
+        last = (self.head - 1) % self.capacity
+        interval_begin = record["interval_begin"]
+        last_begin = self.columns["interval_begin"][last]
+
+        if interval_begin == last_begin:
+            self._write(last, record)
+            self.version += 1
+            return UPDATED
+        if interval_begin > last_begin:
+            self.finalized[last] = True
+            self.append(record)
+            self.version += 1
+            return APPENDED
+
+        # Older candle: rewrite it if it is still in the buffer, fill it in if it is missing
+        order = self.order()
+        begins = self.columns["interval_begin"][order]
+        position = np.searchsorted(begins, interval_begin)
+        if position < len(order) and begins[position] == interval_begin:
+            self._write(order[position], record)
+            self.version += 1
+            return REVISED
+        if position == 0 and self.size == self.capacity:
+            return STALE
+        self._insert(order, position, record)
+        self.version += 1
+        self.inserts.append((self.version, interval_begin))
+        return INSERTED
+
+    def extend(self, block, unique=False):
+        """
+        Upserts several candles at once, given as column arrays in arrival order.
+        Only the newest update of every candle is written. With unique=True the
+        caller guarantees interval_begin is strictly increasing, which skips the checks.
+
+        Returns:
+        - np.ndarray: True for every row that updated the candle before it (UPDATED),
+          False for rows that started a new one (APPENDED). None, with nothing
+          written, when a row is older than the newest candle; use upsert() then.
+        """
+        begins = block["interval_begin"]
+        last_begin = self.last_interval_begin()
+        if last_begin is not None and begins[0] < last_begin:
+            return None
+        if unique:
+            updated = np.zeros(len(begins), dtype=bool)
+            updated[0] = begins[0] == last_begin
+            keep = np.arange(len(begins))
+        else:
+            if np.any(begins[1:] < begins[:-1]):
+                return None
+            previous = np.concatenate([[begins[0] - 1 if last_begin is None else last_begin], begins[:-1]])
+            updated = begins == previous
+            keep = np.flatnonzero(np.append(begins[1:] != begins[:-1], True))
+
+        if last_begin is not None and begins[keep[0]] == last_begin:
+            # The first candle continues the open one (not merely repeated within the block)
+            self._write(self.head - 1, {name: values[keep[0]] for name, values in block.items()})
+            keep = keep[1:]
+        if len(keep):
+            if self.size:
+                self.finalized[(self.head - 1) % self.capacity] = True
+            keep = keep[-self.capacity:]
+            slots = (self.head + np.arange(len(keep))) % self.capacity
+            for name, column in self.columns.items():
+                column[slots] = block[name][keep]
+            self.finalized[slots] = True
+            self.finalized[slots[-1]] = False
+            self.head = int(slots[-1] + 1) % self.capacity
+            self.size = min(self.size + len(keep), self.capacity)
+        self.version += len(begins)
+        return updated
+
+    def _insert(self, order, position, record):
+        """
+        Inserts a candle at `position` (oldest first), dropping the oldest one when full.
+        Only happens when gaps are filled, so the buffer is simply rebuilt in order.
+        """
+        drop = 1 if self.size == self.capacity else 0
+        for name, column in self.columns.items():
+            values = np.insert(column[order], position, record[name])[drop:]
+            column[:len(values)] = values
+        finalized = np.insert(self.finalized[order], position, True)[drop:]
+        self.finalized[:len(finalized)] = finalized
+        self.size = len(finalized)
+        self.head = self.size % self.capacity
+        # Inserts older than every retained candle no longer matter to anyone
+        oldest = self.columns["interval_begin"][0]
+        self.inserts = [(version, begin) for version, begin in self.inserts if begin >= oldest]
+
+    def window(self, start, end):
+        """
+        Returns copies of the columns of the candles with start <= interval_begin < end.
+        Walks back from the newest candle, as windows are nearly always at the end of the buffer.
+        """
+        begins = self.columns["interval_begin"]
+        slots = []
+        for offset in range(1, self.size + 1):
+            slot = (self.head - offset) % self.capacity
+            begin = begins[slot]
+            if begin < start:
+                break
+            if begin < end:
+                slots.append(slot)
+        slots = np.array(slots[::-1], dtype=np.intp)
+        return {name: column[slots] for name, column in self.columns.items()}
+
+    def finalize_last(self):
+        """
+        Marks the newest candle as finalized without a later one, e.g. once its interval has ended.
+        """
+        if self.size and not self.finalized[(self.head - 1) % self.capacity]:
+            self.finalized[(self.head - 1) % self.capacity] = True
+            self.version += 1
+            return True
+        return False
+
+    def inserted_since(self, version):
+        """
+        Returns the oldest interval_begin (ns) inserted after `version`, or None.
+        """
+        begins = [begin for inserted, begin in self.inserts if version is None or inserted > version]
+        return min(begins) if begins else None
+
+    def resize(self, capacity):
+        """
+        Changes the capacity, keeping the newest candles that still fit.
+        """
+        order = self.order()[-capacity:]
+        self.columns = {name: np.concatenate([column[order], np.zeros(capacity - len(order), dtype=column.dtype)])
+                        for name, column in self.columns.items()}
+        self.finalized = np.concatenate([self.finalized[order], np.zeros(capacity - len(order), dtype=bool)])
+        self.capacity = capacity
+        self.size = len(order)
+        self.head = self.size % capacity
+
+    def last_interval_begin(self):
+        """
+        Returns the interval_begin (ns) of the newest candle, or None when empty.
+        """
+        if self.size == 0:
+            return None
+        return int(self.columns["interval_begin"][(self.head - 1) % self.capacity])
+
+    def order(self):
+        """
+        Returns the slot indices ordered from oldest to newest.
+        """
+        start = (self.head - self.size) % self.capacity
+        return (np.arange(self.size) + start) % self.capacity
+
+    def snapshot(self, newest_first=False, finalized_only=False, since=None):
+        """
+        Returns a copy of every column ordered by interval_begin.
+        With `since` (ns) only candles with a later interval_begin are returned.
+        """
+        order = self.order()
+        if finalized_only:
+            order = order[self.finalized[order]]
+        if since is not None:
+            order = order[self.columns["interval_begin"][order] > since]
+        if newest_first:
+            order = order[::-1]
+        return {name: column[order] for name, column in self.columns.items()}
+
+
+class CandleStore:
+    """
+    Per-symbol columnar storage for OHLC candles received from the WebSocket.
+    Candles are keyed by (symbol, interval_begin), so the many updates Kraken
+    sends for an open candle share one slot. DataFrames are only built when asked for.
+    """
+
+    def __init__(self, capacity=60, interval=1, capacities=None):
+        self.capacity = capacity
+        self.interval = interval
+        self.buffers = {}
+
+        # Per-symbol retention overriding `capacity`, enforced at insert time
+        self.capacities = dict(capacities or {})
+
+        # Number of records handled by each upsert outcome
+        self.counts = {UPDATED: 0, APPENDED: 0, REVISED: 0, INSERTED: 0, STALE: 0}
+
+        # Symbols changed since the last drain_dirty(), with the time they were first changed
+        self.dirty = {}
+
+        # Called as listener(symbol, row, result) for every accepted upsert, under the lock
+        self.listeners = []
+
+        # Lock for thread-safe updates
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(buffer) for buffer in self.buffers.values())
+
+    def _buffer(self, symbol):
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            buffer = self.buffers[symbol] = SymbolBuffer(self.capacities.get(symbol, self.capacity))
+        return buffer
+
+    def set_capacity(self, symbol, capacity):
+        """
+        Sets how many candles are kept for one symbol, trimming it right away if needed.
+        """
+        with self.lock:
+            self.capacities[symbol] = capacity
+            buffer = self.buffers.get(symbol)
+            if buffer is not None and buffer.capacity != capacity:
+                buffer.resize(capacity)
+
+    def _normalize(self, record):
+        row = dict(record)
+        row["interval_begin"] = to_nanos(record["interval_begin"])
+        row["timestamp"] = to_nanos(record["timestamp"])
+        return row
+
+    def upsert(self, record):
+        """
+        Inserts or updates a single OHLC record (one entry of a Kraken 'ohlc' message).
+        Updates to the current candle overwrite it, a new interval_begin advances the buffer.
+        """
+        row = self._normalize(record)
+        with self.lock:
+            result = self._apply(record["symbol"], row)
+        return result
+
+    def _apply(self, symbol, row):
+        result = self._buffer(symbol).upsert(row)
+        self.counts[result] += 1
+        if result != STALE:
+            if symbol not in self.dirty:
+                self.dirty[symbol] = time.monotonic()
+            for listener in self.listeners:
+                listener(symbol, row, result)
+        return result
+
+    def upsert_row(self, symbol, row):
+        """
+        Same as upsert() for a row that is already normalized (interval_begin/timestamp as int64 ns).
+        """
+        with self.lock:
+            return self._apply(symbol, row)
+
+    def add_listener(self, listener):
+        """
+        Registers listener(symbol, row, result), called for every accepted upsert.
+        `row` holds the candle with interval_begin/timestamp as int64 ns and
+        `result` is UPDATED, APPENDED, REVISED or INSERTED.
+        """
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            self.listeners.remove(listener)
+
+    def upsert_columns(self, columns, groups=None):
+        """
+        Upserts rows that are already normalized, given as columns like the ones
+        returned by columns() (a 'symbol' array plus typed arrays), in order.
+
+        Rows are applied per symbol, so listeners see each symbol's rows in order
+        but not the interleaving between symbols. A symbol's rows that only
+        update or extend its newest candle are written as one block.
+
+        Args:
+        - groups (list): Optional (symbol, start, stop, unique) per symbol when the
+          rows are already grouped by symbol, e.g. by the parse pool. `unique`
+          means interval_begin is strictly increasing within the group.
+        """
+        names = list(COLUMN_DTYPES)
+        if groups is None:
+            indices = {}
+            for index, symbol in enumerate(columns["symbol"].tolist()):
+                indices.setdefault(symbol, []).append(index)
+            blocks = [(symbol, {name: columns[name][rows] for name in names}, False)
+                      for symbol, rows in indices.items()]
+        else:
+            blocks = [(symbol, {name: columns[name][start:stop] for name in names}, unique)
+                      for symbol, start, stop, unique in groups]
+
+        with self.lock:
+            for symbol, block, unique in blocks:
+                rows = len(block["interval_begin"])
+                updated = None
+                if rows >= BLOCK_ROWS or (unique and rows > 1):
+                    updated = self._buffer(symbol).extend(block, unique)
+                if updated is None:
+                    values = [block[name].tolist() for name in names]
+                    for row in zip(*values):
+                        self._apply(symbol, dict(zip(names, row)))
+                    continue
+
+                appended = int(np.count_nonzero(~updated))
+                self.counts[UPDATED] += rows - appended
+                self.counts[APPENDED] += appended
+                if symbol not in self.dirty:
+                    self.dirty[symbol] = time.monotonic()
+                if self.listeners:
+                    values = [block[name].tolist() for name in names]
+                    for row, was_update in zip(zip(*values), updated.tolist()):
+                        row = dict(zip(names, row))
+                        for listener in self.listeners:
+                            listener(symbol, row, UPDATED if was_update else APPENDED)
+
+    def ingest(self, data):
+        """
+        Upserts every record of a parsed Kraken 'ohlc' message (snapshot or update).
+        """
+        rows = [(record["symbol"], self._normalize(record)) for record in data["data"]]
+        with self.lock:
+            for symbol, row in rows:
+                self._apply(symbol, row)
+
+    def drain_dirty(self):
+        """
+        Returns {symbol: first changed (time.monotonic())} for every symbol changed
+        since the last call, and clears the dirty set.
+        """
+        with self.lock:
+            dirty, self.dirty = self.dirty, {}
+        return dirty
+
+    def mark_dirty(self, dirty):
+        """
+        Puts symbols back into the dirty set, e.g. after a failed flush.
+        """
+        with self.lock:
+            for symbol, since in dirty.items():
+                self.dirty[symbol] = min(since, self.dirty.get(symbol, since))
+
+    def oldest_dirty(self):
+        """
+        Returns when the longest-waiting dirty symbol was changed (time.monotonic()), or None.
+        """
+        with self.lock:
+            return min(self.dirty.values()) if self.dirty else None
+
+    def finalize_before(self, now):
+        """
+        Finalizes the newest candle of every symbol whose interval ended at or
+        before `now` (ns), even though no later candle has arrived yet.
+
+        Returns:
+        - int: Number of candles finalized.
+        """
+        step = self.interval * MINUTE_NS
+        finalized = 0
+        with self.lock:
+            for symbol, buffer in self.buffers.items():
+                last = buffer.last_interval_begin()
+                if last is not None and last + step <= now and buffer.finalize_last():
+                    finalized += 1
+                    if symbol not in self.dirty:
+                        self.dirty[symbol] = time.monotonic()
+        return finalized
+
+    def remove(self, symbols):
+        """
+        Drops every candle of the given symbols, e.g. pairs that were delisted.
+
+        Returns:
+        - int: Number of symbols removed.
+        """
+        with self.lock:
+            removed = 0
+            for symbol in symbols:
+                if self.buffers.pop(symbol, None) is not None:
+                    removed += 1
+                self.dirty.pop(symbol, None)
+                self.capacities.pop(symbol, None)
+        return removed
+
+    def symbols(self):
+        with self.lock:
+            return sorted(self.buffers)
+
+    def versions(self):
+        """
+        Returns {symbol: version}, a symbol's version changes whenever one of its candles does.
+        """
+        with self.lock:
+            return {symbol: buffer.version for symbol, buffer in self.buffers.items()}
+
+    def last_interval_begin(self, symbol):
+        """
+        Returns the interval_begin (ns) of the newest stored candle of a symbol, or None.
+        """
+        with self.lock:
+            buffer = self.buffers.get(symbol)
+            return buffer.last_interval_begin() if buffer is not None else None
+
+    def candle(self, symbol, interval_begin):
+        """
+        Returns the stored candle of a symbol starting at `interval_begin` (ns) as a dict, or None.
+        """
+        with self.lock:
+            buffer = self.buffers.get(symbol)
+            if buffer is None:
+                return None
+            window = buffer.window(interval_begin, interval_begin + 1)
+        if len(window["interval_begin"]) == 0:
+            return None
+        return {name: column[0].item() for name, column in window.items()}
+
+    def inserted_since(self, symbol, version):
+        """
+        Returns the oldest interval_begin (ns) of a symbol inserted behind its newest
+        candle after store version `version`, or None. Writers that only append use
+        this to find candles that were backfilled below what they already wrote.
+        """
+        with self.lock:
+            buffer = self.buffers.get(symbol)
+            return buffer.inserted_since(version) if buffer is not None else None
+
+    def _collect(self, symbols, newest_first=False, finalized_only=False, since=None):
+        names = []
+        parts = []
+        lengths = []
+        for symbol in symbols:
+            buffer = self.buffers.get(symbol)
+            if buffer is None or len(buffer) == 0:
+                continue
+            after = since.get(symbol) if isinstance(since, dict) else since
+            part = buffer.snapshot(newest_first, finalized_only, after)
+            if len(part["interval_begin"]) == 0:
+                continue
+            names.append(symbol)
+            parts.append(part)
+            lengths.append(len(part["interval_begin"]))
+        if not parts:
+            return None
+
+        columns = {"symbol": np.repeat(np.array(names, dtype=object), lengths)}
+        for name in COLUMN_DTYPES:
+            columns[name] = np.concatenate([part[name] for part in parts])
+        return columns
+
+    def _frame(self, symbols, newest_first, finalized_only=False, since=None):
+        columns = self._collect(symbols, newest_first, finalized_only, since)
+        if columns is None:
+            return pd.DataFrame(columns=CANDLE_COLUMNS)
+        columns["interval_begin"] = format_nanos(columns["interval_begin"], unit="ns")
+        columns["timestamp"] = format_nanos(columns["timestamp"], unit="us")
+        columns["interval"] = np.full(len(columns["symbol"]), self.interval)
+        return pd.DataFrame(columns, columns=CANDLE_COLUMNS)
+
+    def columns(self, symbols=None, finalized_only=False, since=None):
+        """
+        Returns the raw typed columns (interval_begin/timestamp as int64 ns) of the
+        given symbols as one dict of arrays, or None when there is nothing to return.
+        `since` is either one interval_begin (ns) or a {symbol: ns} dict.
+        """
+        with self.lock:
+            if symbols is None:
+                symbols = sorted(self.buffers)
+            return self._collect(symbols, False, finalized_only, since)
+
+    def symbol_frame(self, symbol, newest_first=False, finalized_only=False, since=None):
+        """
+        Builds a DataFrame (CSV column layout) for one symbol.
+        With `since` (ns) only candles with a later interval_begin are included.
+        """
+        with self.lock:
+            return self._frame([symbol], newest_first, finalized_only, since)
+
+    def to_dataframe(self, symbols=None, newest_first=False, finalized_only=False):
+        """
+        Builds a DataFrame (CSV column layout) for the given symbols, or all of them.
+
+        Args:
+        - symbols (list): Symbols to include, defaults to every stored symbol.
+        - newest_first (bool): Order each symbol's rows from newest to oldest.
+        - finalized_only (bool): Leave out each symbol's open candle.
+
+        Returns:
+        - pd.DataFrame: One row per stored candle.
+        """
+        with self.lock:
+            if symbols is None:
+                symbols = sorted(self.buffers)
+            return self._frame(symbols, newest_first, finalized_only)
@@ -0,0 +1,296 @@
+import heapq
+import threading
+import numpy as np
+
+from pair_registry import get_registry
+
+
+def conversion_tree(base_ids, quote_ids, liquidity, assets, root):
+    """
+    Widest-path tree of the currency graph from `root`: every asset is reached
+    through the path whose least liquid pair is the most liquid possible,
+    with fewer hops breaking ties.
+
+    Args:
+    - base_ids, quote_ids (np.ndarray): Assets of every pair.
+    - liquidity (np.ndarray): Liquidity of every pair, e.g. its recent trade count.
+    - assets (int): Number of assets.
+    - root (int): Asset id of the numeraire.
+
+    Returns:
+    - np.ndarray: Parent asset of every asset (-1 for the root and unreachable assets).
+    - np.ndarray: Pair linking every asset to its parent (-1 where there is none).
+    """
+    neighbours = [[] for _ in range(assets)]
+    for pair, (base, quote) in enumerate(zip(base_ids.tolist(), quote_ids.tolist())):
+        neighbours[base].append((quote, pair))
+        neighbours[quote].append((base, pair))
+    liquidity = liquidity.tolist()
+
+    parent = np.full(assets, -1, dtype=np.int64)
+    parent_pair = np.full(assets, -1, dtype=np.int64)
+    best = [-1.0] * assets
+    best[root] = float("inf")
+    done = [False] * assets
+    heap = [(-best[root], 0, root)]
+    while heap:
+        width, hops, asset = heapq.heappop(heap)
+        if done[asset]:
+            continue
+        done[asset] = True
+        for other, pair in neighbours[asset]:
+            if done[other]:
+                continue
+            candidate = min(-width, liquidity[pair])
+            if candidate > best[other]:
+                best[other] = candidate
+                parent[other] = asset
+                parent_pair[other] = pair
+                heapq.heappush(heap, (-candidate, hops + 1, other))
+    return parent, parent_pair
+
+
+class CrossRates:
+    """
+    Prices every asset in one numeraire (USD by default) from the latest closes in a CandleStore.
+
+    Each asset is priced along its most liquid conversion path from the
+    numeraire (see conversion_tree(), liquidity being the trades of every pair
+    over the candles in the store). The tree is cached with every asset's log
+    price and is laid out in preorder, so an asset's subtree is one contiguous
+    slice of `order`. A new close of a pair on the tree shifts the log prices of
+    the subtree below it by the change of its log rate, in one vectorized add;
+    closes of pairs off the tree change nothing. rebuild() recomputes the tree
+    from the current liquidity, from a background thread every `period` seconds
+    once started.
+
+    Args:
+    - store (CandleStore): Store whose closes are used.
+    - numeraire (str): Asset every price is expressed in.
+    - registry (PairRegistry): Pairs and assets, defaults to the shared registry.
+    - period (float): Seconds between tree rebuilds.
+    """
+
+    def __init__(self, store, numeraire="USD", registry=None, period=300.0):
+        self.store = store
+        self.registry = registry if registry is not None else get_registry()
+        self.numeraire = numeraire
+        self.period = period
+        self.lock = threading.Lock()
+
+        self.pairs = 0
+        self.closes = np.empty(0)
+        self.begins = np.empty(0, dtype=np.int64)  # interval_begin of every pair's close
+        self._resize()
+        self.log_prices = np.empty(0)
+        self.parent = np.empty(0, dtype=np.int64)
+        self.pair_child = np.full(self.pairs, -1, dtype=np.int64)  # Asset a tree pair links to its parent
+        self.built = False
+
+        self.updates = 0
+        self.shifted = 0  # Prices shifted by updates of tree pairs
+        self.rebuilds = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _resize(self):
+        size = len(self.registry)
+        if size > self.pairs:
+            self.closes = np.concatenate([self.closes, np.full(size - self.pairs, np.nan)])
+            self.begins = np.concatenate([self.begins, np.full(size - self.pairs, -1, dtype=np.int64)])
+            self.pairs = size
+
+    def _edge_log(self, assets):
+        """
+        Log rate from every given asset's parent to the asset.
+        """
+        pairs = self.parent_pair[assets]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rates = np.log(self.closes[pairs])
+        # Base priced from its quote: times the close, quote priced from its base: divided by it
+        return np.where(self.base_ids[pairs] == assets, rates, -rates)
+
+    def rebuild(self):
+        """
+        Recomputes the conversion tree from the store's recent trade counts and every price from the latest closes.
+        """
+        columns = self.store.columns()
+        with self.lock:
+            self._resize()
+            liquidity = np.zeros(self.pairs)
+            if columns is not None:
+                ids = self.registry.to_ids(columns["symbol"].astype(str))
+                known = ids >= 0
+                np.add.at(liquidity, ids[known], columns["trades"][known])
+                # Latest close of every pair, unless the listener has seen a newer one
+                order = np.lexsort((columns["interval_begin"][known], ids[known]))
+                ids, begins = ids[known][order], columns["interval_begin"][known][order]
+                last = np.append(ids[1:] != ids[:-1], True)
+                newer = begins[last] > self.begins[ids[last]]
+                self.closes[ids[last][newer]] = columns["close"][known][order][last][newer]
+                self.begins[ids[last][newer]] = begins[last][newer]
+
+            self.base_ids = self.registry.base_ids[:self.pairs]
+            quote_ids = self.registry.quote_ids[:self.pairs]
+            assets = len(self.registry.assets)
+            root = self.registry.asset_id(self.numeraire)
+            if root < 0:
+                raise ValueError(f"Unknown numeraire '{self.numeraire}'")
+            self.parent, self.parent_pair = conversion_tree(self.base_ids, quote_ids, liquidity, assets, root)
+            self.pair_child = np.full(self.pairs, -1, dtype=np.int64)
+            linked = np.flatnonzero(self.parent_pair >= 0)
+            self.pair_child[self.parent_pair[linked]] = linked
+
+            # Preorder layout: the subtree of asset a is order[first[a]:last[a]]
+            children = [[] for _ in range(assets)]
+            for asset in linked.tolist():
+                children[self.parent[asset]].append(asset)
+            self.order = np.empty(assets, dtype=np.int64)
+            self.first = np.full(assets, -1, dtype=np.int64)
+            self.last = np.full(assets, -1, dtype=np.int64)
+            self.depth = np.zeros(assets, dtype=np.int64)
+            position, stack = 0, [(root, False)]
+            while stack:
+                asset, finished = stack.pop()
+                if finished:
+                    self.last[asset] = position
+                    continue
+                self.order[position] = asset
+                self.first[asset] = position
+                position += 1
+                stack.append((asset, True))
+                for child in children[asset]:
+                    self.depth[child] = self.depth[asset] + 1
+                    stack.append((child, False))
+            self.reachable = position
+            self.order = self.order[:position]
+
+            # Log prices level by level, parents before children
+            self.log_prices = np.full(assets, np.nan)
+            self.log_prices[root] = 0.0
+            for level in range(1, int(self.depth.max()) + 1 if len(linked) else 1):
+                assets_at = linked[self.depth[linked] == level]
+                self.log_prices[assets_at] = self.log_prices[self.parent[assets_at]] + self._edge_log(assets_at)
+            self.built = True
+            self.rebuilds += 1
+
+    def _recompute(self, asset):
+        """
+        Log prices of the subtree below `asset`, node by node in preorder.
+        """
+        nodes = self.order[self.first[asset]:self.last[asset]]
+        edge_logs = self._edge_log(nodes)
+        for node, edge_log in zip(nodes.tolist(), edge_logs.tolist()):
+            self.log_prices[node] = self.log_prices[self.parent[node]] + edge_log
+
+    def update(self, symbol, row, result):
+        """
+        Store listener, see CandleStore.add_listener().
+        """
+        pair = self.registry.id(symbol)
+        with self.lock:
+            # Revisions of older candles do not move the latest close
+            if not 0 <= pair < self.pairs or row["interval_begin"] < self.begins[pair]:
+                return
+            self.begins[pair] = row["interval_begin"]
+            self.updates += 1
+            old = self.closes[pair]
+            self.closes[pair] = row["close"]
+            child = self.pair_child[pair] if self.built and pair < len(self.pair_child) else -1
+            if child < 0 or row["close"] == old:
+                return
+            nodes = self.order[self.first[child]:self.last[child]]
+            if old > 0 and row["close"] > 0 and not np.isnan(self.log_prices[child]):
+                change = np.log(row["close"] / old)
+                self.log_prices[nodes] += change if self.base_ids[pair] == child else -change
+            else:
+                self._recompute(child)
+            self.shifted += len(nodes)
+
+    def remove(self, symbols):
+        """
+        Forgets the closes of the given symbols, e.g. pairs that were delisted.
+        Assets priced through them have no price until the next rebuild().
+        """
+        with self.lock:
+            for symbol in symbols:
+                pair = self.registry.id(symbol)
+                if not 0 <= pair < self.pairs:
+                    continue
+                self.closes[pair] = np.nan
+                self.begins[pair] = -1
+                if self.built and pair < len(self.pair_child) and self.pair_child[pair] >= 0:
+                    self._recompute(self.pair_child[pair])
+
+    def prices(self, numeraire=None):
+        """
+        Price of every asset, as an array indexed by asset id (NaN where no path has a price).
+        With `numeraire` the prices are converted to that asset.
+        """
+        with self.lock:
+            prices = np.exp(self.log_prices)
+        if numeraire is not None and numeraire != self.numeraire:
+            prices = prices / prices[self.registry.asset_id(numeraire)]
+        return prices
+
+    def price(self, asset, numeraire=None):
+        asset_id = self.registry.asset_id(asset)
+        if asset_id < 0 or asset_id >= len(self.log_prices):
+            return np.nan
+        return float(self.prices(numeraire)[asset_id])
+
+    def path(self, asset):
+        """
+        Pairs converting the numeraire into `asset`, in order.
+        """
+        asset_id = self.registry.asset_id(asset)
+        if not 0 <= asset_id < len(self.parent):
+            return []
+        pairs = []
+        while asset_id >= 0 and self.parent_pair[asset_id] >= 0:
+            pairs.append(self.registry.symbol(self.parent_pair[asset_id]))
+            asset_id = self.parent[asset_id]
+        return pairs[::-1]
+
+    def attach(self):
+        """
+        Builds the tree from the store, then follows its updates.
+        """
+        self.store.add_listener(self.update)
+        self.rebuild()
+
+    def detach(self):
+        self.store.remove_listener(self.update)
+
+    def start(self):
+        """
+        Attach to the store and rebuild the tree every `period` seconds.
+        """
+        self.attach()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="cross-rates", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.period):
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"Cross rate rebuild error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.detach()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "rebuilds": self.rebuilds,
+                "updates": self.updates,
+                "prices_shifted": self.shifted,
+                "priced_assets": int(np.isfinite(self.log_prices).sum()),
+                "reachable_assets": self.reachable if self.built else 0,
+            }
@@ -1,7 +1,16 @@
 import os
 import re
+import numpy as np
 import pandas as pd
 
+def symbol_file_path(symbol, save_path="./crypto_data", extension="csv"):
+    """
+    Returns the file path used to store a symbol's data.
+    """
+    # Sanitize the symbol name to remove any invalid characters for filenames
+    safe_symbol = re.sub(r'[<>:"/\\|?*]', '_', symbol)
+    return os.path.join(save_path, f"{safe_symbol}_data.{extension}")
+
 def convert_to_csv(df, save_path="./crypto_data"):
     """
     Converts a dataframe to CSV files, organized by symbol.
@@ -12,31 +21,80 @@ def convert_to_csv(df, save_path="./crypto_data"):
     os.makedirs(save_path, exist_ok=True)
 
     for symbol, df_grouped in df.groupby("symbol"):
-        # Sanitize the symbol name to remove any invalid characters for filenames
-        safe_symbol = re.sub(r'[<>:"/\\|?*]', '_', symbol)
-
-        # Define the file path
-        file_path = os.path.join(save_path, f"{safe_symbol}_data.csv")
+        file_path = symbol_file_path(symbol, save_path)
 
         # Save the grouped data
         df_grouped.to_csv(file_path, index=False)
-        print(f"Saved {safe_symbol} data to {file_path}")
+        print(f"Saved {symbol} data to {file_path}")
+
+def store_to_csv(store, save_path="./crypto_data"):
+    """
+    Writes the contents of a CandleStore to CSV files, one per symbol.
+    Reads each symbol's buffer directly instead of grouping one big DataFrame.
+    Rows are written newest first, matching limit_symbol_instances.
+    """
+    os.makedirs(save_path, exist_ok=True)
+
+    for symbol in store.symbols():
+        file_path = symbol_file_path(symbol, save_path)
+        store.symbol_frame(symbol, newest_first=True).to_csv(file_path, index=False)
+        print(f"Saved {symbol} data to {file_path}")
+
+def _timestamp_keys(timestamps):
+    """
+    Returns int64 keys that sort like the timestamps.
+    Kraken's ISO strings have a fixed width, so ranking the distinct strings
+    keeps their chronological order without parsing them.
+    """
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        return timestamps.to_numpy().astype("datetime64[ns]").view(np.int64)
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return timestamps.to_numpy(dtype=np.int64)
+    return pd.factorize(timestamps, sort=True)[0].astype(np.int64)
 
 def limit_symbol_instances(df, max_instances=60):
     """
     Ensures that the DataFrame contains at most 'max_instances' per symbol.
     Keeps the most recent instances based on the timestamp.
+
+    Rather than sorting the whole frame, rows are grouped by symbol code and
+    only symbols with more than 'max_instances' rows run an argpartition on
+    their int64 timestamps. Just the kept rows are sorted for the output.
+    CandleStore already enforces this limit at insert time, this is for
+    DataFrames from other sources.
     
     Args:
     - df (pd.DataFrame): Input DataFrame containing a 'symbol' column.
     - max_instances (int): Maximum number of rows to keep per symbol.
 
     Returns:
-    - pd.DataFrame: Cleaned DataFrame with no more than 'max_instances' per symbol.
+    - pd.DataFrame: Cleaned DataFrame with no more than 'max_instances' per symbol,
+      sorted by symbol then timestamp (latest first).
     """
-    df = df.sort_values(by=["symbol", "timestamp"], ascending=[True, False])  # Sort by symbol, then timestamp (latest first)
-    
-    # Use .groupby() and head() to keep the latest `max_instances` per symbol
-    df_limited = df.groupby("symbol").head(max_instances).reset_index(drop=True)
+    if df.empty or max_instances <= 0:
+        return df.iloc[:0].reset_index(drop=True)
+
+    codes, _ = pd.factorize(df["symbol"], sort=True)
+    times = _timestamp_keys(df["timestamp"])
+    counts = np.bincount(codes)
+
+    # Symbols at or under the limit keep every row
+    selected = [np.flatnonzero(counts[codes] <= max_instances)]
+
+    # Stable sort on the symbol codes groups the rows of each symbol, with
+    # fewer than 65536 symbols NumPy does this as an O(n) radix sort
+    large = np.flatnonzero(counts > max_instances)
+    if len(large):
+        if len(counts) <= np.iinfo(np.uint16).max:
+            codes = codes.astype(np.uint16)
+        order = np.argsort(codes, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        for group in large:
+            rows = order[starts[group]:starts[group] + counts[group]]
+            latest = np.argpartition(times[rows], -max_instances)[-max_instances:]
+            selected.append(rows[latest])
 
-    return df_limited
+    selected = np.concatenate(selected)
+    # Symbol ascending, then timestamp descending
+    selected = selected[np.lexsort((-times[selected], codes[selected]))]
+    return df.iloc[selected].reset_index(drop=True)
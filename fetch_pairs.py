@@ -1,49 +1,262 @@
 import websocket
 import json
+import random
 import time
 import threading
-import pandas as pd
 from datetime import datetime
 
-from kraken_pairs import kraken_pairs
+from candle_store import CandleStore
+from backfill import backfill_gaps
+from rest_client import KrakenRestClient
+from shard_planner import ShardPlanner
+from ingest_queue import IngestPipeline
+from parse_pool import ParsePool
+from trade_candles import TradeCandleBuilder
+from order_book import BookManager
+from quote_table import QuoteTable
+from pair_registry import get_registry
+
+
+class ShardSupervisor:
+    """
+    Keeps one WebSocket connection (one chunk of pairs) alive.
+
+    When the socket drops it reconnects after a jittered exponential backoff,
+    subscribes the shard's pairs again and, once the live stream has caught up,
+    backfills the minutes each pair missed through the REST OHLC endpoint.
+
+    Args:
+    - handler (WebSocketHandler): Owner of the store, callbacks and stop_event.
+    - pairs (list): Pairs subscribed on this connection.
+    - base_delay, max_delay (float): Backoff bounds in seconds.
+    - settle (float): Seconds to wait after reconnecting before looking for gaps.
+    """
+
+    def __init__(self, handler, pairs, index=0, base_delay=1.0, max_delay=60.0, settle=5.0):
+        self.handler = handler
+        self.pairs = pairs
+        self.index = index
+        self.name = f"shard-{index}"
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.settle = settle
+        self.ws = None
+        self.thread = None
+        self.attempt = 0
+        self.connects = 0
+        self.connected = False
+        self.last_seen = {}  # Newest interval_begin per pair when the connection dropped
+        # Pairs are moved by the shard planner and the universe refresher from their own threads
+        self.lock = threading.Lock()
+
+        self.reconnects = 0
+        self.backfilled = 0
+        self.messages = 0
+        self.busy_since = time.monotonic()
+
+    def backoff(self):
+        """
+        Seconds to wait before the next connection attempt (equal jitter).
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** self.attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def on_open(self, ws):
+        self.attempt = 0
+        self.connected = True
+        if self.pairs:
+            self.handler.on_open(ws, self.pairs)
+        if self.connects:
+            self.reconnects += 1
+            threading.Thread(target=self.backfill, args=(dict(self.last_seen),), name=f"{self.name}-backfill",
+                             daemon=True).start()
+        self.connects += 1
+
+    def on_message(self, ws, message):
+        # The socket thread only enqueues, parsing happens on the ingest workers
+        self.handler.ingest.put(message, self.index)
+        self.messages += 1
+
+    def busy_fraction(self):
+        """
+        Share of the time since the last call the ingest workers spent parsing and
+        applying this connection's messages (enqueueing them costs next to nothing).
+        """
+        now = time.monotonic()
+        busy = self.handler.ingest.take_busy(self.index)
+        elapsed, self.busy_since = now - self.busy_since, now
+        return busy / elapsed if elapsed > 0 else 0.0
+
+    def subscribe(self, pairs):
+        """
+        Adds pairs to this connection, subscribing them right away when connected.
+        """
+        with self.lock:
+            pairs = [pair for pair in pairs if pair not in self.pairs]
+            self.pairs = self.pairs + pairs
+        if pairs and self.connected:
+            for message in self.handler.subscription_messages(pairs):
+                self.ws.send(json.dumps(message))
+
+    def unsubscribe(self, pairs):
+        """
+        Removes pairs from this connection, unsubscribing them right away when connected.
+        """
+        with self.lock:
+            pairs = [pair for pair in pairs if pair in self.pairs]
+            self.pairs = [pair for pair in self.pairs if pair not in set(pairs)]
+        if pairs and self.connected:
+            for message in self.handler.subscription_messages(pairs, method="unsubscribe"):
+                self.ws.send(json.dumps(message))
+
+    def backfill(self, last_seen):
+        if self.handler.stop_event.wait(self.settle):
+            return
+        filled = backfill_gaps(self.handler.store, last_seen, self.handler.rest_client, self.handler.stop_event)
+        self.backfilled += filled
+        print(f"{self.name}: backfilled {filled} candles after reconnecting")
+
+    def run(self):
+        stop_event = self.handler.stop_event
+        while not stop_event.is_set():
+            self.ws = websocket.WebSocketApp(
+                self.handler.websocket_url,
+                on_open=self.on_open,
+                on_message=self.on_message,
+                on_error=self.handler.on_error,
+                on_close=self.handler.on_close
+            )
+            try:
+                self.ws.run_forever(ping_interval=30, ping_timeout=10)
+            except Exception as e:
+                print(f"{self.name}: WebSocket connection error: {e}")
+            if self.connected:
+                # Where every pair stood when the connection dropped
+                store = self.handler.store
+                self.last_seen = {pair: store.last_interval_begin(pair) for pair in self.pairs}
+                self.connected = False
+            if stop_event.is_set():
+                break
+            delay = self.backoff()
+            self.attempt += 1
+            print(f"{self.name}: reconnecting in {delay:.1f}s")
+            stop_event.wait(delay)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.ws is not None:
+            self.ws.close()
 
-kraken_pairs.append('BTC/USD')
 
 class WebSocketHandler:
-    def __init__(self, websocket_url="wss://ws.kraken.com/v2", chunk_size=450, interval=1):
+    def __init__(self, websocket_url="wss://ws.kraken.com/v2", chunk_size=450, interval=1, capacity=60,
+                 pairs=None, sink=None, rest_url="https://api.kraken.com", planner=None, ingest_workers=1,
+                 queue_size=10000, overflow="coalesce", parse_processes=0, trade_seconds=None, book_depth=None,
+                 ticker=False, registry=None):
         self.websocket_url = websocket_url
+        # REST API used to backfill the minutes missed while a connection was down,
+        # one client so every shard shares its rate limit
+        self.rest_url = rest_url
+        self.rest_client = KrakenRestClient(rest_url)
         self.chunk_size = chunk_size
         self.interval = interval
+        # Pairs are subscribed by their v2 names ('BTC/USD', not 'XBT/USD')
+        self.registry = registry if registry is not None else get_registry()
+        pairs = self.registry.symbols() if pairs is None else pairs
+
+        # Divide pairs into chunks of similar message rate, kept balanced while running
+        self.planner = planner if planner is not None else ShardPlanner(chunk_size)
+        self.connections = self.planner.plan(pairs)
+
+        # Per-symbol ring buffers holding the latest `capacity` candles of each pair
+        self.store = CandleStore(capacity=capacity, interval=interval)
+
+        # Called with every parsed 'ohlc' message, defaults to the store
+        self.sink = sink if sink is not None else self.store.ingest
 
-        # Divide pairs into chunks
-        self.connections = [kraken_pairs[i:i + self.chunk_size] for i in range(0, len(kraken_pairs), self.chunk_size)]
+        # With trade_seconds (e.g. [1, 5, 15]) the 'trade' channel is subscribed as well
+        # and its trades are aggregated into candles of those durations
+        self.trades = TradeCandleBuilder(trade_seconds) if trade_seconds else None
 
-        # Dictionary to store OHLC data for each pair
-        self.ohlc_data = pd.DataFrame()
+        # With book_depth (10, 25, 100, 500 or 1000) the 'book' channel is subscribed as well,
+        # a book that fails its checksum is subscribed again for a fresh snapshot
+        self.books = BookManager(book_depth, self.registry.precisions(),
+                                 on_mismatch=self.resync_book) if book_depth else None
+
+        # With ticker=True the 'ticker' channel is subscribed as well and the latest quote of
+        # every pair is kept in one structured array. Kraken sends a ticker on every trade,
+        # ticker="bbo" asks for one on every change of the best bid or ask instead
+        self.quotes = QuoteTable(self.registry) if ticker else None
+        self.ticker_trigger = ticker if isinstance(ticker, str) else None
+
+        # Consumers of the channels besides 'ohlc' and 'trade'
+        self.handlers = self.channel_handlers()
+
+        # Bounded queues between the socket threads and the workers that parse and apply frames,
+        # `overflow` is what happens when one fills up (see ingest_queue.POLICIES)
+        # With parse_processes > 0 frames are decoded in worker processes and applied to the store as columns
+        pool = None
+        if parse_processes:
+            if sink is not None:
+                # Pooled batches are applied to the store as columns, a custom sink would never see them
+                raise ValueError("A custom sink cannot be used with parse_processes > 0")
+            pool = ParsePool(self.store.upsert_columns, parse_processes,
+                             apply_trades=self.trades.add_trades if self.trades else None,
+                             handlers=self.handlers)
+        self.ingest = IngestPipeline(self.process_message, self.apply_coalesced,
+                                     workers=ingest_workers, maxsize=queue_size, policy=overflow, pool=pool)
+        self.sockets = []
+        self.supervisors = []
 
         # Lock for thread-safe updates
-        self.data_lock = threading.Lock()
+        self.data_lock = self.store.lock
         self.stop_event = threading.Event()
 
-    def convert_to_dataframe(self, data):
-        with self.data_lock:
-            new_data = pd.DataFrame(data['data'])
-            self.ohlc_data = pd.concat([new_data, self.ohlc_data])
-            # print(self.ohlc_data.head())
+    @property
+    def ohlc_data(self):
+        """
+        DataFrame view of everything in the store, built on demand.
+        """
+        return self.store.to_dataframe()
 
     def on_message(self, ws, message):
         """
         Handle incoming messages from the WebSocket.
         """
+        self.process_message(message)
+
+    def process_message(self, message, received=None):
+        """
+        Parse a raw frame and hand 'ohlc' messages to the sink, 'trade' messages to the trade candle builder.
+        `received` (time.time_ns() when the frame arrived) is passed on to the other channels' handlers.
+        """
         try:
             data = json.loads(message)
+            if received is not None:
+                data["received"] = received
             # print(f"Channel: {data['channel']}")
-            if data['channel'] == 'ohlc':
-                self.convert_to_dataframe(data)
+            if data.get('channel') == 'ohlc':
+                self.sink(data)
+            elif data.get('channel') == 'trade' and self.trades is not None:
+                self.trades.ingest(data)
+            elif data.get('channel') in self.handlers:
+                self.handlers[data['channel']](data)
         except Exception as e:
             print(f"Error processing message: {e}")
 
 
+    def apply_coalesced(self, data):
+        """
+        Applies a message of records coalesced by the ingest queue while it overflowed.
+        """
+        if data["channel"] == "ohlc":
+            self.sink(data)
+        elif data["channel"] in self.handlers:
+            self.handlers[data["channel"]](data)
+
     def on_error(self, ws, error):
         """
         Handle WebSocket errors.
@@ -57,20 +270,164 @@ class WebSocketHandler:
         print(f"WebSocket closed. Code: {close_status_code}, Message: {close_msg}")
 
 
-    def on_open(self, ws, pair_group=None):
+    def subscription_message(self, pair_group=None, method="subscribe"):
         """
-        Handle WebSocket connection opening and subscribe to channels.
+        Build the OHLC subscribe (or unsubscribe) request for a group of pairs.
         """
-        subscription_message = {
-            "method": "subscribe",
+        return {
+            "method": method,
             "params": {
                 "channel": "ohlc",
                 "symbol": pair_group if pair_group else ["BTC/USD"],
                 "interval": self.interval
             }
         }
-        ws.send(json.dumps(subscription_message))
-        print(f"Subscribed to OHLC data for pairs: {pair_group if pair_group else ["BTC/USD"]}")
+
+    def trade_subscription_message(self, pair_group=None, method="subscribe"):
+        """
+        Build the trade subscribe (or unsubscribe) request for a group of pairs.
+        """
+        return {
+            "method": method,
+            "params": {
+                "channel": "trade",
+                "symbol": pair_group if pair_group else ["BTC/USD"],
+                "snapshot": False
+            }
+        }
+
+    def book_subscription_message(self, pair_group=None, method="subscribe"):
+        """
+        Build the book subscribe (or unsubscribe) request for a group of pairs.
+        """
+        return {
+            "method": method,
+            "params": {
+                "channel": "book",
+                "symbol": pair_group if pair_group else ["BTC/USD"],
+                "depth": self.books.depth
+            }
+        }
+
+    def ticker_subscription_message(self, pair_group=None, method="subscribe"):
+        """
+        Build the ticker subscribe (or unsubscribe) request for a group of pairs.
+        """
+        message = {
+            "method": method,
+            "params": {
+                "channel": "ticker",
+                "symbol": pair_group if pair_group else ["BTC/USD"]
+            }
+        }
+        if self.ticker_trigger and method == "subscribe":
+            message["params"]["event_trigger"] = self.ticker_trigger
+        return message
+
+    def channel_handlers(self):
+        """
+        Returns {channel: callable} for the enabled channels other than 'ohlc' and 'trade'.
+        """
+        handlers = {}
+        if self.books is not None:
+            handlers["book"] = self.books.ingest
+        if self.quotes is not None:
+            handlers["ticker"] = self.quotes.ingest
+        return handlers
+
+    def subscription_messages(self, pair_group=None, method="subscribe"):
+        """
+        Every request needed to (un)subscribe a group of pairs: OHLC, plus trades, books and tickers when enabled.
+        """
+        messages = [self.subscription_message(pair_group, method)]
+        if self.trades is not None:
+            messages.append(self.trade_subscription_message(pair_group, method))
+        if self.books is not None:
+            messages.append(self.book_subscription_message(pair_group, method))
+        if self.quotes is not None:
+            messages.append(self.ticker_subscription_message(pair_group, method))
+        return messages
+
+    def resync_book(self, symbol):
+        """
+        Subscribes a pair's book again on its connection, which sends a fresh snapshot.
+        """
+        for supervisor in self.supervisors:
+            if symbol in supervisor.pairs and supervisor.connected:
+                print(f"Book checksum mismatch for {symbol}, resubscribing")
+                supervisor.ws.send(json.dumps(self.book_subscription_message([symbol], method="unsubscribe")))
+                supervisor.ws.send(json.dumps(self.book_subscription_message([symbol])))
+
+    def subscribed_pairs(self):
+        """
+        Every pair currently assigned to a connection.
+        """
+        groups = [supervisor.pairs for supervisor in self.supervisors] if self.supervisors else self.connections
+        return [pair for pair_group in groups for pair in pair_group]
+
+    def add_pairs(self, pairs):
+        """
+        Subscribes new pairs without touching the connections' other pairs: each
+        goes to the least loaded connection with room, the rest to new connections.
+        """
+        subscribed = set(self.subscribed_pairs())
+        pairs = [pair for pair in pairs if pair not in subscribed]
+        if not pairs:
+            return []
+        for pair in pairs:
+            self.registry.add(pair)
+        groups = [supervisor.pairs for supervisor in self.supervisors] if self.supervisors else self.connections
+        placed, new_groups = self.planner.place(pairs, groups)
+        for index, group in placed.items():
+            if self.supervisors:
+                self.supervisors[index].subscribe(group)
+            else:
+                self.connections[index].extend(group)
+        for group in new_groups:
+            self.connections.append(group)
+            if self.supervisors:
+                supervisor = ShardSupervisor(self, group, len(self.supervisors))
+                self.supervisors.append(supervisor)
+                supervisor.start()
+        return pairs
+
+    def remove_pairs(self, pairs):
+        """
+        Unsubscribes pairs on the connections carrying them and evicts them from memory.
+        Connections without any of these pairs are not touched.
+        """
+        pairs = set(pairs)
+        if self.supervisors:
+            for supervisor in self.supervisors:
+                group = [pair for pair in supervisor.pairs if pair in pairs]
+                if group:
+                    supervisor.unsubscribe(group)
+        else:
+            self.connections = [[pair for pair in group if pair not in pairs] for group in self.connections]
+        self.planner.forget(pairs)
+        self.evict(pairs)
+
+    def evict(self, pairs):
+        """
+        Drops everything kept in memory for the given pairs: candles, trade candles, books and quotes.
+        """
+        pairs = list(pairs)
+        self.store.remove(pairs)
+        if self.trades is not None:
+            self.trades.remove(pairs)
+        if self.books is not None:
+            self.books.remove(pairs)
+        if self.quotes is not None:
+            self.quotes.clear(pairs)
+
+    def on_open(self, ws, pair_group=None):
+        """
+        Handle WebSocket connection opening and subscribe to channels.
+        """
+        for subscription_message in self.subscription_messages(pair_group):
+            ws.send(json.dumps(subscription_message))
+            print(f"Subscribed to {subscription_message['params']['channel']} data for pairs: "
+                  f"{subscription_message['params']['symbol']}")
 
     def start_websocket(self):
         """
@@ -90,35 +447,36 @@ class WebSocketHandler:
         Stop all WebSocket connections gracefully.
         """
         self.stop_event.set()
+        self.planner.stop()
+        for supervisor in self.supervisors:
+            supervisor.stop()
+        self.ingest.stop()
+        if self.trades is not None:
+            self.trades.stop()
         print("Stopping all WebSocket connections.")
 
-    # def run_persistent_websocket(self, ws):
-    #     while not self.stop_event.is_set():
-    #         try:
-    #             ws.run_forever()
-    #         except Exception as e:
-    #             print(f"WebSocket connection error: {e}")
-    #             time.sleep(5)  # Wait before reconnecting
-
     def start_websockets(self):
         """
-        Start multiple WebSocket connections in parallel threads.
+        Start one supervised WebSocket connection per chunk of pairs, each in its own thread.
+        Dropped connections are reconnected and their gaps backfilled until stop_websockets().
         """
-        threads = []
+        self.stop_event.clear()
+        if self.books is not None and not self.books.precisions:
+            # Precisions are needed to rebuild the checksums
+            try:
+                self.books.load_precisions(self.rest_client)
+            except Exception as e:
+                print(f"Could not load pair precisions, book checksums are not checked: {e}")
+        self.ingest.start()
+        if self.trades is not None:
+            # Closes the trade candles of pairs that go quiet
+            self.trades.start()
         # print(f"connections: {self.connections}")
-        for pair_group in self.connections:
-            ws = websocket.WebSocketApp(
-                self.websocket_url,
-                on_message=self.on_message,
-                on_error=self.on_error,
-                on_close=self.on_close
-            )
-            ws.on_open = lambda ws, pg=pair_group: self.on_open(ws, pg)
-
-            # ws.on_open = lambda ws, pg=pair_group: self.on_open(ws)
-            thread = threading.Thread(target=ws.run_forever, daemon=True)
-            threads.append(thread)
-            thread.start()
+        for index, pair_group in enumerate(self.connections):
+            supervisor = ShardSupervisor(self, pair_group, index)
+            self.supervisors.append(supervisor)
+            supervisor.start()
+        self.planner.start(self)
 
         print("All WebSocket connections started.")
 
@@ -130,7 +488,7 @@ if __name__ == "__main__":
         while True:
             # ohlc_data = handler.convert_to_dataframe()
             # ohlc_data.to_csv('./ohlc_data.csv')
-            print("ohlc data:", handler.ohlc_data.head())
+            print("ohlc data:", handler.store.to_dataframe().head())
             # if len(handler.ohlc_data) > 500:
             #     convert_to_csv(handler.ohlc_data)
             #     # handler.ohlc_data = pd.DataFrame()
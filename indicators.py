@@ -0,0 +1,510 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from candle_store import REVISED, INSERTED, format_nanos
+from pair_registry import get_registry
+
+# Candle fields indicators read, kept for every symbol's open candle
+INPUT_FIELDS = ("open", "high", "low", "close", "volume", "vwap")
+
+
+class Indicator:
+    """
+    Base class of the streaming indicators.
+
+    An indicator keeps its running state in arrays with one row per symbol
+    (`fields`: name -> (initial value, dtype, width), width 0 for a scalar)
+    and computes one step in step(). The same step() serves a single symbol
+    (`index` an int, candle values scalars) and many symbols at once (`index`
+    an array, candle values arrays), so streaming and batch results match.
+    """
+
+    fields = {"count": (0, np.int64, 0)}
+    outputs = ("value",)
+
+    def allocate(self, size):
+        return {name: np.full((size, width) if width else size, initial, dtype=dtype)
+                for name, (initial, dtype, width) in self.fields.items()}
+
+    def reset(self, state, index):
+        for name, (initial, dtype, width) in self.fields.items():
+            state[name][index] = initial
+
+    def step(self, state, index, candle, commit):
+        """
+        Returns the indicator's outputs (a tuple ordered like `outputs`) for
+        `candle` on top of the committed state. With commit=True the candle is
+        final and folded into the state, otherwise the state is left alone (the
+        candle is still open and will be revised).
+        """
+        raise NotImplementedError
+
+
+# Streaming steps one symbol with scalars, where NumPy's functions cost more
+# than the arithmetic, so these fall back to plain Python for scalars
+
+def _where(condition, a, b):
+    if isinstance(condition, np.ndarray):
+        return np.where(condition, a, b)
+    return a if condition else b
+
+
+def _ratio(numerator, denominator, fallback):
+    """
+    numerator / denominator where denominator > 0, else fallback.
+    """
+    if isinstance(denominator, np.ndarray):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(denominator > 0, numerator / denominator, fallback)
+    return numerator / denominator if denominator > 0 else fallback
+
+
+def _window_sum(state, index, name, value, window, count, commit):
+    """
+    Sum of `value` and the last window - 1 committed values, from the ring
+    `<name>_ring` and its running sum `<name>_sum`. Returns (sum, values in it).
+    """
+    ring, sums = state[name + "_ring"], state[name + "_sum"]
+    position = count % window
+    total = sums[index] - _where(count >= window, ring[index, position], 0.0) + value
+    if commit:
+        ring[index, position] = value
+        sums[index] = total
+        # Resum every full turn of the ring so rounding errors do not accumulate
+        turned = (count + 1) % window == 0
+        if isinstance(turned, np.ndarray):
+            sums[index[turned]] = ring[index[turned]].sum(axis=1)
+        elif turned:
+            sums[index] = ring[index].sum()
+    return total, _where(count + 1 < window, count + 1, window)
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average, seeded with the first value (pandas ewm(span=period, adjust=False)).
+    """
+
+    fields = {"value": (np.nan, np.float64, 0), "count": (0, np.int64, 0)}
+
+    def __init__(self, period=20, source="close"):
+        self.period = period
+        self.source = source
+        self.alpha = 2.0 / (period + 1)
+
+    def step(self, state, index, candle, commit):
+        value = candle[self.source]
+        previous, count = state["value"][index], state["count"][index]
+        value = _where(count == 0, value, previous + self.alpha * (value - previous))
+        if commit:
+            state["value"][index] = value
+            state["count"][index] = count + 1
+        return (_where(count + 1 >= self.period, value, np.nan),)
+
+
+class RSI(Indicator):
+    """
+    Relative strength index with Wilder's smoothing of gains and losses, seeded
+    with the simple average of the first `period` changes (as TA-Lib does).
+    """
+
+    # gain/loss hold the sums of the changes until the seed, then the averages
+    fields = {"close": (np.nan, np.float64, 0), "gain": (0.0, np.float64, 0),
+              "loss": (0.0, np.float64, 0), "count": (0, np.int64, 0)}
+
+    def __init__(self, period=14):
+        self.period = period
+
+    def step(self, state, index, candle, commit):
+        close = candle["close"]
+        count = state["count"][index]
+        change = close - state["close"][index]
+        gain, loss = _where(change > 0, change, 0.0), _where(change < 0, -change, 0.0)
+        previous_gain, previous_loss = state["gain"][index], state["loss"][index]
+        # count is the number of changes including this one
+        gain = self._smooth(count, previous_gain, gain)
+        loss = self._smooth(count, previous_loss, loss)
+        if commit:
+            state["close"][index] = close
+            state["gain"][index] = gain
+            state["loss"][index] = loss
+            state["count"][index] = count + 1
+        value = _ratio(100.0 * gain, gain + loss, 50.0)
+        return (_where(count >= self.period, value, np.nan),)
+
+    def _smooth(self, count, previous, value):
+        total = previous + value
+        return _where(count < self.period, total,
+                      _where(count == self.period, total / self.period, previous + (value - previous) / self.period))
+
+
+class ATR(Indicator):
+    """
+    Average true range with Wilder's smoothing, the first true range is high - low.
+    """
+
+    fields = {"close": (np.nan, np.float64, 0), "value": (np.nan, np.float64, 0), "count": (0, np.int64, 0)}
+
+    def __init__(self, period=14):
+        self.period = period
+
+    def step(self, state, index, candle, commit):
+        high, low = candle["high"], candle["low"]
+        previous_close, count = state["close"][index], state["count"][index]
+        gap = _where(high - previous_close > previous_close - low, high - previous_close, previous_close - low)
+        true_range = _where((count == 0) | (high - low >= gap), high - low, gap)
+        previous = state["value"][index]
+        value = _where(count == 0, true_range, previous + (true_range - previous) / self.period)
+        if commit:
+            state["close"][index] = candle["close"]
+            state["value"][index] = value
+            state["count"][index] = count + 1
+        return (_where(count + 1 >= self.period, value, np.nan),)
+
+
+class RollingVWAP(Indicator):
+    """
+    Volume-weighted average price of the last `window` candles, from each candle's vwap and volume.
+    """
+
+    outputs = ("value",)
+
+    def __init__(self, window=20):
+        self.window = window
+        self.fields = {"pv_ring": (0.0, np.float64, window), "pv_sum": (0.0, np.float64, 0),
+                       "volume_ring": (0.0, np.float64, window), "volume_sum": (0.0, np.float64, 0),
+                       "count": (0, np.int64, 0)}
+
+    def step(self, state, index, candle, commit):
+        count = state["count"][index]
+        pv, size = _window_sum(state, index, "pv", candle["vwap"] * candle["volume"], self.window, count, commit)
+        volume, _ = _window_sum(state, index, "volume", candle["volume"], self.window, count, commit)
+        if commit:
+            state["count"][index] = count + 1
+        return (_where(size >= self.window, _ratio(pv, volume, candle["close"]), np.nan),)
+
+
+class Bollinger(Indicator):
+    """
+    Bollinger bands: mean of the last `window` closes and `width` population standard deviations around it.
+    The deviation is recomputed over the window rather than from a sum of squares, which cancels badly.
+    """
+
+    outputs = ("mid", "upper", "lower")
+
+    def __init__(self, window=20, width=2.0):
+        self.window = window
+        self.width = width
+        self.fields = {"x_ring": (0.0, np.float64, window), "x_sum": (0.0, np.float64, 0),
+                       "count": (0, np.int64, 0)}
+
+    def step(self, state, index, candle, commit):
+        close = candle["close"]
+        count = state["count"][index]
+        # The window: the ring with the slot of the oldest close replaced by this one
+        closes = state["x_ring"][index].copy()
+        if isinstance(index, np.ndarray):
+            closes[np.arange(len(index)), count % self.window] = close
+        else:
+            closes[count % self.window] = close
+        total, size = _window_sum(state, index, "x", close, self.window, count, commit)
+        if commit:
+            state["count"][index] = count + 1
+        mean = total / size
+        deviation = np.sqrt(np.mean((closes - np.expand_dims(mean, -1)) ** 2, axis=-1))
+        ready = size >= self.window
+        return (_where(ready, mean, np.nan),
+                _where(ready, mean + self.width * deviation, np.nan),
+                _where(ready, mean - self.width * deviation, np.nan))
+
+
+# Indicator kinds usable in declarative specs
+INDICATORS = {
+    "ema": EMA,
+    "rsi": RSI,
+    "atr": ATR,
+    "vwap": RollingVWAP,
+    "bollinger": Bollinger,
+}
+
+DEFAULT_INDICATORS = {
+    "ema_20": ("ema", 20),
+    "rsi_14": ("rsi", 14),
+    "atr_14": ("atr", 14),
+    "vwap_20": ("vwap", 20),
+    "bb_20": ("bollinger", 20, 2.0),
+}
+
+
+def register_indicator(kind):
+    """
+    Class decorator making an Indicator subclass usable in specs as `kind`.
+    """
+    def register(cls):
+        INDICATORS[kind] = cls
+        return cls
+    return register
+
+
+def make_indicator(spec):
+    """
+    Builds an indicator from a spec: an Indicator, a (kind, *args) tuple such
+    as ('ema', 50) or a dict such as {'kind': 'ema', 'period': 50, 'source': 'vwap'}.
+    """
+    if isinstance(spec, Indicator):
+        return spec
+    if isinstance(spec, dict):
+        spec = dict(spec)
+        return INDICATORS[spec.pop("kind")](**spec)
+    if isinstance(spec, str):
+        spec = (spec,)
+    return INDICATORS[spec[0]](*spec[1:])
+
+
+def output_columns(indicators):
+    """
+    Returns (name, output index, column) of every output, a column is named after
+    its indicator, suffixed with the output name when there are several.
+    """
+    return [(name, position, name if len(indicator.outputs) == 1 else f"{name}_{output}")
+            for name, indicator in indicators.items()
+            for position, output in enumerate(indicator.outputs)]
+
+
+def compute_indicators(columns, indicators=None):
+    """
+    Batch mode: computes the indicators of every candle of every symbol at once.
+
+    The candles are laid out as one row per symbol and one column per candle
+    position, and every position is one vectorized step over all symbols, so a
+    pass costs as many steps as the longest symbol has candles.
+
+    Args:
+    - columns (dict): Candle columns like CandleStore.columns(), one row per candle.
+    - indicators (dict): {name: spec}, see make_indicator(). Defaults to DEFAULT_INDICATORS.
+
+    Returns:
+    - dict: {column: array} aligned with the rows of `columns`.
+    """
+    indicators = {name: make_indicator(spec)
+                  for name, spec in (DEFAULT_INDICATORS if indicators is None else indicators).items()}
+    outputs = output_columns(indicators)
+    rows = len(columns["interval_begin"])
+    if rows == 0:
+        return {column: np.empty(0) for _, _, column in outputs}
+
+    names, codes = np.unique(columns["symbol"], return_inverse=True)
+    order = np.lexsort((columns["interval_begin"], codes))
+    codes = codes[order]
+    starts = np.flatnonzero(np.append(True, codes[1:] != codes[:-1]))
+    lengths = np.diff(np.append(starts, rows))
+    positions = np.arange(rows) - np.repeat(starts, lengths)
+
+    shape = (len(names), int(lengths.max()))
+    panels = {}
+    for field in INPUT_FIELDS:
+        panel = panels[field] = np.full(shape, np.nan)
+        panel[codes, positions] = np.asarray(columns[field], dtype=np.float64)[order]
+    results = {column: np.full(shape, np.nan) for _, _, column in outputs}
+    states = {name: indicator.allocate(len(names)) for name, indicator in indicators.items()}
+
+    for position in range(shape[1]):
+        alive = np.flatnonzero(lengths > position)
+        candle = {field: panel[alive, position] for field, panel in panels.items()}
+        values = {name: indicator.step(states[name], alive, candle, True) for name, indicator in indicators.items()}
+        for name, output, column in outputs:
+            results[column][alive, position] = values[name][output]
+
+    unsorted = np.empty(rows, dtype=np.intp)
+    unsorted[order] = np.arange(rows)
+    return {column: result[codes, positions][unsorted] for column, result in results.items()}
+
+
+def indicator_frame(frame, indicators=None):
+    """
+    Batch mode for a DataFrame in the CSV column layout (e.g. every file of
+    crypto_data/ concatenated): returns its candles, one row per symbol and
+    interval_begin (the last row wins), with a column per indicator output.
+    """
+    frame = frame.drop_duplicates(subset=["symbol", "interval_begin"], keep="last").reset_index(drop=True)
+    columns = {field: frame[field].to_numpy(dtype=np.float64) for field in INPUT_FIELDS}
+    columns["symbol"] = frame["symbol"].to_numpy(dtype=object)
+    columns["interval_begin"] = frame["interval_begin"].str.rstrip("Z").to_numpy().astype("datetime64[ns]").view(np.int64)
+    return frame.assign(**compute_indicators(columns, indicators))
+
+
+class IndicatorEngine:
+    """
+    Streaming indicators over a CandleStore.
+
+    Attached as a store listener, every accepted candle update costs one step
+    per indicator, O(1) except for the Bollinger deviation (O(window)). Every symbol's state lives in one row of per-field
+    arrays, indexed by its registry id. Updates to the open candle are
+    computed on top of the committed state without changing it; when the next
+    candle appears, the open one is final and committed with its last values.
+    `values[column]` holds the latest output of every symbol, open candle
+    included, and `interval_begin` the candle it belongs to.
+
+    A revision of an older candle or a backfilled gap cannot be applied
+    incrementally: the symbol is marked stale and rebuilt from the candles
+    still in the store on its next update (or by rebuild_stale()).
+
+    Args:
+    - indicators (dict): {name: spec}, see make_indicator(). Defaults to DEFAULT_INDICATORS.
+    - registry (PairRegistry): Symbol ids, defaults to the shared registry.
+    """
+
+    def __init__(self, indicators=None, registry=None):
+        self.indicators = {name: make_indicator(spec)
+                           for name, spec in (DEFAULT_INDICATORS if indicators is None else indicators).items()}
+        self.outputs = output_columns(self.indicators)
+        self.registry = registry if registry is not None else get_registry()
+        self.size = 0
+        self.state = {name: indicator.allocate(0) for name, indicator in self.indicators.items()}
+        self.values = {column: np.empty(0) for _, _, column in self.outputs}
+        self.candles = {field: np.empty(0) for field in INPUT_FIELDS}  # Open candle of every symbol
+        self.interval_begin = np.empty(0, dtype=np.int64)
+        self._grow(max(len(self.registry), 1))
+
+        self.stale = set()
+        self.store = None
+        self.lock = threading.Lock()
+
+        self.updates = 0
+        self.rebuilds = 0
+
+    def _grow(self, size):
+        added = size - self.size
+        for name, indicator in self.indicators.items():
+            extra = indicator.allocate(added)
+            self.state[name] = {field: np.concatenate([array, extra[field]]) for field, array in self.state[name].items()}
+        for group in (self.values, self.candles):
+            for key, array in group.items():
+                group[key] = np.concatenate([array, np.full(added, np.nan)])
+        self.interval_begin = np.concatenate([self.interval_begin, np.full(added, -1, dtype=np.int64)])
+        self.size = size
+
+    def _index(self, symbol):
+        index = self.registry.id(symbol)
+        if index < 0:
+            index = self.registry.add(symbol)
+        if index >= self.size:
+            self._grow(max(index + 1, 2 * self.size))
+        return index
+
+    def _step(self, index, candle, commit):
+        return {name: indicator.step(self.state[name], index, candle, commit)
+                for name, indicator in self.indicators.items()}
+
+    def _open(self, index, row):
+        """
+        Makes `row` the symbol's open candle and publishes its outputs.
+        """
+        candle = {field: float(row[field]) for field in INPUT_FIELDS}
+        for field, value in candle.items():
+            self.candles[field][index] = value
+        self.interval_begin[index] = row["interval_begin"]
+        values = self._step(index, candle, False)
+        for name, output, column in self.outputs:
+            self.values[column][index] = values[name][output]
+
+    def _commit_open(self, index):
+        if self.interval_begin[index] >= 0:
+            self._step(index, {field: self.candles[field][index] for field in INPUT_FIELDS}, True)
+
+    def _reset(self, index):
+        for name, indicator in self.indicators.items():
+            indicator.reset(self.state[name], index)
+        for column in self.values:
+            self.values[column][index] = np.nan
+        self.interval_begin[index] = -1
+
+    def _rebuild(self, symbol, index):
+        """
+        Replays the candles the store holds for `symbol`. Called under the store's lock.
+        """
+        self._reset(index)
+        buffer = self.store.buffers.get(symbol)
+        if buffer is not None and len(buffer):
+            candles = buffer.snapshot()
+            names = INPUT_FIELDS + ("interval_begin",)
+            rows = [dict(zip(names, row)) for row in zip(*(candles[name].tolist() for name in names))]
+            for row in rows[:-1]:
+                self._step(index, {field: row[field] for field in INPUT_FIELDS}, True)
+            self._open(index, rows[-1])
+        self.stale.discard(symbol)
+        self.rebuilds += 1
+
+    def update(self, symbol, row, result):
+        """
+        Store listener, see CandleStore.add_listener().
+        """
+        with self.lock:
+            index = self._index(symbol)
+            self.updates += 1
+            if result in (REVISED, INSERTED):
+                self.stale.add(symbol)
+            elif symbol in self.stale:
+                self._rebuild(symbol, index)
+            elif row["interval_begin"] == self.interval_begin[index]:
+                self._open(index, row)
+            elif row["interval_begin"] > self.interval_begin[index]:
+                # The open candle is final now
+                self._commit_open(index)
+                self._open(index, row)
+
+    def attach(self, store):
+        """
+        Computes the indicators of the candles already in `store`, then follows its updates.
+        """
+        self.store = store
+        store.add_listener(self.update)
+        with store.lock:
+            with self.lock:
+                for symbol in store.buffers:
+                    self._rebuild(symbol, self._index(symbol))
+
+    def detach(self):
+        if self.store is not None:
+            self.store.remove_listener(self.update)
+
+    def rebuild_stale(self):
+        """
+        Rebuilds every stale symbol right away instead of on its next update.
+        """
+        with self.store.lock:
+            with self.lock:
+                for symbol in list(self.stale):
+                    self._rebuild(symbol, self._index(symbol))
+
+    def remove(self, symbols):
+        """
+        Clears the state of the given symbols, e.g. pairs that were delisted.
+        """
+        with self.lock:
+            for symbol in symbols:
+                index = self.registry.id(symbol)
+                if 0 <= index < self.size:
+                    self._reset(index)
+                self.stale.discard(symbol)
+
+    def value(self, symbol, column):
+        """
+        Latest value of one indicator output for a symbol (NaN until it is warmed up).
+        """
+        index = self.registry.id(symbol)
+        if not 0 <= index < self.size:
+            return np.nan
+        return float(self.values[column][index])
+
+    def to_dataframe(self):
+        """
+        DataFrame with the latest outputs of every symbol that has candles, by symbol.
+        """
+        with self.lock:
+            rows = np.flatnonzero(self.interval_begin >= 0)
+            frame = pd.DataFrame({"symbol": self.registry.to_symbols(rows),
+                                  "interval_begin": format_nanos(self.interval_begin[rows])})
+            for _, _, column in self.outputs:
+                frame[column] = self.values[column][rows]
+        return frame.sort_values("symbol").reset_index(drop=True)
@@ -0,0 +1,327 @@
+import json
+import threading
+import time
+from collections import deque
+
+# What put() does with a frame when the queue is full
+POLICIES = (
+    "block",        # Wait for room (up to block_timeout, then drop the frame)
+    "drop_newest",  # Drop the incoming frame
+    "drop_oldest",  # Drop the oldest queued frame to make room
+    "coalesce",     # Parse the frame and merge its records: candles by (symbol, interval_begin), tickers by symbol
+)
+
+
+class IngestQueue:
+    """
+    Bounded FIFO of raw WebSocket frames feeding one consumer thread.
+
+    With the 'coalesce' policy an overflowing frame is parsed on the producer
+    and its candle records are merged into a pending table keyed by
+    (symbol, interval_begin), and its ticker records into one keyed by symbol,
+    so however long the consumer stalls, memory stays bounded by the number of
+    open candles and pairs and only their newest update is applied. Until the
+    pending tables have been applied every new frame goes to them as well,
+    which keeps updates in arrival order. Frames of other channels (trades,
+    book deltas) cannot be merged and are dropped meanwhile.
+
+    `dropped` counts every frame or record lost to the overflow policy and
+    `dropped_channels` the same per channel.
+    """
+
+    def __init__(self, maxsize=10000, policy="coalesce", block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.frames = deque()
+        self.received = deque()  # time.time_ns() when each queued frame was put()
+        self.keys = deque()  # Connection each queued frame came from
+        self.pending = {}  # (symbol, interval_begin) -> newest record, 'coalesce' only
+        self.pending_tickers = {}  # symbol -> newest ticker record, 'coalesce' only
+        self.pending_received = None  # time.time_ns() of the newest coalesced frame
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.dropped_channels = {}
+        self.coalesced = 0  # Records merged into one already pending
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _drop(self, channel, count=1):
+        self.dropped += count
+        self.dropped_channels[channel] = self.dropped_channels.get(channel, 0) + count
+
+    def _coalesce(self, frame):
+        try:
+            data = json.loads(frame)
+        except ValueError:
+            self._drop("invalid")
+            return
+        channel = data.get("channel") or data.get("method") or "unknown"
+        if channel == "ticker":
+            for record in data.get("data", []):
+                if record.get("symbol") in self.pending_tickers:
+                    self.coalesced += 1
+                    # Fields missing from a newer record keep their pending value
+                    record = dict(self.pending_tickers.pop(record["symbol"]), **record)
+                self.pending_tickers[record.get("symbol")] = record
+        elif channel == "ohlc":
+            for record in data.get("data", []):
+                key = (record["symbol"], record["interval_begin"])
+                if key in self.pending:
+                    self.coalesced += 1
+                self.pending[key] = record
+            excess = len(self.pending) - self.maxsize
+            if excess > 0:
+                # Bounded as well: the oldest pending candles go first
+                for key in list(self.pending)[:excess]:
+                    del self.pending[key]
+                self._drop("ohlc", excess)
+        else:
+            # Trades and book deltas cannot be merged like candle updates, they are lost while
+            # the queue overflows (a book then fails its checksum and is subscribed again)
+            self._drop(channel)
+            return
+        self.pending_received = time.time_ns()
+
+    def put(self, frame, key=0):
+        """
+        Enqueues a raw frame received on connection `key`. Returns False when it was dropped.
+        """
+        with self.condition:
+            if self.pending or self.pending_tickers:
+                self._coalesce(frame)
+                self.condition.notify()
+                return True
+            if len(self.frames) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self._drop(frame_channel(frame))
+                    return False
+                if self.policy == "drop_oldest":
+                    self._drop(frame_channel(self.frames.popleft()))
+                    self.received.popleft()
+                    self.keys.popleft()
+                elif self.policy == "coalesce":
+                    self._coalesce(frame)
+                    self.condition.notify()
+                    return True
+                elif not self.condition.wait_for(lambda: len(self.frames) < self.maxsize or self.closed,
+                                                 self.block_timeout):
+                    self._drop(frame_channel(frame))
+                    return False
+            self.frames.append(frame)
+            self.received.append(time.time_ns())
+            self.keys.append(key)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self.frames))
+            self.condition.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Waits for work and returns (frames, received, keys, messages): every queued
+        frame with the time it was received (time.time_ns()) and its connection
+        and, once the frames are drained, the pending coalesced records as parsed
+        messages, e.g. {'channel': 'ohlc', 'type': 'update', 'data': records}.
+        All are empty on timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.frames or self.pending or self.pending_tickers
+                                           or self.closed, timeout):
+                return [], [], [], []
+            if self.frames:
+                frames, received, keys = list(self.frames), list(self.received), list(self.keys)
+                self.frames.clear()
+                self.received.clear()
+                self.keys.clear()
+                self.condition.notify_all()
+                return frames, received, keys, []
+            messages = [{"channel": channel, "type": "update", "data": list(pending.values()),
+                         "received": self.pending_received}
+                        for channel, pending in (("ohlc", self.pending), ("ticker", self.pending_tickers)) if pending]
+            self.pending = {}
+            self.pending_tickers = {}
+            return [], [], [], messages
+
+    def has_pending(self):
+        return bool(self.pending or self.pending_tickers)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+def frame_channel(frame):
+    """
+    Channel of a raw frame without parsing it, for the drop counters.
+    """
+    start = frame.find('"channel"')
+    if start < 0:
+        return "unknown"
+    start = frame.find('"', frame.find(":", start)) + 1
+    return frame[start:frame.find('"', start)] or "unknown"
+
+
+class IngestPipeline:
+    """
+    Decouples socket threads from parsing and applying updates.
+
+    Socket callbacks only put() raw frames. Every consumer worker owns one
+    IngestQueue and frames are routed by connection, so each connection's
+    updates are applied in order by a single worker. The time spent handling
+    each connection's frames is added up per connection, see take_busy().
+
+    Args:
+    - handle (callable): Called with every raw frame and the time it was received
+      (time.time_ns()), e.g. WebSocketHandler.process_message.
+    - sink (callable): Called with every message of coalesced records,
+      {'channel': 'ohlc' or 'ticker', 'type': 'update', 'data': records}.
+    - workers (int): Consumer threads.
+    - maxsize (int): Frames per queue before the overflow policy applies.
+    - policy (str): One of POLICIES.
+    - pool (ParsePool): Parse frames in worker processes instead of calling `handle`;
+      the pool applies them itself, `handle` is then never called.
+    """
+
+    def __init__(self, handle, sink, workers=1, maxsize=10000, policy="coalesce", block_timeout=1.0, pool=None):
+        self.handle = handle
+        self.sink = sink
+        self.pool = pool
+        self.queues = [IngestQueue(maxsize, policy, block_timeout) for _ in range(workers)]
+        self.threads = []
+        self.busy = {}  # Seconds spent handling the frames of every connection since take_busy()
+        self.busy_lock = threading.Lock()
+
+    def put(self, frame, key=0):
+        """
+        Enqueues a raw frame on the queue of connection `key`.
+        """
+        return self.queues[key % len(self.queues)].put(frame, key)
+
+    def _add_busy(self, keys, seconds):
+        """
+        Spreads `seconds` evenly over the frames of the given connections.
+        """
+        share = seconds / len(keys)
+        with self.busy_lock:
+            for key in keys:
+                self.busy[key] = self.busy.get(key, 0.0) + share
+
+    def take_busy(self, key):
+        """
+        Returns the seconds spent parsing and applying the frames of connection `key` since the last call.
+        """
+        with self.busy_lock:
+            return self.busy.pop(key, 0.0)
+
+    def start(self):
+        if self.pool is not None:
+            self.pool.start()
+        for index, queue in enumerate(self.queues):
+            queue.closed = False
+            target = self.run if self.pool is None else self.run_pooled
+            thread = threading.Thread(target=target, args=(queue,), name=f"ingest-{index}", daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def apply_records(self, messages):
+        for message in messages:
+            try:
+                self.sink(message)
+            except Exception as e:
+                print(f"Error applying coalesced {message['channel']} updates: {e}")
+
+    def apply_batch(self, future, keys):
+        started = time.perf_counter()
+        try:
+            self.pool.apply(future)
+        except Exception as e:
+            print(f"Error applying parsed batch: {e}")
+        if keys:
+            self._add_busy(keys, time.perf_counter() - started)
+
+    def run(self, queue):
+        while True:
+            frames, received, keys, messages = queue.get(timeout=1.0)
+            for frame, received_at, key in zip(frames, received, keys):
+                started = time.perf_counter()
+                self.handle(frame, received_at)
+                self._add_busy((key,), time.perf_counter() - started)
+            if messages:
+                self.apply_records(messages)
+            queue.processed += len(frames) + sum(len(message["data"]) for message in messages)
+            if queue.closed and not (frames or messages) and not (queue.frames or queue.has_pending()):
+                return
+
+    def run_pooled(self, queue):
+        """
+        Worker loop when frames are parsed by the ParsePool: batches are submitted
+        as they are taken off the queue and applied in the same order. The time
+        spent waiting for and applying a batch counts as busy, spread over its
+        frames' connections.
+        """
+        inflight = deque()
+        while True:
+            # Apply results while the queue fills up again, or when enough batches are in flight
+            if inflight and (len(inflight) >= self.pool.max_inflight or not (queue.frames or queue.has_pending())):
+                self.apply_batch(*inflight.popleft())
+                continue
+            frames, received, keys, messages = queue.get(timeout=1.0)
+            if frames:
+                size = self.pool.chunk_size(len(frames))
+                futures = self.pool.submit(frames, received)
+                inflight.extend((future, keys[index * size:(index + 1) * size]) for index, future in enumerate(futures))
+            if messages:
+                # Coalesced records are newer than everything still in flight
+                while inflight:
+                    self.apply_batch(*inflight.popleft())
+                self.apply_records(messages)
+            queue.processed += len(frames) + sum(len(message["data"]) for message in messages)
+            if queue.closed and not (frames or messages or inflight) and not (queue.frames or queue.has_pending()):
+                return
+
+    def stop(self, timeout=5.0):
+        """
+        Lets the workers apply what is still queued, then stops them.
+        """
+        for queue in self.queues:
+            queue.close()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self.threads = []
+        if self.pool is not None:
+            self.pool.stop()
+
+    def metrics(self):
+        """
+        Returns queue depth and overflow counters summed over every queue.
+        """
+        return {
+            "depth": sum(len(queue) for queue in self.queues),
+            "pending": sum(len(queue.pending) + len(queue.pending_tickers) for queue in self.queues),
+            "max_depth": max(queue.max_depth for queue in self.queues),
+            "enqueued": sum(queue.enqueued for queue in self.queues),
+            "processed": sum(queue.processed for queue in self.queues),
+            "dropped": sum(queue.dropped for queue in self.queues),
+            "coalesced": sum(queue.coalesced for queue in self.queues),
+            "dropped_channels": self.dropped_channels(),
+        }
+
+    def dropped_channels(self):
+        """
+        Returns {channel: frames or records dropped} summed over every queue.
+        """
+        dropped = {}
+        for queue in self.queues:
+            for channel, count in queue.dropped_channels.items():
+                dropped[channel] = dropped.get(channel, 0) + count
+        return dropped
@@ -0,0 +1,301 @@
+import os
+import re
+import struct
+import threading
+import time
+import zipfile
+import numpy as np
+
+from candle_store import COLUMN_DTYPES
+
+# One fixed-size record per accepted candle update
+JOURNAL_DTYPE = np.dtype([
+    ("symbol_id", "<i4"),
+    ("kind", "<i4"),  # CANDLE, or REMOVED when the symbol was dropped from the store
+    ("interval_begin", "<i8"),
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("vwap", "<f8"),
+    ("volume", "<f8"),
+    ("trades", "<i8"),
+])
+RECORD = struct.Struct("<iiqq6dq")
+SEGMENT_PATTERN = re.compile(r"journal-(\d{8})\.bin$")
+
+# Kinds of journal records
+CANDLE = 0
+REMOVED = 1
+
+
+def fsync_directory(path):
+    """
+    Makes the entries of a directory durable, e.g. a file moved into it with os.replace.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CandleJournal:
+    """
+    Append-only journal of accepted candle updates with periodic snapshots,
+    used to bring the in-memory store back to full state after a restart.
+
+    Layout of `path`:
+        symbols.txt            one symbol per line, the line number is its id
+        journal-<segment>.bin  fixed-size JOURNAL_DTYPE records
+        snapshot.npz           every stored candle plus the segment it continues from
+
+    A snapshot starts a new segment and older segments are deleted once the
+    snapshot is on disk, so restore() reads one snapshot plus a short journal
+    tail, each in a single sequential read.
+
+    Args:
+    - path (str): Directory holding the journal.
+    - sync_interval (float): Seconds between flush + fsync of the journal.
+    - snapshot_interval (float): Seconds between snapshots.
+    """
+
+    def __init__(self, path="./journal", sync_interval=1.0, snapshot_interval=300.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(path, exist_ok=True)
+
+        self.symbols = self._load_symbols()
+        self.symbol_ids = {symbol: index for index, symbol in enumerate(self.symbols)}
+        self.symbols_file = open(os.path.join(path, "symbols.txt"), "a")
+
+        segments = self.segments()
+        self.segment = segments[-1] if segments else 0
+        segment_path = self._segment_path(self.segment)
+        if os.path.exists(segment_path):
+            # Drop a record cut short by a crash so new records stay aligned
+            size = os.path.getsize(segment_path)
+            os.truncate(segment_path, size - size % JOURNAL_DTYPE.itemsize)
+        self.file = open(segment_path, "ab")
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.store = None
+        self.records_written = 0
+        self.last_snapshot = time.monotonic()
+
+    def _load_symbols(self):
+        path = os.path.join(self.path, "symbols.txt")
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [line.rstrip("\n") for line in f]
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"journal-{segment:08d}.bin")
+
+    def segments(self):
+        """
+        Returns the segment numbers on disk in order.
+        """
+        return sorted(int(match.group(1)) for match in map(SEGMENT_PATTERN.match, os.listdir(self.path)) if match)
+
+    def _symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            # Written before any record that refers to it
+            self.symbols_file.write(symbol + "\n")
+            self.symbols_file.flush()
+        return symbol_id
+
+    def record(self, symbol, row, result=None):
+        """
+        Store listener: appends one accepted update to the journal.
+        """
+        with self.lock:
+            self.file.write(RECORD.pack(
+                self._symbol_id(symbol), CANDLE, row["interval_begin"], row["timestamp"], row["open"], row["high"],
+                row["low"], row["close"], row["vwap"], row["volume"], row["trades"]))
+            self.records_written += 1
+
+    def remove(self, symbols):
+        """
+        Journals that the given symbols were removed from the store (e.g. delisted),
+        so restore() drops the candles journaled for them before.
+        """
+        with self.lock:
+            for symbol in symbols:
+                self.file.write(RECORD.pack(self._symbol_id(symbol), REMOVED, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+
+    def sync(self):
+        """
+        Flush buffered records and fsync the journal.
+        """
+        with self.lock:
+            # Symbols first, so no record on disk refers to an id symbols.txt does not have
+            self.symbols_file.flush()
+            os.fsync(self.symbols_file.fileno())
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def snapshot(self, store):
+        """
+        Write every stored candle to snapshot.npz and start a new journal segment.
+        """
+        # Rotating under the store lock means the new segment holds exactly the
+        # updates that are not in the snapshot (replaying an update twice is harmless)
+        with store.lock:
+            with self.lock:
+                self.symbols_file.flush()
+                os.fsync(self.symbols_file.fileno())
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.segment += 1
+                self.file = open(self._segment_path(self.segment), "ab")
+            columns = store._collect(sorted(store.buffers))
+
+        arrays = {"segment": np.array(self.segment)}
+        if columns is not None:
+            with self.lock:
+                symbol_ids = np.array([self._symbol_id(symbol) for symbol in columns.pop("symbol")], dtype=np.int32)
+                os.fsync(self.symbols_file.fileno())
+            arrays.update(columns, symbol_id=symbol_ids)
+
+        # The snapshot must be on disk before the segments it replaces are removed
+        temp_path = os.path.join(self.path, "snapshot.tmp.npz")
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, os.path.join(self.path, "snapshot.npz"))
+        fsync_directory(self.path)
+
+        for segment in self.segments():
+            if segment < self.segment:
+                os.remove(self._segment_path(segment))
+        self.last_snapshot = time.monotonic()
+
+    def _symbols_of(self, symbol_ids):
+        if len(symbol_ids) and (symbol_ids.min() < 0 or symbol_ids.max() >= len(self.symbols)):
+            raise IndexError(f"symbol id {int(symbol_ids.max())} is missing from symbols.txt "
+                             f"({len(self.symbols)} symbols)")
+        return np.array(self.symbols, dtype=object)[symbol_ids]
+
+    def _columns(self, records):
+        columns = {name: records[name] for name in COLUMN_DTYPES}
+        columns["symbol"] = self._symbols_of(records["symbol_id"])
+        return columns
+
+    def _load_snapshot(self, snapshot_path):
+        """
+        Returns (columns or None, first journal segment after the snapshot).
+        """
+        with np.load(snapshot_path, allow_pickle=False) as snapshot:
+            first_segment = int(snapshot["segment"])
+            if "symbol_id" not in snapshot:
+                return None, first_segment
+            columns = {name: snapshot[name] for name in COLUMN_DTYPES}
+            columns["symbol"] = self._symbols_of(snapshot["symbol_id"])
+        return columns, first_segment
+
+    def restore(self, store):
+        """
+        Rebuild the store from the snapshot and the journal segments written after it.
+        Call before attach() so the replayed updates are not journaled again.
+
+        A snapshot that cannot be read (or refers to symbols symbols.txt does
+        not have) is ignored and every segment still on disk is replayed
+        instead. Records of unknown symbols are skipped.
+
+        Returns:
+        - int: Number of candle updates replayed.
+        """
+        started = time.monotonic()
+        replayed = 0
+        first_segment = 0
+
+        snapshot_path = os.path.join(self.path, "snapshot.npz")
+        if os.path.exists(snapshot_path):
+            try:
+                columns, first_segment = self._load_snapshot(snapshot_path)
+            except (OSError, EOFError, ValueError, KeyError, IndexError, zipfile.BadZipFile) as e:
+                print(f"Ignoring unreadable journal snapshot {snapshot_path}: {e}")
+                columns, first_segment = None, 0
+            if columns is not None:
+                store.upsert_columns(columns)
+                replayed += len(columns["symbol"])
+
+        with self.lock:
+            self.file.flush()
+        for segment in self.segments():
+            if segment < first_segment:
+                continue
+            # A record cut short by a crash is ignored
+            path = self._segment_path(segment)
+            count = os.path.getsize(path) // JOURNAL_DTYPE.itemsize
+            records = np.fromfile(path, dtype=JOURNAL_DTYPE, count=count)
+            known = (records["symbol_id"] >= 0) & (records["symbol_id"] < len(self.symbols))
+            if not known.all():
+                print(f"Skipping {int((~known).sum())} journal records of unknown symbols in {path}")
+                records = records[known]
+            # Replay the candles between removals in blocks, applying every removal in order
+            removals = np.flatnonzero(records["kind"] == REMOVED)
+            start = 0
+            for stop in removals.tolist() + [len(records)]:
+                if stop > start:
+                    store.upsert_columns(self._columns(records[start:stop]))
+                    replayed += stop - start
+                if stop < len(records):
+                    store.remove([self.symbols[records["symbol_id"][stop]]])
+                start = stop + 1
+
+        print(f"Restored {replayed} candle updates for {len(store.symbols())} pairs "
+              f"in {time.monotonic() - started:.2f}s")
+        return replayed
+
+    def attach(self, store):
+        """
+        Journal every accepted update of the store from now on.
+        """
+        self.store = store
+        store.add_listener(self.record)
+
+    def start(self, store):
+        """
+        Attach to the store and sync/snapshot from a background thread.
+        """
+        self.attach(store)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="journal", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.sync_interval):
+            try:
+                if time.monotonic() - self.last_snapshot >= self.snapshot_interval:
+                    self.snapshot(self.store)
+                else:
+                    self.sync()
+            except Exception as e:
+                print(f"Journal error: {e}")
+
+    def stop(self, snapshot=True):
+        """
+        Stop the background thread, take a final snapshot and close the journal.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if snapshot and self.store is not None:
+            self.snapshot(self.store)
+        if self.store is not None:
+            self.store.remove_listener(self.record)
+        with self.lock:
+            self.file.close()
+        self.symbols_file.close()
@@ -0,0 +1,531 @@
+"""
+Local stand-in for Kraken's v2 WebSocket API (wss://ws.kraken.com/v2).
+
+Speaks the v2 'subscribe'/'unsubscribe' requests for the 'ohlc' and 'book'
+channels and answers with per-symbol acks, a snapshot per symbol and then a
+stream of update messages. Heartbeats are sent every second and 'ping' is
+answered with 'pong'. Candles are synthesized by replaying the per-pair files
+in crypto_data/, books by a random walk around each pair's last close, with
+Kraken's CRC32 checksum on every book message.
+
+The REST OHLC and AssetPairs endpoints (/0/public/OHLC, /0/public/AssetPairs)
+are served on the same port, so the reconnect backfill and the book checksums
+can be exercised too. With --drop-after every connection is
+closed after that many seconds and --drop-gap candles of its pairs are skipped,
+leaving a gap the client has to backfill.
+
+Point the handler at it with:
+    WebSocketHandler(websocket_url="ws://127.0.0.1:8765", rest_url="http://127.0.0.1:8765")
+
+Usage:
+    python kraken_simulator.py --rate 500 --symbols 200 --shape burst
+    python kraken_simulator.py --symbols 20 --drop-after 30 --drop-gap 15
+    python kraken_simulator.py --symbols 50 --book-rate 2000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from candle_store import to_nanos, format_nanos
+from order_book import book_checksum
+from rest_client import rest_pair_name
+
+MINUTE_NS = 60 * 1_000_000_000
+SHAPES = ("steady", "poisson", "burst")
+
+
+def kraken_time():
+    """
+    Current time in the format Kraken uses for time_in/time_out.
+    """
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class CandleReplay:
+    """
+    Replays the updates stored for one symbol in chronological order.
+    When the file runs out it starts over, shifted forward in time, so
+    interval_begin keeps advancing like a live feed.
+    """
+
+    def __init__(self, symbol, df):
+        # Older files were written newest first
+        if to_nanos(df["interval_begin"].iloc[0]) > to_nanos(df["interval_begin"].iloc[-1]):
+            df = df.iloc[::-1].reset_index(drop=True)
+        self.symbol = symbol
+        self.values = df[["open", "high", "low", "close", "trades", "volume", "vwap"]].to_numpy()
+        self.interval_begin = np.array([to_nanos(value) for value in df["interval_begin"]], dtype=np.int64)
+        self.interval = int(df["interval"].iloc[0])
+        span = int(self.interval_begin[-1] - self.interval_begin[0])
+        self.cycle_ns = span - span % MINUTE_NS + MINUTE_NS
+        self.position = 0
+        self.cycle = 0
+
+    def record(self, index, shift):
+        open_, high, low, close, trades, volume, vwap = self.values[index]
+        interval_begin = self.interval_begin[index] + shift
+        return {
+            "symbol": self.symbol,
+            "open": float(open_),
+            "high": float(high),
+            "low": float(low),
+            "close": float(close),
+            "trades": int(trades),
+            "volume": float(volume),
+            "vwap": float(vwap),
+            "interval_begin": str(format_nanos([interval_begin], unit="ns")[0]),
+            "interval": self.interval,
+            "timestamp": str(format_nanos([interval_begin + self.interval * MINUTE_NS], unit="us")[0]),
+        }
+
+    def snapshot(self, depth=10):
+        """
+        Latest update of the last `depth` candles before the current position.
+        """
+        shift = self.cycle * self.cycle_ns
+        end = max(self.position, 1)
+        begins = self.interval_begin[:end]
+        # Index of the last update of every candle
+        last = np.flatnonzero(np.append(begins[1:] != begins[:-1], True))[-depth:]
+        return [self.record(index, shift) for index in last]
+
+    def ohlc(self, since=None, count=720):
+        """
+        REST style OHLC rows ([time, open, high, low, close, vwap, volume, count])
+        of the candles replayed so far, newest last. `since` is in seconds.
+        """
+        begins = self.interval_begin
+        # Index of the last update of every candle within one cycle
+        last = np.flatnonzero(np.append(begins[1:] != begins[:-1], True))
+        rows = []
+        for cycle in range(max(self.cycle - count // len(last) - 1, 0), self.cycle + 1):
+            for index in last:
+                if cycle == self.cycle and index >= self.position:
+                    # The open candle only has the updates sent so far
+                    if self.position and begins[self.position - 1] == begins[index]:
+                        index = self.position - 1
+                    else:
+                        break
+                time_ = int((begins[index] + cycle * self.cycle_ns) // 1_000_000_000)
+                if since is not None and time_ <= since:
+                    continue
+                open_, high, low, close, trades, volume, vwap = self.values[index]
+                rows.append([time_, str(open_), str(high), str(low), str(close), str(vwap), str(volume),
+                             int(trades)])
+        return rows[-count:]
+
+    def skip(self, candles):
+        """
+        Moves past the next `candles` candles without sending them, like a feed that was missed.
+        """
+        for _ in range(candles):
+            begin = self.next_record()["interval_begin"]
+            while self.record(self.position, self.cycle * self.cycle_ns)["interval_begin"] == begin:
+                self.next_record()
+
+    def next_record(self):
+        record = self.record(self.position, self.cycle * self.cycle_ns)
+        self.position += 1
+        if self.position == len(self.values):
+            self.position = 0
+            self.cycle += 1
+        return record
+
+
+def price_decimals(price):
+    """
+    Price precision giving about five significant digits, like most Kraken pairs.
+    """
+    return min(max(4 - math.floor(math.log10(price)), 0), 10) if price > 0 else 4
+
+
+class BookReplay:
+    """
+    Synthetic L2 book of one symbol: `depth` levels per side on a tick grid
+    around `mid`. Every update changes a level's quantity, removes a level
+    (and fills the side back up) or adds a level inside the book, which pushes
+    the worst one out like Kraken's truncation to the subscribed depth.
+    """
+
+    def __init__(self, symbol, mid, depth=10, seed=None):
+        self.symbol = symbol
+        self.depth = depth
+        self.price_decimals = price_decimals(mid)
+        self.qty_decimals = 8
+        self.random = random.Random(seed)
+        self.tick = 10 ** -self.price_decimals
+        center = round(mid / self.tick)
+        self.bids = {}  # Price in ticks -> qty
+        self.asks = {}
+        for level in range(1, depth + 1):
+            self.bids[center - level] = self.qty()
+            self.asks[center + level] = self.qty()
+
+    def qty(self):
+        return round(self.random.uniform(0.01, 50), self.qty_decimals)
+
+    def price(self, ticks):
+        return round(ticks * self.tick, self.price_decimals)
+
+    def levels(self, side, descending):
+        return [{"price": self.price(ticks), "qty": side[ticks]}
+                for ticks in sorted(side, reverse=descending)[:self.depth]]
+
+    def checksum(self):
+        asks = self.levels(self.asks, False)
+        bids = self.levels(self.bids, True)
+        return book_checksum(np.array([level["price"] for level in asks]), np.array([level["qty"] for level in asks]),
+                             np.array([level["price"] for level in bids]), np.array([level["qty"] for level in bids]),
+                             self.price_decimals, self.qty_decimals)
+
+    def snapshot(self):
+        return {"symbol": self.symbol, "bids": self.levels(self.bids, True), "asks": self.levels(self.asks, False),
+                "checksum": self.checksum()}
+
+    def next_update(self):
+        is_bid = self.random.random() < 0.5
+        side, other = (self.bids, self.asks) if is_bid else (self.asks, self.bids)
+        worst = min(side) if is_bid else max(side)
+        inner = min(other) if is_bid else max(other)
+        action = self.random.random()
+        changes = []
+        if action < 0.6:
+            ticks = self.random.choice(list(side))
+            side[ticks] = self.qty()
+            changes.append((ticks, side[ticks]))
+        elif action < 0.8:
+            # Remove a level and refill the side beyond its worst level
+            ticks = self.random.choice(list(side))
+            del side[ticks]
+            changes.append((ticks, 0))
+            refill = worst - self.random.randint(1, 3) if is_bid else worst + self.random.randint(1, 3)
+            if ticks == worst:
+                refill = worst - 1 if is_bid else worst + 1
+            side[refill] = self.qty()
+            changes.append((refill, side[refill]))
+        else:
+            # New level between the worst level and the other side, pushing the worst one out
+            low, high = (worst + 1, inner - 1) if is_bid else (inner + 1, worst - 1)
+            free = [ticks for ticks in range(low, high + 1) if ticks not in side]
+            ticks = self.random.choice(free) if free else self.random.choice(list(side))
+            side[ticks] = self.qty()
+            changes.append((ticks, side[ticks]))
+            if free:
+                del side[worst]
+        levels = [{"price": self.price(ticks), "qty": qty} for ticks, qty in changes]
+        return {"symbol": self.symbol, "bids": levels if is_bid else [], "asks": [] if is_bid else levels,
+                "checksum": self.checksum(), "timestamp": kraken_time()}
+
+
+def load_replays(path="./crypto_data", max_symbols=None):
+    """
+    Loads a CandleReplay for every file in crypto_data/, keyed by symbol.
+    """
+    replays = {}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith("_data.csv"):
+            continue
+        df = pd.read_csv(os.path.join(path, name))
+        if df.empty:
+            continue
+        symbol = df["symbol"].iloc[0]
+        replays[symbol] = CandleReplay(symbol, df)
+        if max_symbols and len(replays) >= max_symbols:
+            break
+    return replays
+
+
+class KrakenSimulator:
+    """
+    WebSocket server that imitates Kraken's v2 'ohlc' and 'book' channels.
+
+    Args:
+    - rate (float): Update messages per second on each connection.
+    - max_symbols (int): Only load this many pairs from crypto_data/.
+    - shape (str): 'steady' (even spacing), 'poisson' (random arrivals) or
+      'burst' (rate * burst_factor for burst_length seconds every burst_period seconds).
+    - batch (int): Candle records per update message.
+    - drop_after (float): Close every connection after this many seconds.
+    - drop_gap (int): Candles of each subscribed pair skipped when a connection is dropped.
+    - rest_rate (float): REST calls per second before answering 'EGeneral:Too many requests'
+      (a counter of rest_burst calls decaying at rest_rate, like Kraken's).
+    - book_rate (float): Book update messages per second on each connection with book subscriptions.
+    """
+
+    def __init__(self, data_path="./crypto_data", host="127.0.0.1", port=8765, rate=100.0,
+                 max_symbols=None, shape="steady", batch=1, burst_factor=10.0, burst_length=1.0,
+                 burst_period=60.0, heartbeat_interval=1.0, snapshot_depth=10, drop_after=None, drop_gap=0,
+                 rest_rate=None, rest_burst=15, book_rate=100.0):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown burst shape '{shape}', expected one of {SHAPES}")
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.shape = shape
+        self.batch = batch
+        self.burst_factor = burst_factor
+        self.burst_length = burst_length
+        self.burst_period = burst_period
+        self.heartbeat_interval = heartbeat_interval
+        self.snapshot_depth = snapshot_depth
+        self.drop_after = drop_after
+        self.drop_gap = drop_gap
+        self.replays = load_replays(data_path, max_symbols)
+        self.rest_names = {rest_pair_name(symbol): symbol for symbol in self.replays}
+        self.rest_rate = rest_rate
+        self.rest_burst = rest_burst
+        self.rest_counter = 0.0
+        self.rest_updated = time.monotonic()
+        self.rest_calls = 0
+        self.rest_throttled = 0
+        self.book_rate = book_rate
+        self.connection_ids = itertools.count(1)
+        self.sent = 0
+
+    def delay(self, started):
+        """
+        Seconds to wait before the next update message.
+        """
+        rate = self.rate
+        if self.shape == "burst" and (time.monotonic() - started) % self.burst_period < self.burst_length:
+            rate *= self.burst_factor
+        if self.shape == "poisson":
+            return random.expovariate(rate)
+        return 1 / rate
+
+    async def send(self, ws, message):
+        await ws.send(json.dumps(message))
+        self.sent += 1
+
+    async def heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self.send(ws, {"channel": "heartbeat"})
+
+    async def stream(self, ws, subscribed):
+        """
+        Send update messages for the subscribed symbols, round-robin.
+        """
+        started = time.monotonic()
+        due = started
+        while True:
+            symbols = list(subscribed)
+            if not symbols:
+                await asyncio.sleep(0.1)
+                due = time.monotonic()
+                continue
+            for start in range(0, len(symbols), self.batch):
+                records = [self.replays[symbol].next_record() for symbol in symbols[start:start + self.batch]
+                           if symbol in subscribed]
+                if records:
+                    await self.send(ws, {"channel": "ohlc", "type": "update", "timestamp": kraken_time(),
+                                         "data": records})
+                # Sleep until the next message is due, catching up without sleeping when behind
+                due += self.delay(started)
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+    async def book_stream(self, ws, books):
+        """
+        Send book update messages for the subscribed books, one symbol per message, round-robin.
+        """
+        due = time.monotonic()
+        while True:
+            symbols = list(books)
+            if not symbols:
+                await asyncio.sleep(0.1)
+                due = time.monotonic()
+                continue
+            for symbol in symbols:
+                book = books.get(symbol)
+                if book is not None:
+                    await self.send(ws, {"channel": "book", "type": "update", "data": [book.next_update()]})
+                due += 1 / self.book_rate
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+    def book_mid(self, symbol):
+        # The first close, so a pair's precision (see asset_pairs()) never changes
+        return float(self.replays[symbol].values[0][3])
+
+    async def subscribe_books(self, ws, request, books):
+        params = request.get("params", {})
+        depth = params.get("depth", 10)
+        for symbol in params.get("symbol", []):
+            ack = {"method": "subscribe", "req_id": request.get("req_id"),
+                   "time_in": kraken_time(), "time_out": kraken_time()}
+            if symbol not in self.replays:
+                ack.update(success=False, symbol=symbol, error=f"Currency pair not supported {symbol}")
+                await self.send(ws, ack)
+                continue
+            ack.update(success=True, result={"channel": "book", "depth": depth, "snapshot": True, "symbol": symbol})
+            await self.send(ws, ack)
+            book = BookReplay(symbol, self.book_mid(symbol), depth, seed=random.random())
+            await self.send(ws, {"channel": "book", "type": "snapshot", "data": [book.snapshot()]})
+            books[symbol] = book
+
+    async def subscribe(self, ws, request, subscribed, books):
+        params = request.get("params", {})
+        if params.get("channel") == "book":
+            await self.subscribe_books(ws, request, books)
+            return
+        if params.get("channel") != "ohlc":
+            await self.send(ws, {"method": "subscribe", "success": False, "req_id": request.get("req_id"),
+                                 "error": f"Channel {params.get('channel')} not supported",
+                                 "time_in": kraken_time(), "time_out": kraken_time()})
+            return
+        for symbol in params.get("symbol", []):
+            ack = {"method": "subscribe", "req_id": request.get("req_id"),
+                   "time_in": kraken_time(), "time_out": kraken_time()}
+            if symbol not in self.replays:
+                ack.update(success=False, symbol=symbol, error=f"Currency pair not supported {symbol}")
+                await self.send(ws, ack)
+                continue
+            ack.update(success=True, result={"channel": "ohlc", "interval": params.get("interval", 1),
+                                             "snapshot": True, "symbol": symbol})
+            await self.send(ws, ack)
+            await self.send(ws, {"channel": "ohlc", "type": "snapshot", "timestamp": kraken_time(),
+                                 "data": self.replays[symbol].snapshot(self.snapshot_depth)})
+            subscribed[symbol] = True
+
+    async def unsubscribe(self, ws, request, subscribed, books):
+        params = request.get("params", {})
+        channel = params.get("channel", "ohlc")
+        for symbol in params.get("symbol", []):
+            found = (books if channel == "book" else subscribed).pop(symbol, None) is not None
+            ack = {"method": "unsubscribe", "success": found, "req_id": request.get("req_id"),
+                   "time_in": kraken_time(), "time_out": kraken_time()}
+            if found and channel == "book":
+                ack["result"] = {"channel": "book", "depth": params.get("depth", 10), "symbol": symbol}
+            elif found:
+                ack["result"] = {"channel": "ohlc", "interval": params.get("interval", 1), "symbol": symbol}
+            else:
+                ack.update(symbol=symbol, error="Subscription Not Found")
+            await self.send(ws, ack)
+
+    async def drop(self, ws, subscribed):
+        """
+        Close the connection after drop_after seconds, skipping drop_gap candles of its pairs.
+        """
+        await asyncio.sleep(self.drop_after)
+        for symbol in list(subscribed):
+            self.replays[symbol].skip(self.drop_gap)
+        await ws.close(1011, "simulated drop")
+
+    def asset_pairs(self):
+        """
+        AssetPairs result for the simulated pairs, with the precisions their books use.
+        """
+        return {rest_pair_name(symbol): {"altname": rest_pair_name(symbol), "wsname": symbol,
+                                         "pair_decimals": price_decimals(self.book_mid(symbol)), "lot_decimals": 8}
+                for symbol in self.replays}
+
+    def process_request(self, connection, request):
+        """
+        Answers REST OHLC and AssetPairs requests, everything else goes on to the WebSocket handshake.
+        """
+        url = urlsplit(request.path)
+        if url.path == "/0/public/AssetPairs":
+            response = connection.respond(HTTPStatus.OK, json.dumps({"error": [], "result": self.asset_pairs()}))
+            response.headers["Content-Type"] = "application/json"
+            return response
+        if url.path != "/0/public/OHLC":
+            return None
+        query = parse_qs(url.query)
+        pair = query.get("pair", [""])[0]
+        symbol = self.rest_names.get(pair)
+        self.rest_calls += 1
+        if self.rest_rate:
+            now = time.monotonic()
+            self.rest_counter = max(0.0, self.rest_counter - (now - self.rest_updated) * self.rest_rate)
+            self.rest_updated = now
+            self.rest_counter += 1
+        if self.rest_rate and self.rest_counter > self.rest_burst:
+            self.rest_throttled += 1
+            body = {"error": ["EGeneral:Too many requests"]}
+        elif symbol is None:
+            body = {"error": ["EQuery:Unknown asset pair"]}
+        else:
+            since = int(query["since"][0]) if "since" in query else None
+            rows = self.replays[symbol].ohlc(since)
+            body = {"error": [], "result": {pair: rows, "last": rows[-1][0] if rows else since or 0}}
+        response = connection.respond(HTTPStatus.OK, json.dumps(body))
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    async def handle(self, ws):
+        """
+        Serve a single client connection.
+        """
+        # Dict used as an insertion-ordered set of subscribed symbols
+        subscribed = {}
+        books = {}  # Symbol -> BookReplay of this connection
+        tasks = [asyncio.create_task(self.heartbeat(ws)), asyncio.create_task(self.stream(ws, subscribed)),
+                 asyncio.create_task(self.book_stream(ws, books))]
+        if self.drop_after:
+            tasks.append(asyncio.create_task(self.drop(ws, subscribed)))
+        try:
+            await self.send(ws, {"channel": "status", "type": "update", "data": [{
+                "api_version": "v2", "connection_id": next(self.connection_ids),
+                "system": "online", "version": "2.0.0"}]})
+            async for message in ws:
+                request = json.loads(message)
+                method = request.get("method")
+                if method == "subscribe":
+                    await self.subscribe(ws, request, subscribed, books)
+                elif method == "unsubscribe":
+                    await self.unsubscribe(ws, request, subscribed, books)
+                elif method == "ping":
+                    await self.send(ws, {"method": "pong", "req_id": request.get("req_id"),
+                                         "time_in": kraken_time(), "time_out": kraken_time()})
+        except ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def serve_forever(self):
+        async with serve(self.handle, self.host, self.port, max_size=None, process_request=self.process_request):
+            print(f"Simulating Kraken v2 on ws://{self.host}:{self.port} with {len(self.replays)} pairs")
+            await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-path", default="./crypto_data")
+    parser.add_argument("--rate", type=float, default=100.0, help="update messages/sec per connection")
+    parser.add_argument("--symbols", type=int, default=None, help="number of pairs to load from crypto_data/")
+    parser.add_argument("--shape", choices=SHAPES, default="steady", help="burst shape of the update stream")
+    parser.add_argument("--batch", type=int, default=1, help="candle records per update message")
+    parser.add_argument("--burst-factor", type=float, default=10.0)
+    parser.add_argument("--burst-length", type=float, default=1.0, help="seconds")
+    parser.add_argument("--burst-period", type=float, default=60.0, help="seconds")
+    parser.add_argument("--drop-after", type=float, default=None, help="close connections after this many seconds")
+    parser.add_argument("--drop-gap", type=int, default=0, help="candles per pair skipped on every drop")
+    parser.add_argument("--rest-rate", type=float, default=None, help="REST calls/sec before throttling")
+    parser.add_argument("--book-rate", type=float, default=100.0, help="book update messages/sec per connection")
+    args = parser.parse_args()
+
+    simulator = KrakenSimulator(
+        data_path=args.data_path, host=args.host, port=args.port, rate=args.rate,
+        max_symbols=args.symbols, shape=args.shape, batch=args.batch, burst_factor=args.burst_factor,
+        burst_length=args.burst_length, burst_period=args.burst_period, drop_after=args.drop_after,
+        drop_gap=args.drop_gap, rest_rate=args.rest_rate, book_rate=args.book_rate,
+    )
+    try:
+        asyncio.run(simulator.serve_forever())
+    except KeyboardInterrupt:
+        print("Simulator stopped.")
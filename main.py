@@ -24,10 +24,21 @@
 
 import time
 import logging
+import threading
 from fetch_pairs import WebSocketHandler
-from data_operations import convert_to_csv, limit_symbol_instances
-import pandas as pd
-from kraken_pairs import kraken_pairs
+from backfill import prime_history
+from persistence import make_writer, BackgroundFlusher
+from journal import CandleJournal
+from rollup import CandleRollup
+from indicators import IndicatorEngine
+from cross_rates import CrossRates
+from panel import UniversePanel
+from pair_registry import get_registry
+from universe_refresher import UniverseRefresher
+
+# 'csv' (one file per pair in crypto_data/), 'parquet'/'arrow' (partitioned by date in parquet_data/)
+# or 'candles' (fixed-record files per pair in candle_data/)
+STORAGE_BACKEND = "csv"
 
 # Configure logging
 logging.basicConfig(filename="error_logs.log", 
@@ -35,23 +46,76 @@ logging.basicConfig(filename="error_logs.log",
                     format="%(asctime)s - %(levelname)s - %(message)s")
 
 if __name__ == "__main__":
-    num_pairs = len(kraken_pairs[0]) + len(kraken_pairs[1])
+    num_pairs = len(get_registry())
     print("Initializing WebSocketHandler...")
     handler = WebSocketHandler()
+    # Writes only the symbols changed since the last flush, off the main thread
+    writer = make_writer("csv", durable=True) if STORAGE_BACKEND == "csv" else make_writer(STORAGE_BACKEND)
+    flusher = BackgroundFlusher(handler.store, writer, flush_interval=1.0, max_latency=5.0)
+
+    # Warm restart: rebuild the store from the last snapshot and journal before connecting
+    journal = CandleJournal(snapshot_interval=300.0)
+    try:
+        journal.restore(handler.store)
+    except Exception as e:
+        # Collect from an empty store rather than not at all
+        logging.error("Journal restore failed", exc_info=True)
+        print(f"Journal restore failed, starting with an empty store: {e}")
+        handler.store.remove(handler.store.symbols())
+    journal.start(handler.store)
+
+    # 5m/15m/1h/4h/1d candles derived from the 1-minute stream (rollup.tiers)
+    rollup = CandleRollup(handler.store)
+    rollup.start()
+
+    # EMA/RSI/ATR/VWAP/Bollinger of every pair, updated with every candle (indicators.values)
+    indicators = IndicatorEngine()
+    indicators.attach(handler.store)
+
+    # USD price of every asset through its most liquid conversion path (cross_rates.prices())
+    cross_rates = CrossRates(handler.store, numeraire="USD")
+    cross_rates.start()
+
+    # Last day of closes/volumes as symbols x minutes matrices (panel.values("close"))
+    panel = UniversePanel(window=1440, fields=["close", "volume"])
+    panel.load()
+    panel.attach(handler.store)
+
+    # Follow listings and delistings hourly, touching only the connections that carry them
+    refresher = UniverseRefresher(handler, period=3600.0, flusher=flusher,
+                                  evict=[rollup, indicators, cross_rates, panel, journal])
+
+    # Load the last hour of every pair through the shared, rate-limited REST client
+    pairs = [pair for pair_group in handler.connections for pair in pair_group]
+    primer = threading.Thread(target=prime_history, name="primer", daemon=True,
+                              args=(handler.store, handler.rest_client, pairs, 60, handler.stop_event))
     
     try:
         handler.start_websockets()
+        primer.start()
+        refresher.start()
         while True:
-            if len(handler.ohlc_data) * 60 >= num_pairs:
-                handler.ohlc_data = limit_symbol_instances(handler.ohlc_data)
-                convert_to_csv(handler.ohlc_data)
+            # The store keeps one row per candle, at most 60 per symbol
+            if not flusher.running and len(handler.store) * 60 >= num_pairs:
+                flusher.start()
                 # print("updating the csv data")
 
             time.sleep(1)  # Keep the main thread alive
 
     except KeyboardInterrupt:
         print("Keyboard interrupt received. Shutting down...")
+        refresher.stop()
         handler.stop_websockets()
+        if flusher.running:
+            flusher.stop()
+        journal.stop()
+        rollup.stop()
+        indicators.detach()
+        cross_rates.stop()
+        panel.detach()
+        print(f"Flush metrics: {flusher.metrics()}")
+        print(f"REST metrics: {handler.rest_client.metrics()}")
+        print(f"Ingest metrics: {handler.ingest.metrics()}")
 
     except Exception as e:
         logging.error("An error occurred", exc_info=True)
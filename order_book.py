@@ -0,0 +1,328 @@
+import threading
+import zlib
+import numpy as np
+
+from pair_registry import v2_symbol
+
+# Levels per side that go into Kraken's book checksum
+CHECKSUM_LEVELS = 10
+
+
+def format_level(value, decimals):
+    """
+    A price or quantity as it goes into the checksum: fixed to the pair's
+    precision, without the decimal point and leading zeros (0.05005 -> '5005').
+    """
+    return f"{value:.{decimals}f}".replace(".", "").lstrip("0")
+
+
+def book_checksum(ask_prices, ask_qtys, bid_prices, bid_qtys, price_decimals, qty_decimals):
+    """
+    Kraken's CRC32 of the top 10 asks (lowest first) followed by the top 10 bids
+    (highest first), every level as its formatted price then quantity.
+    """
+    parts = []
+    for prices, qtys in ((ask_prices, ask_qtys), (bid_prices, bid_qtys)):
+        for price, qty in zip(prices[:CHECKSUM_LEVELS].tolist(), qtys[:CHECKSUM_LEVELS].tolist()):
+            parts.append(format_level(price, price_decimals))
+            parts.append(format_level(qty, qty_decimals))
+    return zlib.crc32("".join(parts).encode())
+
+
+def book_precisions(asset_pairs):
+    """
+    Price and quantity decimals of every pair in an AssetPairs result, keyed by
+    its wsname ('XBT/USD') and its v2 WebSocket name ('BTC/USD').
+
+    Returns:
+    - dict: {symbol: (price_decimals, qty_decimals)}
+    """
+    precisions = {}
+    for pair in asset_pairs.values():
+        wsname = pair.get("wsname")
+        if not wsname or "pair_decimals" not in pair or "lot_decimals" not in pair:
+            continue
+        precision = (int(pair["pair_decimals"]), int(pair["lot_decimals"]))
+        precisions[wsname] = precision
+        precisions[v2_symbol(wsname)] = precision
+    return precisions
+
+
+class BookSide:
+    """
+    One side of a book: up to `capacity` price levels in preallocated arrays,
+    best level first. Levels are found with a binary search on `keys` (the
+    price, negated for bids so both sides are ascending) and inserted or
+    removed by shifting the levels behind them.
+
+    `text` holds every level formatted for the checksum, so a checksum only
+    formats the levels that changed.
+    """
+
+    def __init__(self, capacity=10, descending=False):
+        self.capacity = capacity
+        self.sign = -1.0 if descending else 1.0
+        self.keys = np.zeros(capacity, dtype=np.float64)
+        self.prices = np.zeros(capacity, dtype=np.float64)
+        self.qtys = np.zeros(capacity, dtype=np.float64)
+        self.text = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+        self.text = []
+
+    def apply(self, price, qty, text=None):
+        """
+        Sets the quantity at a price level, removing the level when qty is 0.
+        A new level beyond the worst one of a full side is dropped, and a new
+        level inside it pushes the worst one out (Kraken's truncation to depth).
+        `text` is the level formatted for the checksum.
+        """
+        key = self.sign * price
+        size = self.size
+        index = int(np.searchsorted(self.keys[:size], key))
+        found = index < size and self.keys[index] == key
+        if qty == 0:
+            if found:
+                for column in (self.keys, self.prices, self.qtys):
+                    column[index:size - 1] = column[index + 1:size]
+                del self.text[index]
+                self.size -= 1
+        elif found:
+            self.qtys[index] = qty
+            self.text[index] = text
+        elif index < self.capacity:
+            end = min(size, self.capacity - 1)
+            for column in (self.keys, self.prices, self.qtys):
+                column[index + 1:end + 1] = column[index:end]
+            self.keys[index] = key
+            self.prices[index] = price
+            self.qtys[index] = qty
+            self.text.insert(index, text)
+            del self.text[end + 1:]
+            self.size = end + 1
+
+    def best(self):
+        """
+        Returns (price, qty) of the best level, or None when the side is empty.
+        """
+        if self.size == 0:
+            return None
+        return float(self.prices[0]), float(self.qtys[0])
+
+    def depth(self, levels=None):
+        """
+        Returns (prices, qtys) of the best `levels` levels as views, best first.
+        """
+        end = self.size if levels is None else min(levels, self.size)
+        return self.prices[:end], self.qtys[:end]
+
+
+class OrderBook:
+    """
+    L2 book of one pair from Kraken's v2 'book' channel.
+
+    Snapshots replace the book, updates set or remove levels, and after every
+    message the book is checked against the message's CRC32 checksum. Without
+    the pair's precisions the checksum cannot be rebuilt and is not checked.
+
+    Args:
+    - symbol (str): Pair name.
+    - depth (int): Subscribed depth, the levels kept per side.
+    - price_decimals, qty_decimals (int): Precision of the pair's prices and quantities.
+    """
+
+    def __init__(self, symbol, depth=10, price_decimals=None, qty_decimals=None):
+        self.symbol = symbol
+        self.levels = depth
+        self.bids = BookSide(depth, descending=True)
+        self.asks = BookSide(depth)
+        self.price_decimals = price_decimals
+        self.qty_decimals = qty_decimals
+        self.valid = False  # False until a snapshot arrives and after a checksum mismatch
+        self.timestamp = None
+
+        self.updates = 0
+        self.mismatches = 0
+
+    def _format(self, price, qty):
+        if self.price_decimals is None or self.qty_decimals is None:
+            return None
+        return format_level(price, self.price_decimals) + format_level(qty, self.qty_decimals)
+
+    def set_precisions(self, price_decimals, qty_decimals):
+        self.price_decimals = price_decimals
+        self.qty_decimals = qty_decimals
+        for side in (self.bids, self.asks):
+            side.text = [self._format(price, qty)
+                         for price, qty in zip(side.prices[:side.size].tolist(), side.qtys[:side.size].tolist())]
+
+    def _apply_levels(self, entry):
+        for level in entry.get("bids", ()):
+            self.bids.apply(level["price"], level["qty"], self._format(level["price"], level["qty"]))
+        for level in entry.get("asks", ()):
+            self.asks.apply(level["price"], level["qty"], self._format(level["price"], level["qty"]))
+        self.timestamp = entry.get("timestamp", self.timestamp)
+        self.updates += 1
+
+    def checksum(self):
+        """
+        CRC32 of the book as Kraken computes it, see book_checksum().
+        """
+        return zlib.crc32(("".join(self.asks.text[:CHECKSUM_LEVELS]) +
+                           "".join(self.bids.text[:CHECKSUM_LEVELS])).encode())
+
+    def verify(self, expected):
+        """
+        Compares the book with a message's checksum. Returns False on a mismatch.
+        """
+        if expected is None or self.price_decimals is None or self.qty_decimals is None:
+            return True
+        if self.checksum() != expected:
+            self.valid = False
+            self.mismatches += 1
+            return False
+        return True
+
+    def apply_snapshot(self, entry):
+        self.bids.clear()
+        self.asks.clear()
+        self._apply_levels(entry)
+        self.valid = True
+        return self.verify(entry.get("checksum"))
+
+    def apply_update(self, entry):
+        self._apply_levels(entry)
+        return self.verify(entry.get("checksum"))
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def mid(self):
+        if self.bids.size == 0 or self.asks.size == 0:
+            return None
+        return (self.bids.prices[0] + self.asks.prices[0]) / 2
+
+    def spread(self):
+        if self.bids.size == 0 or self.asks.size == 0:
+            return None
+        return self.asks.prices[0] - self.bids.prices[0]
+
+    def depth(self, levels=None):
+        """
+        Returns {'bids': (prices, qtys), 'asks': (prices, qtys)} of the best `levels` levels, as views.
+        """
+        return {"bids": self.bids.depth(levels), "asks": self.asks.depth(levels)}
+
+
+class BookManager:
+    """
+    Order books of every pair subscribed to the 'book' channel.
+
+    Updates for a book that is not valid (no snapshot yet, or a checksum
+    mismatch) are skipped until the next snapshot. `on_mismatch(symbol)` is
+    called when a checksum fails, e.g. to subscribe the pair's book again.
+
+    Args:
+    - depth (int): Subscribed depth.
+    - precisions (dict): {symbol: (price_decimals, qty_decimals)}, see book_precisions().
+    - on_mismatch (callable): Called with the symbol of a book that failed its checksum.
+    """
+
+    def __init__(self, depth=10, precisions=None, on_mismatch=None):
+        self.depth = depth
+        self.precisions = dict(precisions or {})
+        self.on_mismatch = on_mismatch
+        self.books = {}
+        self.lock = threading.Lock()
+
+        self.skipped = 0
+        self.mismatches = 0
+
+    def set_precisions(self, precisions):
+        with self.lock:
+            self.precisions.update(precisions)
+            for symbol, book in self.books.items():
+                book.set_precisions(*self.precisions.get(symbol, (None, None)))
+
+    def load_precisions(self, client):
+        """
+        Loads every pair's precisions from the REST AssetPairs endpoint.
+        """
+        self.set_precisions(book_precisions(client.asset_pairs()))
+
+    def _book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            price_decimals, qty_decimals = self.precisions.get(symbol, (None, None))
+            book = self.books[symbol] = OrderBook(symbol, self.depth, price_decimals, qty_decimals)
+        return book
+
+    def ingest(self, data):
+        """
+        Applies every entry of a parsed Kraken 'book' message (snapshot or update).
+        """
+        failed = []
+        with self.lock:
+            for entry in data["data"]:
+                book = self._book(entry["symbol"])
+                if data.get("type") == "snapshot":
+                    ok = book.apply_snapshot(entry)
+                elif book.valid:
+                    ok = book.apply_update(entry)
+                else:
+                    self.skipped += 1
+                    continue
+                if not ok:
+                    self.mismatches += 1
+                    failed.append(entry["symbol"])
+        if self.on_mismatch is not None:
+            for symbol in failed:
+                self.on_mismatch(symbol)
+
+    def remove(self, symbols):
+        """
+        Drops the books of the given symbols.
+        """
+        with self.lock:
+            return sum(self.books.pop(symbol, None) is not None for symbol in symbols)
+
+    def book(self, symbol):
+        return self.books.get(symbol)
+
+    def best(self, symbol):
+        """
+        Returns (best bid, best ask) of a pair, each (price, qty) or None.
+        """
+        with self.lock:
+            book = self.books.get(symbol)
+            if book is None:
+                return None, None
+            return book.best_bid(), book.best_ask()
+
+    def top(self, symbol, levels=None):
+        """
+        Returns copies of the best `levels` levels of a pair's book, see OrderBook.depth().
+        """
+        with self.lock:
+            book = self.books.get(symbol)
+            if book is None:
+                return None
+            return {side: (prices.copy(), qtys.copy()) for side, (prices, qtys) in book.depth(levels).items()}
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "books": len(self.books),
+                "valid": sum(book.valid for book in self.books.values()),
+                "updates": sum(book.updates for book in self.books.values()),
+                "mismatches": self.mismatches,
+                "skipped": self.skipped,
+            }
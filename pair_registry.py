@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+from rest_client import REST_ASSETS
+
+# Universe written by fetch_kraken_pairs.fetch_kraken_pairs()
+PAIR_CACHE = "./kraken_pairs.json"
+
+# v2 WebSocket asset codes of the legacy codes in AssetPairs' wsname ('XBT' -> 'BTC')
+WS_ASSETS = {legacy: asset for asset, legacy in REST_ASSETS.items()}
+
+
+def v2_symbol(wsname):
+    """
+    Converts an AssetPairs wsname ('XBT/USD') to the name the v2 WebSocket API uses ('BTC/USD').
+    """
+    base, quote = wsname.split("/")
+    return f"{WS_ASSETS.get(base, base)}/{WS_ASSETS.get(quote, quote)}"
+
+
+def pair_records(asset_pairs):
+    """
+    Converts an AssetPairs result into the records kept in the pair cache, one per
+    pair with a WebSocket name, in the order Kraken lists them.
+    """
+    records = []
+    for name, pair in asset_pairs.items():
+        wsname = pair.get("wsname")
+        if not wsname:
+            continue
+        symbol = v2_symbol(wsname)
+        base, quote = symbol.split("/")
+        records.append({
+            "symbol": symbol,
+            "wsname": wsname,
+            "altname": pair.get("altname", name),
+            "base": base,
+            "quote": quote,
+            "pair_decimals": pair.get("pair_decimals"),
+            "lot_decimals": pair.get("lot_decimals"),
+            "status": pair.get("status", "online"),
+        })
+    return records
+
+
+def write_pair_cache(records, path=PAIR_CACHE):
+    """
+    Writes pair records to the JSON cache (atomically, through a temporary file).
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump({"fetched": datetime.now(timezone.utc).isoformat(), "pairs": records}, f, indent=1)
+    os.replace(temporary, path)
+
+
+class PairRegistry:
+    """
+    Interned universe of pairs with dense integer ids.
+
+    Every pair gets the next id when it is added and keeps it, so arrays
+    indexed by pair id stay valid as the universe grows. Pairs are named the
+    way the v2 WebSocket API names them ('BTC/USD'); their AssetPairs wsname
+    ('XBT/USD') and altname ('XBTUSD') resolve to the same id. Base and quote
+    assets get their own dense ids, available per pair as `base_ids` /
+    `quote_ids`.
+
+    Args:
+    - records (list): Pair records (see pair_records()) or plain pair names.
+    """
+
+    def __init__(self, records=()):
+        self.names = []   # Pair id -> symbol
+        self.info = []    # Pair id -> cache record
+        self.ids = {}     # Symbol or alias -> pair id
+        self.assets = []  # Asset id -> asset code
+        self.asset_ids = {}
+        self._base = []
+        self._quote = []
+        self._arrays = None
+        self.lock = threading.Lock()
+        for record in records:
+            if isinstance(record, str):
+                record = {"symbol": v2_symbol(record), "wsname": record}
+            self.add(record["symbol"], record)
+
+    @classmethod
+    def from_cache(cls, path=PAIR_CACHE):
+        with open(path) as f:
+            return cls(json.load(f)["pairs"])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, symbol):
+        return symbol in self.ids
+
+    def _asset_id(self, asset):
+        asset_id = self.asset_ids.get(asset)
+        if asset_id is None:
+            asset_id = self.asset_ids[asset] = len(self.assets)
+            self.assets.append(asset)
+        return asset_id
+
+    def add(self, symbol, record=None):
+        """
+        Adds a pair (a no-op if it is already known) and returns its id.
+        """
+        with self.lock:
+            name, symbol = symbol, v2_symbol(symbol)
+            pair_id = self.ids.get(symbol)
+            if pair_id is not None:
+                return pair_id
+            pair_id = len(self.names)
+            record = dict(record or {}, symbol=symbol)
+            base, quote = symbol.split("/")
+            self.names.append(symbol)
+            self.info.append(record)
+            self.ids[symbol] = pair_id
+            for alias in (name, record.get("wsname"), record.get("altname")):
+                if alias:
+                    self.ids.setdefault(alias, pair_id)
+            self._base.append(self._asset_id(base))
+            self._quote.append(self._asset_id(quote))
+            self._arrays = None
+            return pair_id
+
+    def _build_arrays(self):
+        arrays = self._arrays
+        if arrays is None:
+            with self.lock:
+                keys = np.array(list(self.ids), dtype=str)
+                order = np.argsort(keys)
+                arrays = self._arrays = {
+                    "names": np.array(self.names, dtype=object),
+                    "base": np.array(self._base, dtype=np.int32),
+                    "quote": np.array(self._quote, dtype=np.int32),
+                    "sorted_keys": keys[order],
+                    "sorted_ids": np.fromiter(self.ids.values(), dtype=np.int32, count=len(keys))[order],
+                }
+        return arrays
+
+    @property
+    def base_ids(self):
+        """
+        Base asset id of every pair, indexed by pair id.
+        """
+        return self._build_arrays()["base"]
+
+    @property
+    def quote_ids(self):
+        """
+        Quote asset id of every pair, indexed by pair id.
+        """
+        return self._build_arrays()["quote"]
+
+    def id(self, symbol, default=-1):
+        """
+        Returns a pair's id (its v2 name or wsname), or `default` when it is unknown.
+        """
+        return self.ids.get(symbol, default)
+
+    def symbol(self, pair_id):
+        return self.names[pair_id]
+
+    def symbols(self):
+        return list(self.names)
+
+    def to_ids(self, symbols):
+        """
+        Vectorized symbol -> id lookup, -1 for unknown pairs.
+        """
+        arrays = self._build_arrays()
+        keys = arrays["sorted_keys"]
+        symbols = np.asarray(symbols, dtype=str)
+        if len(keys) == 0:
+            return np.full(symbols.shape, -1, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(keys, symbols), len(keys) - 1)
+        return np.where(keys[positions] == symbols, arrays["sorted_ids"][positions], -1).astype(np.int32)
+
+    def to_symbols(self, pair_ids):
+        """
+        Vectorized id -> symbol lookup, returns an object array.
+        """
+        return self._build_arrays()["names"][np.asarray(pair_ids, dtype=np.intp)]
+
+    def asset_id(self, asset, default=-1):
+        return self.asset_ids.get(WS_ASSETS.get(asset, asset), default)
+
+    def asset(self, asset_id):
+        return self.assets[asset_id]
+
+    def precisions(self):
+        """
+        Returns {symbol: (price_decimals, qty_decimals)} of the pairs whose precisions are known.
+        """
+        return {symbol: (record["pair_decimals"], record["lot_decimals"])
+                for symbol, record in zip(self.names, self.info)
+                if record.get("pair_decimals") is not None and record.get("lot_decimals") is not None}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(path=PAIR_CACHE):
+    """
+    Returns the shared registry, loaded on first use from the JSON cache, or
+    from kraken_pairs.py while no cache has been written yet.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            if os.path.exists(path):
+                _registry = PairRegistry.from_cache(path)
+            else:
+                from kraken_pairs import kraken_pairs
+                _registry = PairRegistry(kraken_pairs)
+        return _registry
@@ -0,0 +1,225 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from candle_store import MINUTE_NS
+from pair_registry import get_registry
+from persistence import read_candle_csv
+
+# Candle fields kept as matrices, all as float64
+PANEL_FIELDS = ["open", "high", "low", "close", "volume", "vwap", "trades"]
+
+
+def read_panel_csv(file_path, fields=PANEL_FIELDS):
+    """
+    Reads one crypto_data/ file as (symbol, interval_begin ns, {field: float64 column}), or None when it is empty.
+    """
+    df = read_candle_csv(file_path)
+    if df.empty:
+        return None
+    begins = df["interval_begin"].str.rstrip("Z").to_numpy().astype("datetime64[ns]").view(np.int64)
+    return df["symbol"].iloc[0], begins, {field: df[field].to_numpy(dtype=np.float64) for field in fields}
+
+
+class UniversePanel:
+    """
+    Aligned symbols x minutes panel of the whole universe: one float64 matrix
+    per field, a row per pair of the registry (by pair id) and a column per
+    minute slot of a rolling window, NaN where there is no candle.
+
+    The time axis is a ring: minute m lives in column m % window and `head`
+    is the newest minute. Moving the head forward only clears the columns of
+    the minutes it enters, nothing is shifted or copied. The matrices are
+    column-major, so the cross-section of one minute is contiguous.
+    values()/to_dataframe() return the window in time order (a copy).
+
+    Attached to a CandleStore, every accepted candle is written in place;
+    load() fills the panel from crypto_data/, reading the files in parallel.
+
+    Args:
+    - window (int): Minutes kept.
+    - fields (list): Candle fields kept, see PANEL_FIELDS.
+    - registry (PairRegistry): Pairs and their ids, defaults to the shared registry.
+    """
+
+    def __init__(self, window=1440, fields=PANEL_FIELDS, registry=None):
+        self.window = window
+        self.fields = list(fields)
+        self.registry = registry if registry is not None else get_registry()
+        self.size = len(self.registry)
+        self.matrices = {field: self._empty(self.size) for field in self.fields}
+        self.head = -1  # Newest minute (interval_begin // MINUTE_NS), -1 while empty
+        self.lock = threading.Lock()
+        self.store = None
+
+        self.updates = 0
+        self.stale = 0  # Candles older than the window
+        self.unknown = 0  # Candles of pairs missing from the registry
+
+    def _empty(self, rows):
+        return np.full((rows, self.window), np.nan, order="F")
+
+    def _grow(self):
+        # Pairs added to the registry after the panel was built
+        size = len(self.registry)
+        for field, matrix in self.matrices.items():
+            self.matrices[field] = np.asfortranarray(np.concatenate([matrix, self._empty(size - self.size)]))
+        self.size = size
+
+    def _advance(self, minute):
+        """
+        Moves the head to `minute`, clearing the columns of the minutes in between.
+        """
+        if self.head >= 0:
+            slots = np.arange(self.head + 1, min(minute, self.head + self.window) + 1) % self.window
+            for matrix in self.matrices.values():
+                matrix[:, slots] = np.nan
+        self.head = minute
+
+    def _write(self, pairs, minutes, columns):
+        """
+        Writes candles given as arrays of pair ids, minutes and {field: values}. Returns how many were written.
+        """
+        if len(minutes) == 0:
+            return 0
+        if pairs.max() >= self.size:
+            self._grow()
+        newest = int(minutes.max())
+        if newest > self.head:
+            self._advance(newest)
+        keep = minutes > self.head - self.window
+        self.stale += int((~keep).sum())
+        pairs, slots = pairs[keep], minutes[keep] % self.window
+        for field in self.fields:
+            self.matrices[field][pairs, slots] = columns[field][keep]
+        return len(pairs)
+
+    def update(self, symbol, row, result):
+        """
+        Store listener, see CandleStore.add_listener().
+        """
+        pair = self.registry.id(symbol)
+        with self.lock:
+            if pair < 0:
+                self.unknown += 1
+                return
+            minute = row["interval_begin"] // MINUTE_NS
+            if minute <= self.head - self.window:
+                self.stale += 1
+                return
+            if pair >= self.size:
+                self._grow()
+            if minute > self.head:
+                self._advance(minute)
+            slot = minute % self.window
+            for field in self.fields:
+                self.matrices[field][pair, slot] = row[field]
+            self.updates += 1
+
+    def ingest_columns(self, columns):
+        """
+        Writes candles given as store columns (see CandleStore.columns()), e.g. a whole store at once.
+        """
+        pairs = self.registry.to_ids(columns["symbol"].astype(str)).astype(np.intp)
+        known = pairs >= 0
+        with self.lock:
+            self.unknown += int((~known).sum())
+            self.updates += self._write(pairs[known], columns["interval_begin"][known] // MINUTE_NS,
+                                        {field: np.asarray(columns[field][known], dtype=np.float64)
+                                         for field in self.fields})
+
+    def attach(self, store):
+        """
+        Writes the candles already in `store`, then follows its updates.
+        """
+        self.store = store
+        store.add_listener(self.update)
+        with store.lock:
+            columns = store._collect(sorted(store.buffers))
+            if columns is not None:
+                self.ingest_columns(columns)
+
+    def detach(self):
+        if self.store is not None:
+            self.store.remove_listener(self.update)
+
+    def load(self, path="./crypto_data", workers=8):
+        """
+        Fills the panel from every <SYMBOL>_data.csv file in `path`, parsing
+        `workers` files at a time. The head moves to the newest candle found,
+        older candles than the window are skipped.
+
+        Returns:
+        - int: Number of files loaded.
+        """
+        names = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith("_data.csv")]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="panel") as executor:
+            files = [result for result in executor.map(lambda name: read_panel_csv(name, self.fields), names)
+                     if result is not None]
+        if not files:
+            return 0
+        lengths = [len(begins) for _, begins, _ in files]
+        symbols = np.repeat(np.array([symbol for symbol, _, _ in files], dtype=object), lengths)
+        columns = {field: np.concatenate([values[field] for _, _, values in files]) for field in self.fields}
+        columns["symbol"] = symbols
+        columns["interval_begin"] = np.concatenate([begins for _, begins, _ in files])
+        self.ingest_columns(columns)
+        return len(files)
+
+    def remove(self, symbols):
+        """
+        Clears the rows of the given symbols (their ids stay reserved), e.g. pairs that were delisted.
+        """
+        with self.lock:
+            for symbol in symbols:
+                pair = self.registry.id(symbol)
+                if 0 <= pair < self.size:
+                    for matrix in self.matrices.values():
+                        matrix[pair] = np.nan
+
+    def times(self):
+        """
+        interval_begin (ns) of every column of values(), oldest first.
+        """
+        return (self.head - self.window + 1 + np.arange(self.window)) * MINUTE_NS
+
+    def values(self, field="close", minutes=None):
+        """
+        Returns one field as a (pairs, minutes) array in time order, the newest
+        minute last, over the last `minutes` minutes (the whole window by default).
+        """
+        minutes = self.window if minutes is None else min(minutes, self.window)
+        with self.lock:
+            slots = np.arange(self.head - minutes + 1, self.head + 1) % self.window
+            return self.matrices[field][:, slots]
+
+    def cross_section(self, field="close", interval_begin=None):
+        """
+        Returns one field of every pair at one minute (the head by default), indexed by pair id.
+        """
+        with self.lock:
+            minute = self.head if interval_begin is None else interval_begin // MINUTE_NS
+            if not self.head - self.window < minute <= self.head:
+                return np.full(self.size, np.nan)
+            return self.matrices[field][:, minute % self.window].copy()
+
+    def to_dataframe(self, field="close", minutes=None):
+        """
+        One field as a wide DataFrame: a column per pair, a row per minute (interval_begin as datetime64).
+        """
+        values = self.values(field, minutes)
+        times = self.times()[-values.shape[1]:].astype("datetime64[ns]")
+        return pd.DataFrame(values.T, index=pd.DatetimeIndex(times, name="interval_begin"),
+                            columns=self.registry.to_symbols(np.arange(values.shape[0])))
+
+    def metrics(self):
+        return {
+            "pairs": self.size,
+            "window": self.window,
+            "head": self.head,
+            "updates": self.updates,
+            "stale": self.stale,
+            "unknown": self.unknown,
+        }
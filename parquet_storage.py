@@ -0,0 +1,247 @@
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from candle_store import to_nanos
+from persistence import read_candle_csv
+
+DAY_NS = 24 * 60 * 60 * 1_000_000_000
+
+# Timestamps are int64 nanoseconds, the symbol column is dictionary encoded
+CANDLE_SCHEMA = pa.schema([
+    ("symbol", pa.dictionary(pa.int32(), pa.string())),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("trades", pa.int64()),
+    ("volume", pa.float64()),
+    ("vwap", pa.float64()),
+    ("interval_begin", pa.int64()),
+    ("interval", pa.int32()),
+    ("timestamp", pa.int64()),
+])
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def candle_table(columns, interval=1):
+    """
+    Builds an Arrow table (CANDLE_SCHEMA) from raw candle columns as returned by CandleStore.columns().
+    """
+    arrays = dict(columns)
+    arrays["symbol"] = pa.array(arrays["symbol"], type=pa.string()).dictionary_encode()
+    if "interval" not in arrays:
+        arrays["interval"] = np.full(len(arrays["interval_begin"]), interval, dtype=np.int32)
+    return pa.table({field.name: arrays[field.name] for field in CANDLE_SCHEMA}, schema=CANDLE_SCHEMA)
+
+
+def partition_dates(interval_begin):
+    """
+    Returns the UTC date ('YYYY-MM-DD') of every interval_begin (ns).
+    """
+    days = np.asarray(interval_begin, dtype=np.int64) // DAY_NS
+    return np.datetime_as_string(days.astype("datetime64[D]"))
+
+
+class ParquetWriter:
+    """
+    Storage backend writing finalized candles as columnar files partitioned by date:
+
+        <save_path>/date=2025-02-03/part-<time>-<n>.parquet
+
+    Every call to write() adds at most one file per date holding all symbols that
+    have new finalized candles. Open candles are not written. Use compact() to
+    merge a day's parts into a single file.
+
+    Same write(store, symbols) interface as CsvAppendWriter, so it can be handed
+    to BackgroundFlusher.
+
+    Args:
+    - save_path (str): Root directory of the dataset.
+    - fmt (str): 'parquet' or 'arrow' (Arrow IPC files).
+    - compression (str): Parquet compression codec.
+    """
+
+    def __init__(self, save_path="./parquet_data", fmt="parquet", compression="zstd"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', expected one of {list(FORMATS)}")
+        self.save_path = save_path
+        self.fmt = fmt
+        self.compression = compression
+        self.persisted = {}  # interval_begin (ns) of the last finalized candle written per symbol
+        self.versions = {}   # Store version of each symbol at its last write
+        self.sequence = 0
+
+        # Counters for the last call to write()
+        self.symbols_written = 0
+        self.rows_written = 0
+
+    def _write_table(self, table, path):
+        temp_path = path + ".tmp"
+        if self.fmt == "parquet":
+            pq.write_table(table, temp_path, compression=self.compression)
+        else:
+            with pa.OSFile(temp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+    def write(self, store, symbols=None):
+        """
+        Write the finalized candles not yet persisted for the given symbols (default: all).
+
+        Returns:
+        - int: Number of symbols with new candles.
+        """
+        self.symbols_written = 0
+        self.rows_written = 0
+        versions = store.versions()
+        since = dict(self.persisted)
+        for symbol in (versions if symbols is None else symbols):
+            # Candles backfilled below what was written go out again, load_table keeps the last copy
+            inserted = store.inserted_since(symbol, self.versions.get(symbol))
+            if inserted is not None and symbol in since and inserted <= since[symbol]:
+                since[symbol] = inserted - 1
+            if symbol in versions:
+                self.versions[symbol] = versions[symbol]
+        columns = store.columns(None if symbols is None else sorted(symbols), finalized_only=True, since=since)
+        if columns is None:
+            return 0
+
+        table = candle_table(columns, store.interval)
+        dates = partition_dates(columns["interval_begin"])
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        for date in np.unique(dates):
+            directory = os.path.join(self.save_path, f"date={date}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{stamp}-{self.sequence:06d}{FORMATS[self.fmt]}")
+            self.sequence += 1
+            self._write_table(table.filter(pa.array(dates == date)), path)
+
+        # Remember the newest candle written for every symbol
+        symbols_column = columns["symbol"]
+        last = np.flatnonzero(np.append(symbols_column[1:] != symbols_column[:-1], True))
+        for index in last:
+            symbol = symbols_column[index]
+            self.persisted[symbol] = max(self.persisted.get(symbol, -1), int(columns["interval_begin"][index]))
+        self.symbols_written = len(last)
+        self.rows_written = table.num_rows
+        return self.symbols_written
+
+    def retire(self, symbols, archive=True):
+        """
+        Forgets symbols that are no longer collected. Their rows stay in the
+        date partitions, which hold every symbol, so there is nothing to archive.
+        """
+        for symbol in symbols:
+            self.versions.pop(symbol, None)
+            self.persisted.pop(symbol, None)
+
+    def compact(self, date):
+        """
+        Merge every part of one date partition into a single file, sorted by symbol and time.
+        """
+        directory = os.path.join(self.save_path, f"date={date}")
+        parts = sorted(name for name in os.listdir(directory) if name.endswith(FORMATS[self.fmt]))
+        if len(parts) < 2:
+            return
+        table = load_table(self.save_path, fmt=self.fmt, start=date, end=np.datetime64(date) + 1)
+        path = os.path.join(directory, f"part-{date.replace('-', '')}-compacted{FORMATS[self.fmt]}")
+        self._write_table(table.select(CANDLE_SCHEMA.names), path)
+        for name in parts:
+            if os.path.join(directory, name) != path:
+                os.remove(os.path.join(directory, name))
+
+
+def _to_nanos(value):
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    return to_nanos(str(value))
+
+
+def load_table(save_path="./parquet_data", symbols=None, start=None, end=None, fmt="parquet"):
+    """
+    Loads candles from a dataset written by ParquetWriter.
+
+    Symbol and time filters are pushed down to the scan: date partitions outside
+    the range are skipped and row groups are filtered on symbol/interval_begin.
+    When a candle was written more than once, the last write wins.
+
+    Args:
+    - symbols (list): Only load these symbols.
+    - start, end: interval_begin range [start, end), as ns or anything np.datetime64 accepts.
+    - fmt (str): 'parquet' or 'arrow'.
+
+    Returns:
+    - pa.Table: Candles sorted by symbol and interval_begin.
+    """
+    dataset = ds.dataset(save_path, format="parquet" if fmt == "parquet" else "ipc",
+                         partitioning="hive", schema=CANDLE_SCHEMA.append(pa.field("date", pa.string())))
+    start, end = _to_nanos(start), _to_nanos(end)
+
+    condition = None
+    conditions = []
+    if symbols is not None:
+        conditions.append(ds.field("symbol").isin(list(symbols)))
+    if start is not None:
+        conditions.append(ds.field("interval_begin") >= start)
+        conditions.append(ds.field("date") >= str(partition_dates([start])[0]))
+    if end is not None:
+        conditions.append(ds.field("interval_begin") < end)
+        conditions.append(ds.field("date") <= str(partition_dates([end - 1])[0]))
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+
+    table = dataset.to_table(filter=condition)
+    if table.num_rows == 0:
+        return table
+
+    # Files are named in write order, keep the last copy of every (symbol, interval_begin)
+    keys = table.select(["symbol", "interval_begin"]).to_pandas()
+    keys["symbol"] = keys["symbol"].astype(str)
+    keys = keys[~keys.duplicated(keep="last")]
+    # Arrow cannot sort dictionary columns, so sort the keys instead
+    order = keys.sort_values(["symbol", "interval_begin"], kind="stable").index.to_numpy()
+    return table.take(pa.array(order))
+
+
+def load_candles(save_path="./parquet_data", symbols=None, start=None, end=None, fmt="parquet"):
+    """
+    Same as load_table but returns a pandas DataFrame.
+    """
+    return load_table(save_path, symbols, start, end, fmt).to_pandas()
+
+
+def csv_to_parquet(csv_path="./crypto_data", save_path="./parquet_data", fmt="parquet"):
+    """
+    Converts every crypto_data/<SYMBOL>_data.csv file into the partitioned dataset.
+    """
+    writer = ParquetWriter(save_path, fmt=fmt)
+    tables = []
+    for name in sorted(os.listdir(csv_path)):
+        if not name.endswith("_data.csv"):
+            continue
+        df = read_candle_csv(os.path.join(csv_path, name))
+        if df.empty:
+            continue
+        columns = {column: df[column].to_numpy() for column in CANDLE_SCHEMA.names}
+        columns["interval_begin"] = np.array([to_nanos(value) for value in df["interval_begin"]], dtype=np.int64)
+        columns["timestamp"] = np.array([to_nanos(value) for value in df["timestamp"]], dtype=np.int64)
+        columns["interval"] = columns["interval"].astype(np.int32)
+        tables.append(candle_table(columns))
+
+    table = pa.concat_tables(tables).unify_dictionaries()
+    dates = partition_dates(table.column("interval_begin").to_numpy())
+    for date in np.unique(dates):
+        directory = os.path.join(save_path, f"date={date}")
+        os.makedirs(directory, exist_ok=True)
+        writer._write_table(table.filter(pa.array(dates == date)),
+                            os.path.join(directory, f"part-{date.replace('-', '')}-csv{FORMATS[fmt]}"))
+    print(f"Converted {len(tables)} files ({table.num_rows} candles) to {save_path}")
+
+
+if __name__ == "__main__":
+    csv_to_parquet()
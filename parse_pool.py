@@ -0,0 +1,161 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from candle_store import COLUMN_DTYPES
+from trade_candles import trade_columns
+
+# Fields copied from the records as they are, interval_begin/timestamp are parsed to ns
+VALUE_FIELDS = [name for name in COLUMN_DTYPES if name not in ("interval_begin", "timestamp")]
+
+
+def _nanos(values):
+    # Kraken's timestamps end in 'Z', which datetime64 does not accept
+    return np.array([value[:-1] for value in values], dtype="datetime64[ns]").view(np.int64)
+
+
+def parse_frames(frames, coalesce=True, trades=False, channels=(), received=None):
+    """
+    Runs in a worker process: decodes raw frames and returns their 'ohlc' records
+    as columns grouped by symbol, plus (symbol, start, stop, unique) per group.
+    With trades=True the records of 'trade' frames are returned as well, as
+    trade_columns() in batch["trade_columns"], and the decoded messages of the
+    other `channels` (e.g. 'book', 'ticker') in order in batch["messages"],
+    each with the time its frame was received in data["received"] when
+    `received` (one time.time_ns() per frame) is given.
+
+    With coalesce=True only the newest update of every (symbol, interval_begin)
+    in the batch is kept, which is all the store would end up with anyway.
+    """
+    records = []
+    trade_records = []
+    messages = []
+    for index, frame in enumerate(frames):
+        try:
+            data = json.loads(frame)
+        except ValueError:
+            continue
+        if data.get("channel") == "ohlc":
+            records.extend(data.get("data", ()))
+        elif trades and data.get("channel") == "trade":
+            trade_records.extend(data.get("data", ()))
+        elif data.get("channel") in channels:
+            if received is not None:
+                data["received"] = received[index]
+            messages.append(data)
+    if coalesce:
+        records = list({(record["symbol"], record["interval_begin"]): record for record in records}.values())
+
+    codes = {}
+    batch = {
+        "codes": np.fromiter((codes.setdefault(record["symbol"], len(codes)) for record in records),
+                             dtype=np.int32, count=len(records)),
+        "interval_begin": _nanos([record["interval_begin"] for record in records]),
+        "timestamp": _nanos([record["timestamp"] for record in records]),
+    }
+    for name in VALUE_FIELDS:
+        batch[name] = np.fromiter((record[name] for record in records), dtype=COLUMN_DTYPES[name],
+                                  count=len(records))
+
+    # Group the rows by symbol (keeping arrival order within a symbol), so the
+    # store can write every symbol's rows as one block
+    order = np.argsort(batch["codes"], kind="stable")
+    for name in batch:
+        batch[name] = batch[name][order]
+    if trade_records:
+        batch["trade_columns"] = trade_columns(trade_records)
+    if messages:
+        batch["messages"] = messages
+    codes_sorted, begins = batch["codes"], batch["interval_begin"]
+    if len(codes_sorted) == 0:
+        batch["groups"] = []
+        return batch
+    starts = np.flatnonzero(np.append(True, codes_sorted[1:] != codes_sorted[:-1]))
+    stops = np.append(starts[1:], len(codes_sorted))
+    # A group is unique when interval_begin strictly increases within it
+    same_symbol = np.append(codes_sorted[1:] == codes_sorted[:-1], False)
+    out_of_order = np.append(begins[1:] <= begins[:-1], False) & same_symbol
+    unique = ~np.logical_or.reduceat(out_of_order, starts)
+
+    names = list(codes)
+    batch["groups"] = [(names[code], start, stop, is_unique) for code, start, stop, is_unique
+                       in zip(codes_sorted[starts].tolist(), starts.tolist(), stops.tolist(), unique.tolist())]
+    return batch
+
+
+class ParsePool:
+    """
+    Pool of worker processes that decode and normalize raw frames, so JSON
+    parsing is not limited to one core by the GIL. The store process only
+    unpickles NumPy columns and applies them.
+
+    Used by IngestPipeline: each batch of queued frames is split into up to
+    `processes` chunks, and results are applied in submission order, which
+    keeps every connection's updates in order.
+
+    Args:
+    - apply (callable): Called with the columns and groups of every parsed batch, e.g. CandleStore.upsert_columns.
+    - processes (int): Worker processes.
+    - min_chunk (int): Fewest frames sent to one worker at a time.
+    - coalesce (bool): Keep only the newest update per candle within a batch.
+    - apply_trades (callable): Called with the trades of every parsed batch, e.g.
+      TradeCandleBuilder.add_trades. 'trade' frames are ignored without it.
+    - handlers (dict): {channel: callable} for other channels, each called with
+      every parsed message of its channel, e.g. {'book': BookManager.ingest}.
+      Frames of channels without a handler are ignored.
+    """
+
+    def __init__(self, apply, processes=2, min_chunk=32, coalesce=True, apply_trades=None, handlers=None):
+        self.apply_columns = apply
+        self.apply_trades = apply_trades
+        self.handlers = dict(handlers or {})
+        self.processes = processes
+        self.min_chunk = min_chunk
+        self.coalesce = coalesce
+        self.max_inflight = 2 * processes
+        self.executor = None
+
+        self.batches = 0
+        self.records = 0
+
+    def start(self):
+        if self.executor is None:
+            # Forking a process that already runs socket threads is unsafe
+            self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("forkserver"))
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def chunk_size(self, frames):
+        """
+        Frames per worker chunk for a batch of `frames` frames.
+        """
+        return max(self.min_chunk, -(-frames // self.processes))
+
+    def submit(self, frames, received=None):
+        """
+        Starts parsing a batch of frames (and their receipt times). Returns the futures in order.
+        """
+        size = self.chunk_size(len(frames))
+        return [self.executor.submit(parse_frames, frames[start:start + size], self.coalesce,
+                                     self.apply_trades is not None, tuple(self.handlers),
+                                     None if received is None else received[start:start + size])
+                for start in range(0, len(frames), size)]
+
+    def apply(self, future):
+        """
+        Waits for one parsed batch and applies it.
+        """
+        batch = future.result()
+        if len(batch["codes"]):
+            self.apply_columns(batch, batch["groups"])
+        if "trade_columns" in batch:
+            self.apply_trades(batch["trade_columns"])
+        for data in batch.get("messages", ()):
+            self.handlers[data["channel"]](data)
+        self.batches += 1
+        self.records += len(batch["codes"])
+
@@ -0,0 +1,408 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from candle_store import CANDLE_COLUMNS, to_nanos
+from data_operations import symbol_file_path
+
+
+def open_line_path(file_path):
+    """
+    Returns the path of the sidecar file holding a symbol's open candle, next to its CSV file.
+    """
+    return file_path + ".open"
+
+
+def _read_complete_lines(file_path):
+    # Skips a line still being appended (or cut short by a crash), readers never parse half a candle
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return pd.read_csv(io.BytesIO(data[:data.rfind(b"\n") + 1]))
+
+
+def read_candle_csv(file_path):
+    """
+    Reads a symbol's CSV file into chronological order with one row per candle.
+    Older files were written newest first with every update of a candle,
+    only the latest update of each candle is kept.
+
+    The open candle written by CsvAppendWriter lives in a sidecar file (see
+    open_line_path()) and is added when it is newer than every finalized candle.
+    """
+    df = _read_complete_lines(file_path)
+    if not df.empty and to_nanos(df["interval_begin"].iloc[0]) > to_nanos(df["interval_begin"].iloc[-1]):
+        df = df.iloc[::-1]
+    open_path = open_line_path(file_path)
+    if os.path.exists(open_path):
+        open_line = _read_complete_lines(open_path)
+        if not open_line.empty and (df.empty or to_nanos(open_line["interval_begin"].iloc[-1]) >
+                                    to_nanos(df["interval_begin"].iloc[-1])):
+            df = pd.concat([df, open_line], ignore_index=True) if not df.empty else open_line
+    if df.empty:
+        return df
+    df = df.drop_duplicates(subset="interval_begin", keep="last")
+    return df.sort_values("interval_begin", kind="stable").reset_index(drop=True)
+
+
+def replace_file(file_path, data, prefix_length=0, chunk_size=1 << 20, sync=True):
+    """
+    Atomically replaces a file with its first `prefix_length` bytes followed by `data`.
+    The new content is written to a temp file in the same directory and moved
+    over the target with os.replace, so readers never see a partial file.
+    With sync=False the temp file is not fsynced first: readers are still
+    safe, but a power loss may leave the file empty.
+    """
+    directory = os.path.dirname(file_path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp:
+            if prefix_length:
+                with open(file_path, "rb") as source:
+                    remaining = prefix_length
+                    while remaining:
+                        chunk = source.read(min(chunk_size, remaining))
+                        if not chunk:
+                            break
+                        temp.write(chunk)
+                        remaining -= len(chunk)
+            temp.write(data)
+            if sync:
+                temp.flush()
+                os.fsync(temp.fileno())
+        # mkstemp creates the file as 0600, keep the target's permissions instead
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def recover_tail(file_path, chunk_size=1 << 16):
+    """
+    Truncates a file after its last newline, dropping a line cut short by a
+    crash in the middle of an in-place write. Only the end of the file is read.
+
+    Returns:
+    - int: Size of the file afterwards.
+    """
+    with open(file_path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(end - chunk_size, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+        return end
+
+
+def archive_file(file_path, archive_name="delisted"):
+    """
+    Moves a file into the `archive_name` directory next to it, e.g. the history
+    of a delisted pair out of crypto_data/. Returns the new path, or None when
+    there is no such file.
+    """
+    if not os.path.exists(file_path):
+        return None
+    directory = os.path.join(os.path.dirname(file_path), archive_name)
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, os.path.basename(file_path))
+    os.replace(file_path, target)
+    return target
+
+
+class CsvAppendWriter:
+    """
+    Persists a CandleStore to one CSV per symbol, writing only what changed.
+
+    Files hold the finalized candles in chronological order and are only ever
+    appended to: on each write, finalized candles newer than the last persisted
+    one are appended as whole lines. The open candle goes to a one-line sidecar
+    file (see open_line_path()) that is replaced atomically (temp file +
+    os.replace). Readers therefore never see persisted data disappear or a
+    patched line: read_candle_csv() skips a line still being appended and only
+    uses the sidecar's candle when it is newer than the finalized ones. A flush
+    costs O(changed lines) whatever the file size. Symbols whose store version
+    has not changed since the last write are not touched.
+
+    The first write of a symbol merges the existing file (if any) with the store
+    and replaces it once. Revisions to candles that were already persisted as
+    finalized are not written back, but candles inserted below them (a backfilled
+    gap) make the next write merge and replace the file again.
+
+    With durable=True appends and the sidecar are fsynced before write()
+    returns. A crash in the middle of an append can only leave the last line
+    cut short: recover_tail() drops it before the file is merged again, and the
+    store (or the journal) still holds the candles it was carrying.
+    """
+
+    def __init__(self, save_path="./crypto_data", durable=False):
+        self.save_path = save_path
+        self.durable = durable
+        self.versions = {}        # Store version of each symbol at its last write
+        self.persisted = {}       # interval_begin (ns) of the last finalized candle on disk
+        self.started = set()      # Symbols whose file was merged and can be appended to
+
+        # Counters for the last call to write()
+        self.symbols_written = 0
+        self.bytes_written = 0
+
+    def _lines(self, df):
+        buffer = io.StringIO()
+        df.to_csv(buffer, header=False, index=False, columns=CANDLE_COLUMNS)
+        return buffer.getvalue().encode()
+
+    def _write_open(self, file_path, frame):
+        """
+        Replace the sidecar with the current open candle, the newest row of `frame`.
+        """
+        header = (",".join(CANDLE_COLUMNS) + "\n").encode()
+        open_line = self._lines(frame.iloc[-1:])
+        replace_file(open_line_path(file_path), header + open_line, sync=self.durable)
+        return len(header) + len(open_line)
+
+    def _rewrite(self, symbol, file_path, frame):
+        """
+        Merge an existing file with the stored candles and write it back in chronological order.
+        """
+        if os.path.exists(file_path) and recover_tail(file_path) > 0:
+            existing = read_candle_csv(file_path)
+            frame = pd.concat([existing[CANDLE_COLUMNS], frame], ignore_index=True)
+            frame = frame.drop_duplicates(subset="interval_begin", keep="last")
+            frame = frame.sort_values("interval_begin", kind="stable").reset_index(drop=True)
+
+        header = (",".join(CANDLE_COLUMNS) + "\n").encode()
+        finalized = header + self._lines(frame.iloc[:-1])
+        replace_file(file_path, finalized, sync=self.durable)
+        self.bytes_written += len(finalized) + self._write_open(file_path, frame)
+        self.started.add(symbol)
+        if len(frame) > 1:
+            self.persisted[symbol] = to_nanos(frame["interval_begin"].iloc[-2])
+
+    def _append(self, symbol, file_path, frame):
+        """
+        Append the new finalized candles, then replace the open candle's sidecar.
+        """
+        finalized = self._lines(frame.iloc[:-1])
+        if finalized:
+            with open(file_path, "ab") as f:
+                f.write(finalized)
+                if self.durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+        self.bytes_written += len(finalized) + self._write_open(file_path, frame)
+        if len(frame) > 1:
+            self.persisted[symbol] = to_nanos(frame["interval_begin"].iloc[-2])
+
+    def write_symbol(self, store, symbol):
+        """
+        Persist the changes of one symbol. The newest stored candle is the open one.
+        """
+        file_path = symbol_file_path(symbol, self.save_path)
+        first_write = symbol not in self.started or not os.path.exists(file_path)
+        since = None if first_write else self.persisted.get(symbol)
+        frame = store.symbol_frame(symbol, since=since)
+        if frame.empty:
+            return
+        if first_write:
+            self._rewrite(symbol, file_path, frame)
+        else:
+            self._append(symbol, file_path, frame)
+        self.symbols_written += 1
+
+    def write(self, store, symbols=None):
+        """
+        Persist every symbol whose candles changed since the last write.
+
+        Args:
+        - store (CandleStore): Store to read candles from.
+        - symbols (iterable): Only consider these symbols, defaults to all of them.
+
+        Returns:
+        - int: Number of files touched.
+        """
+        os.makedirs(self.save_path, exist_ok=True)
+        self.symbols_written = 0
+        self.bytes_written = 0
+
+        versions = store.versions()
+        for symbol in (versions if symbols is None else symbols):
+            version = versions.get(symbol)
+            if version is None or self.versions.get(symbol) == version:
+                continue
+            inserted = store.inserted_since(symbol, self.versions.get(symbol))
+            if inserted is not None and inserted <= self.persisted.get(symbol, inserted):
+                # A gap was filled below what is on disk, merge the file again
+                self.started.discard(symbol)
+            self.write_symbol(store, symbol)
+            self.versions[symbol] = version
+        return self.symbols_written
+
+    def retire(self, symbols, archive=True):
+        """
+        Forgets symbols that are no longer collected and, with archive=True,
+        moves their files to <save_path>/delisted/.
+        """
+        for symbol in symbols:
+            self.versions.pop(symbol, None)
+            self.persisted.pop(symbol, None)
+            self.started.discard(symbol)
+            if archive:
+                file_path = symbol_file_path(symbol, self.save_path)
+                archive_file(file_path)
+                archive_file(open_line_path(file_path))
+
+
+def make_writer(backend="csv", **kwargs):
+    """
+    Returns the storage backend used by BackgroundFlusher.
+
+    Args:
+    - backend (str): 'csv' (CsvAppendWriter), 'parquet' or 'arrow' (ParquetWriter),
+      'candles' (CandleFileWriter).
+    - kwargs: Passed on to the writer, e.g. save_path.
+    """
+    if backend == "csv":
+        return CsvAppendWriter(**kwargs)
+    if backend == "candles":
+        from candle_files import CandleFileWriter
+        return CandleFileWriter(**kwargs)
+    if backend in ("parquet", "arrow"):
+        # Imported here so pyarrow is only needed when the backend is used
+        from parquet_storage import ParquetWriter
+        return ParquetWriter(fmt=backend, **kwargs)
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+
+class BackgroundFlusher:
+    """
+    Flushes the store's dirty symbols from a dedicated thread.
+
+    Every `flush_interval` seconds the dirty set is drained and only those
+    symbols are handed to the writer. If a symbol has been waiting longer than
+    `max_latency` seconds (e.g. because the previous flush was slow) the next
+    flush starts right away instead of waiting for the interval.
+
+    Args:
+    - store (CandleStore): Store to flush.
+    - writer: Object with a write(store, symbols) method, e.g. CsvAppendWriter.
+    - flush_interval (float): Seconds between flushes.
+    - max_latency (float): Upper bound in seconds on how long a change should wait to be flushed.
+    """
+
+    def __init__(self, store, writer, flush_interval=1.0, max_latency=5.0):
+        self.store = store
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.max_latency = max_latency
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Held while writing, so retire() never runs in the middle of a flush
+        self.lock = threading.Lock()
+
+        self.flushes = 0
+        self.failures = 0
+        self.symbols_flushed = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.last_lag = 0.0  # Age of the oldest change when it was flushed
+        self.durations = deque(maxlen=1000)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="flusher", daemon=True)
+        self.thread.start()
+
+    def stop(self, flush=True):
+        """
+        Stop the flusher thread, optionally flushing whatever is still dirty.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if flush:
+            self.flush()
+
+    def next_wait(self):
+        wait = self.flush_interval
+        oldest = self.store.oldest_dirty()
+        if oldest is not None:
+            wait = min(wait, oldest + self.max_latency - time.monotonic())
+        return max(wait, 0.0)
+
+    def run(self):
+        while not self.stop_event.wait(self.next_wait()):
+            self.flush()
+
+    def flush(self):
+        """
+        Write every dirty symbol once. Returns the number of symbols flushed.
+        """
+        dirty = self.store.drain_dirty()
+        if not dirty:
+            return 0
+
+        started = time.monotonic()
+        try:
+            with self.lock:
+                self.writer.write(self.store, list(dirty))
+        except Exception as e:
+            # Keep the symbols dirty so the next flush retries them
+            self.store.mark_dirty(dirty)
+            self.failures += 1
+            print(f"Error flushing {len(dirty)} symbols: {e}")
+            return 0
+
+        finished = time.monotonic()
+        duration = finished - started
+        self.flushes += 1
+        self.symbols_flushed += len(dirty)
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.last_lag = finished - min(dirty.values())
+        self.durations.append(duration)
+        return len(dirty)
+
+    def retire(self, symbols, archive=True):
+        """
+        Makes the writer forget symbols removed from the store (see CsvAppendWriter.retire()),
+        between two flushes.
+        """
+        with self.lock:
+            self.writer.retire(symbols, archive)
+
+    def metrics(self):
+        """
+        Returns flush counters and duration statistics (seconds).
+        """
+        durations = np.array(self.durations) if self.durations else np.zeros(1)
+        return {
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "symbols_flushed": self.symbols_flushed,
+            "pending": len(self.store.dirty),
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "mean_duration": float(durations.mean()),
+            "p99_duration": float(np.percentile(durations, 99)),
+            "last_lag": self.last_lag,
+        }
@@ -0,0 +1,137 @@
+import threading
+import time
+import numpy as np
+
+
+# Fields of a Kraken v2 'ticker' record kept for every pair
+QUOTE_FIELDS = ["bid", "bid_qty", "ask", "ask_qty", "last", "volume", "vwap", "low", "high", "change", "change_pct"]
+
+QUOTE_DTYPE = np.dtype([(name, np.float64) for name in QUOTE_FIELDS] + [
+    ("updated", np.int64),   # time.time_ns() when the last update was received, 0 until the first one
+    ("version", np.int64),   # Table version of the last update
+])
+
+
+class QuoteTable:
+    """
+    Latest ticker of every pair in one preallocated NumPy structured array,
+    one row per pair of the registry, indexed by pair id.
+
+    Every ingested message writes its records column by column and bumps
+    `version`; each row remembers the version of its last update, so a
+    consumer can compare versions to see whether anything changed, and which
+    rows. Prices are NaN until a pair's first ticker arrives. Pairs added to
+    the registry later get rows when their first ticker arrives, which
+    reallocates the table (views taken before do not see them).
+
+    Args:
+    - registry (PairRegistry): Pairs and their ids.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.rows = self._empty(len(registry))
+        self.version = 0
+        self.lock = threading.Lock()
+
+        # Called as listener(ids, received) after every ingested message, under the lock
+        self.listeners = []
+
+        self.updates = 0
+        self.unknown = 0  # Records of pairs without a row
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _empty(size):
+        rows = np.zeros(size, dtype=QUOTE_DTYPE)
+        for name in QUOTE_FIELDS:
+            rows[name] = np.nan
+        return rows
+
+    def ingest(self, data):
+        """
+        Writes every record of a parsed Kraken 'ticker' message (snapshot or update).
+        """
+        ids = [self.registry.id(record.get("symbol")) for record in data["data"]]
+        records = [record for record, pair_id in zip(data["data"], ids) if pair_id >= 0]
+        ids = np.array([pair_id for pair_id in ids if pair_id >= 0], dtype=np.intp)
+        with self.lock:
+            self.unknown += len(data["data"]) - len(records)
+            if not records:
+                return
+            if ids.max() >= len(self.rows):
+                self.rows = np.concatenate([self.rows, self._empty(len(self.registry) - len(self.rows))])
+            self.version += 1
+            for name in QUOTE_FIELDS:
+                column = self.rows[name]
+                # Fields missing from a record keep their last value
+                column[ids] = [record.get(name, column[index]) for record, index in zip(records, ids.tolist())]
+            received = data.get("received") or time.time_ns()
+            self.rows["updated"][ids] = received
+            self.rows["version"][ids] = self.version
+            self.updates += len(records)
+            for listener in self.listeners:
+                listener(ids, received)
+
+    def add_listener(self, listener):
+        """
+        Registers listener(ids, received), called with the row ids every ingested
+        message updated and when it was received (time.time_ns()).
+        """
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            self.listeners.remove(listener)
+
+    def clear(self, symbols):
+        """
+        Empties the rows of the given symbols (their ids stay reserved), e.g. pairs that were delisted.
+        """
+        ids = [self.registry.id(symbol) for symbol in symbols]
+        ids = [pair_id for pair_id in ids if 0 <= pair_id < len(self.rows)]
+        with self.lock:
+            self.rows[ids] = self._empty(len(ids))
+
+    def view(self):
+        """
+        Returns the whole table as a read-only view (no copy), with the version it was taken at.
+        Rows keep changing under the view, copy() it or use snapshot() for a consistent copy.
+        """
+        view = self.rows.view()
+        view.flags.writeable = False
+        return view, self.version
+
+    def snapshot(self):
+        """
+        Returns a consistent copy of the table and its version.
+        """
+        with self.lock:
+            return self.rows.copy(), self.version
+
+    def changed_since(self, version):
+        """
+        Returns the row ids updated after table version `version`.
+        """
+        return np.flatnonzero(self.rows["version"] > version)
+
+    def quote(self, symbol):
+        """
+        Returns the latest ticker of one pair as a dict, or None for an unknown pair.
+        """
+        index = self.registry.id(symbol)
+        if not 0 <= index < len(self.rows):
+            return None
+        with self.lock:
+            row = self.rows[index]
+            return {name: row[name].item() for name in QUOTE_DTYPE.names}
+
+    def spreads(self):
+        """
+        Relative bid/ask spread of every pair, NaN where there is no quote yet.
+        """
+        bid, ask = self.rows["bid"], self.rows["ask"]
+        return (ask - bid) / ((ask + bid) / 2)
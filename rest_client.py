@@ -0,0 +1,226 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from candle_store import format_nanos
+
+MINUTE_NS = 60 * 1_000_000_000
+
+# v2 WebSocket names whose REST pair names still use Kraken's legacy asset codes
+REST_ASSETS = {"BTC": "XBT", "DOGE": "XDG"}
+
+# Errors Kraken returns (with HTTP 200) when the caller is over its limit
+RATE_LIMIT_ERRORS = ("EGeneral:Too many requests", "EAPI:Rate limit exceeded")
+
+
+def rest_pair_name(symbol):
+    """
+    Converts a WebSocket pair name ('BTC/USD') to the REST pair name ('XBTUSD').
+    """
+    base, quote = symbol.split("/")
+    return REST_ASSETS.get(base, base) + REST_ASSETS.get(quote, quote)
+
+
+def ohlc_records(symbol, rows, interval=1):
+    """
+    Converts REST OHLC rows ([time, open, high, low, close, vwap, volume, count])
+    into records shaped like the entries of a WebSocket 'ohlc' message.
+    """
+    if not rows:
+        return []
+    begins = np.array([int(row[0]) for row in rows], dtype=np.int64) * 1_000_000_000
+    interval_begin = format_nanos(begins, unit="ns")
+    timestamp = format_nanos(begins + interval * MINUTE_NS, unit="us")
+    return [{
+        "symbol": symbol,
+        "open": float(row[1]),
+        "high": float(row[2]),
+        "low": float(row[3]),
+        "close": float(row[4]),
+        "trades": int(row[7]),
+        "volume": float(row[6]),
+        "vwap": float(row[5]),
+        "interval_begin": str(interval_begin[index]),
+        "interval": interval,
+        "timestamp": str(timestamp[index]),
+    } for index, row in enumerate(rows)]
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`.
+    acquire() blocks until a token is available, so every thread sharing the
+    bucket shares one request budget.
+    """
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0  # Total seconds callers spent waiting for tokens
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+                self.waited += delay
+            time.sleep(delay)
+
+    def penalize(self, seconds):
+        """
+        Empties the bucket and keeps it empty for `seconds`, e.g. after being throttled.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class KrakenRestClient:
+    """
+    Client for Kraken's public REST API.
+
+    Requests go through one pooled requests.Session (keep-alive connections are
+    reused) and a shared TokenBucket, so any number of threads stay within one
+    budget. stream() fans requests out over a bounded thread pool and yields
+    results as they complete.
+
+    Kraken limits public calls to about one per second per IP, which is the
+    default budget; a throttling error empties the bucket and the call is retried.
+
+    Args:
+    - base_url (str): REST API root.
+    - workers (int): Requests in flight at once.
+    - rate (float): Requests per second allowed by the token bucket.
+    - burst (int): Requests that may be made back to back after an idle period.
+    - retries (int): Attempts per request on throttling or connection errors.
+    """
+
+    def __init__(self, base_url="https://api.kraken.com", workers=4, rate=1.0, burst=1, timeout=10, retries=3,
+                 backoff=5.0):
+        self.base_url = base_url
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, burst)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.requests_made = 0
+        self.throttled = 0
+
+    def get(self, path, params=None):
+        """
+        Calls a public endpoint and returns its 'result'.
+        """
+        for attempt in range(self.retries):
+            self.bucket.acquire()
+            self.requests_made += 1
+            try:
+                response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+                if response.status_code == 429:
+                    raise RateLimitError(response.text)
+                response.raise_for_status()
+                payload = response.json()
+                errors = payload.get("error") or []
+                if any(error in RATE_LIMIT_ERRORS for error in errors):
+                    raise RateLimitError(errors)
+                if errors:
+                    raise RuntimeError(f"{path} failed: {errors}")
+                return payload["result"]
+            except RateLimitError:
+                self.throttled += 1
+                self.bucket.penalize(self.backoff * 2 ** attempt)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt / 10)
+        raise RateLimitError(f"{path} still throttled after {self.retries} attempts")
+
+    def asset_pairs(self):
+        """
+        Returns the AssetPairs result, keyed by Kraken's pair name.
+        """
+        return self.get("/0/public/AssetPairs")
+
+    def ohlc(self, symbol, interval=1, since=None):
+        """
+        Fetches up to 720 candles of a pair.
+
+        Args:
+        - since (int): Only return candles after this interval_begin (ns).
+
+        Returns:
+        - list: Records in WebSocket format, oldest first.
+        """
+        params = {"pair": rest_pair_name(symbol), "interval": interval}
+        if since is not None:
+            params["since"] = since // 1_000_000_000
+        result = self.get("/0/public/OHLC", params)
+        # The result is keyed by Kraken's internal pair name, next to 'last'
+        rows = next((value for key, value in result.items() if key != "last"), [])
+        return ohlc_records(symbol, rows, interval)
+
+    def stream(self, function, items, stop_event=None):
+        """
+        Calls function(item) for every item on the worker pool, keeping at most
+        `workers` calls in flight, and yields (item, result, error) as they complete.
+        """
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rest") as executor:
+            pending = {}
+            while True:
+                while len(pending) < self.workers and not (stop_event is not None and stop_event.is_set()):
+                    item = next(items, StopIteration)
+                    if item is StopIteration:
+                        break
+                    pending[executor.submit(function, item)] = item
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, None if error else future.result(), error
+
+    def ohlc_many(self, requests_, interval=1, stop_event=None):
+        """
+        Fetches OHLC for many pairs concurrently.
+
+        Args:
+        - requests_ (iterable): (symbol, since) pairs, since in ns or None.
+
+        Yields:
+        - tuple: (symbol, records, error) as responses arrive.
+        """
+        for (symbol, since), records, error in self.stream(
+                lambda request: self.ohlc(request[0], interval, request[1]), requests_, stop_event):
+            yield symbol, records, error
+
+    def metrics(self):
+        return {
+            "requests": self.requests_made,
+            "throttled": self.throttled,
+            "waited": self.bucket.waited,
+        }
@@ -0,0 +1,162 @@
+import threading
+import time
+
+from candle_store import CandleStore, MINUTE_NS
+
+# Retention per rolled-up interval (minutes -> candles kept per symbol)
+DEFAULT_CAPACITIES = {
+    5: 288,    # 1 day
+    15: 192,   # 2 days
+    60: 168,   # 1 week
+    240: 180,  # 30 days
+    1440: 365,
+}
+
+
+def aggregate(window, interval_begin):
+    """
+    Combines consecutive candles (columns as returned by SymbolBuffer.window) into one.
+    vwap is the volume-weighted average of the candles' vwaps.
+    """
+    # A bucket holds a handful of candles, plain Python is faster than NumPy reductions here
+    volumes = window["volume"].tolist()
+    close = window["close"][-1].item()
+    volume = sum(volumes)
+    return {
+        "open": window["open"][0].item(),
+        "high": max(window["high"].tolist()),
+        "low": min(window["low"].tolist()),
+        "close": close,
+        "trades": sum(window["trades"].tolist()),
+        "volume": volume,
+        "vwap": sum(map(float.__mul__, window["vwap"].tolist(), volumes)) / volume if volume > 0 else close,
+        "interval_begin": interval_begin,
+        "timestamp": max(window["timestamp"].tolist()),
+    }
+
+
+class CandleRollup:
+    """
+    Derives higher-timeframe candles from the 1-minute stream.
+
+    Every interval is built from the largest smaller interval in the set that
+    divides it (or from the base store): 1m -> 5m -> 15m -> 1h -> 4h -> 1d.
+    When a source candle changes, the one bucket it belongs to is recomputed
+    from the source candles in that bucket. Each step reads at most a handful
+    of candles, and late revisions or backfilled minutes are rolled up exactly.
+
+    Each interval lives in its own CandleStore (`tiers[interval]`) with its own
+    retention, so it can be flushed, journaled or read like the base store.
+    Bars are finalized when the next bar starts, or by finalize() once their
+    interval has ended on the clock.
+
+    Args:
+    - store (CandleStore): 1-minute (or base interval) store to roll up.
+    - intervals (list): Intervals in minutes, each a multiple of the base interval.
+    - capacities (dict): Candles kept per symbol for each interval.
+    """
+
+    def __init__(self, store, intervals=(5, 15, 60, 240, 1440), capacities=None):
+        self.store = store
+        self.intervals = sorted(intervals)
+        capacities = dict(DEFAULT_CAPACITIES, **(capacities or {}))
+
+        self.tiers = {}
+        self.sources = {}  # interval -> (source store, source interval)
+        self.targets = {}  # id(source store) -> intervals built from it
+        for interval in self.intervals:
+            if interval <= store.interval or interval % store.interval:
+                raise ValueError(f"Interval {interval} is not a multiple of the base interval {store.interval}")
+            source_interval = max((other for other in self.intervals if other < interval and interval % other == 0),
+                                  default=store.interval)
+            source = store if source_interval == store.interval else self.tiers[source_interval]
+            if interval // source_interval > source.capacity:
+                raise ValueError(f"{interval}m candles need {interval // source_interval} {source_interval}m candles "
+                                 f"but only {source.capacity} are kept, add an intermediate interval")
+            self.tiers[interval] = CandleStore(capacities.get(interval, store.capacity), interval=interval)
+            self.sources[interval] = (source, source_interval)
+            self.targets.setdefault(id(source), []).append(interval)
+
+        self.listeners = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _on_update(self, source, symbol, row):
+        """
+        Recomputes the bars containing `row` in every interval built from `source`.
+        Runs as a listener of `source`, under its lock.
+        """
+        buffer = source.buffers[symbol]
+        for interval in self.targets.get(id(source), ()):
+            step = interval * MINUTE_NS
+            start = row["interval_begin"] - row["interval_begin"] % step
+            window = buffer.window(start, start + step)
+            if len(window["interval_begin"]):
+                self.tiers[interval].upsert_row(symbol, aggregate(window, start))
+
+    def attach(self):
+        """
+        Starts rolling up every accepted update of the base store.
+        Candles already in the base store are rolled up first.
+        """
+        for source in [self.store] + [self.tiers[interval] for interval in self.intervals]:
+            if id(source) not in self.targets:
+                continue
+            listener = self.listeners[id(source)] = (
+                lambda symbol, row, result, source=source: self._on_update(source, symbol, row))
+            source.add_listener(listener)
+
+        columns = self.store.columns()
+        if columns is not None:
+            names = [name for name in columns if name != "symbol"]
+            with self.store.lock:
+                for index, symbol in enumerate(columns["symbol"]):
+                    self._on_update(self.store, symbol, {name: columns[name][index] for name in names})
+
+    def detach(self):
+        for source in [self.store] + list(self.tiers.values()):
+            listener = self.listeners.pop(id(source), None)
+            if listener is not None:
+                source.remove_listener(listener)
+
+    def finalize(self, now=None):
+        """
+        Finalizes every bar whose interval has ended by `now` (ns, defaults to the clock).
+        """
+        now = time.time_ns() if now is None else now
+        return sum(tier.finalize_before(now) for tier in self.tiers.values())
+
+    def start(self):
+        """
+        Attach to the store and finalize ended bars on every minute boundary.
+        """
+        self.attach()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="rollup", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(60 - time.time() % 60):
+            try:
+                self.finalize()
+            except Exception as e:
+                print(f"Rollup error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.detach()
+
+    def remove(self, symbols):
+        """
+        Drops the rolled-up candles of the given symbols from every interval.
+        """
+        symbols = list(symbols)
+        return sum(tier.remove(symbols) for tier in self.tiers.values())
+
+    def to_dataframe(self, interval, symbols=None, newest_first=False, finalized_only=False):
+        """
+        DataFrame (CSV column layout) of one rolled-up interval.
+        """
+        return self.tiers[interval].to_dataframe(symbols, newest_first, finalized_only)
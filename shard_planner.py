@@ -0,0 +1,217 @@
+import math
+import os
+import threading
+import time
+import numpy as np
+
+from data_operations import symbol_file_path
+
+
+def seed_rates(pairs, data_path="./crypto_data"):
+    """
+    Relative message rate of every pair, taken from the number of rows recorded
+    for it in crypto_data/. Pairs without a file get the median.
+    """
+    rates = {}
+    for pair in pairs:
+        path = symbol_file_path(pair, data_path)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                rates[pair] = max(sum(1 for _ in f) - 1, 0)
+    default = float(np.median(list(rates.values()))) if rates else 1.0
+    return {pair: float(rates.get(pair, default)) for pair in pairs}
+
+
+def plan_shards(rates, chunk_size=450):
+    """
+    Spreads pairs over ceil(len / chunk_size) connections so every connection
+    carries about the same message rate: busiest pairs first, each to the least
+    loaded connection that still has room.
+
+    Returns:
+    - list: One list of pairs per connection.
+    """
+    count = max(math.ceil(len(rates) / chunk_size), 1)
+    shards = [[] for _ in range(count)]
+    loads = np.zeros(count)
+    for pair in sorted(rates, key=lambda pair: (-rates[pair], pair)):
+        open_shards = [index for index in range(count) if len(shards[index]) < chunk_size]
+        index = min(open_shards, key=lambda index: loads[index])
+        shards[index].append(pair)
+        loads[index] += rates[pair]
+    return shards
+
+
+class ShardPlanner:
+    """
+    Assigns pairs to connections by message rate and keeps them balanced.
+
+    The initial plan uses seed_rates(). Once running, the rate of every pair is
+    measured from the store (an exponentially weighted average per `period`)
+    and every connection's load is the sum of its pairs' rates. When the
+    busiest connection carries more than `imbalance` times the load of the
+    quietest one, or the ingest workers spend more than `max_busy` of the time
+    parsing and applying its messages, pairs are moved to the quietest connection: subscribed
+    there first, then unsubscribed from the busy one.
+
+    Args:
+    - chunk_size (int): Most pairs per connection.
+    - period (float): Seconds between rate measurements / rebalancing.
+    - alpha (float): Weight of the newest measurement in the rate average.
+    - warmup (int): Measurements to take before the first rebalance.
+    - max_moves (int): Most pairs moved per rebalance.
+    """
+
+    def __init__(self, chunk_size=450, data_path="./crypto_data", period=10.0, alpha=0.3, warmup=3,
+                 imbalance=1.5, max_busy=0.5, max_moves=20):
+        self.chunk_size = chunk_size
+        self.data_path = data_path
+        self.period = period
+        self.alpha = alpha
+        self.warmup = warmup
+        self.imbalance = imbalance
+        self.max_busy = max_busy
+        self.max_moves = max_moves
+
+        self.rates = {}   # Messages per second per pair (seed values until measured)
+        self.counts = {}  # Updates per pair since the last measurement
+        self.measurements = 0
+        self.measured_at = time.monotonic()
+        self.moves = 0
+
+        self.handler = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def plan(self, pairs):
+        """
+        Returns the initial split of `pairs` into connections.
+        """
+        self.rates = seed_rates(pairs, self.data_path)
+        return plan_shards(self.rates, self.chunk_size)
+
+    def observe(self, symbol, row, result):
+        """
+        Store listener counting the updates of every pair.
+        """
+        self.counts[symbol] = self.counts.get(symbol, 0) + 1
+
+    def measure(self, store):
+        now = time.monotonic()
+        with store.lock:
+            counts, self.counts = self.counts, {}
+        elapsed = max(now - self.measured_at, 1e-9)
+        self.measured_at = now
+        first = self.measurements == 0
+        # Pairs can be placed or forgotten from another thread
+        for pair in list(self.rates):
+            rate = counts.get(pair, 0) / elapsed
+            self.rates[pair] = rate if first else self.alpha * rate + (1 - self.alpha) * self.rates.get(pair, rate)
+        self.measurements += 1
+
+    def place(self, pairs, groups):
+        """
+        Spreads new pairs over existing connections without moving any other
+        pair: each goes to the least loaded connection that still has room,
+        at the median rate until it is measured.
+
+        Args:
+        - groups (list): Pairs of every existing connection.
+
+        Returns:
+        - dict: {connection index: new pairs}.
+        - list: One list of pairs per new connection, for the pairs that fit nowhere.
+        """
+        default = float(np.median(list(self.rates.values()))) if self.rates else 1.0
+        loads = [sum(self.rates.get(pair, 0.0) for pair in group) for group in groups]
+        sizes = [len(group) for group in groups]
+        placed, overflow = {}, []
+        for pair in pairs:
+            self.rates[pair] = default
+            open_groups = [index for index in range(len(groups)) if sizes[index] < self.chunk_size]
+            if not open_groups:
+                overflow.append(pair)
+                continue
+            index = min(open_groups, key=lambda index: loads[index])
+            placed.setdefault(index, []).append(pair)
+            loads[index] += default
+            sizes[index] += 1
+        return placed, plan_shards({pair: self.rates[pair] for pair in overflow}, self.chunk_size) if overflow else []
+
+    def forget(self, pairs):
+        """
+        Stops tracking the rate of pairs that are no longer collected.
+        """
+        for pair in pairs:
+            self.rates.pop(pair, None)
+            self.counts.pop(pair, None)
+
+    def loads(self, supervisors):
+        return [sum(self.rates.get(pair, 0.0) for pair in supervisor.pairs) for supervisor in supervisors]
+
+    def rebalance(self, supervisors):
+        """
+        Moves pairs from the hottest connection to the coolest one if needed.
+
+        Returns:
+        - list: Pairs moved.
+        """
+        if len(supervisors) < 2:
+            return []
+        loads = self.loads(supervisors)
+        busy = [supervisor.busy_fraction() for supervisor in supervisors]
+        hot = max(range(len(supervisors)), key=lambda index: (busy[index] > self.max_busy, loads[index]))
+        cold = min(range(len(supervisors)), key=lambda index: loads[index])
+        if hot == cold:
+            return []
+        if busy[hot] <= self.max_busy and loads[hot] <= self.imbalance * max(loads[cold], 1e-9):
+            return []
+
+        # Move about half the difference, busiest pairs that fit first
+        remaining = (loads[hot] - loads[cold]) / 2
+        if busy[hot] > self.max_busy:
+            # Or enough to bring the ingest time under max_busy, taking it as proportional to the load
+            remaining = max(remaining, loads[hot] * (1 - self.max_busy / busy[hot]))
+        room = self.chunk_size - len(supervisors[cold].pairs)
+        moved = []
+        for pair in sorted(supervisors[hot].pairs, key=lambda pair: -self.rates.get(pair, 0.0)):
+            if len(moved) >= min(self.max_moves, room) or remaining <= 0:
+                break
+            rate = self.rates.get(pair, 0.0)
+            if 0 < rate <= remaining:
+                moved.append(pair)
+                remaining -= rate
+        if moved:
+            supervisors[cold].subscribe(moved)
+            supervisors[hot].unsubscribe(moved)
+            self.moves += len(moved)
+            print(f"Moved {len(moved)} pairs from {supervisors[hot].name} to {supervisors[cold].name} "
+                  f"(load {loads[hot]:.1f} vs {loads[cold]:.1f} msg/s)")
+        return moved
+
+    def start(self, handler):
+        """
+        Measure the handler's pairs and rebalance its connections from a background thread.
+        """
+        self.handler = handler
+        self.measured_at = time.monotonic()
+        handler.store.add_listener(self.observe)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="shard-planner", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.period):
+            try:
+                self.measure(self.handler.store)
+                if self.measurements >= self.warmup:
+                    self.rebalance(self.handler.supervisors)
+            except Exception as e:
+                print(f"Shard planner error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.handler is not None:
+            self.handler.store.remove_listener(self.observe)
@@ -0,0 +1,91 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from arbitrage import ArbitrageScanner, find_cycles, pair_edges
+from pair_registry import PairRegistry
+from quote_table import QuoteTable
+
+
+def random_registry(rng, assets=6, pairs=14):
+    # Random distinct (base, quote) pairs, both directions of an asset couple may be listed
+    couples = [couple for couple in itertools.permutations(range(assets), 2)]
+    chosen = rng.choice(len(couples), size=pairs, replace=False)
+    return PairRegistry([f"C{couples[index][0]}/C{couples[index][1]}" for index in sorted(chosen.tolist())])
+
+
+def brute_force_cycles(sources, targets, assets):
+    """
+    Every directed 3- and 4-cycle through distinct assets, starting from its lowest asset, as edge tuples.
+    """
+    edges_between = {}
+    for edge, (source, target) in enumerate(zip(sources.tolist(), targets.tolist())):
+        edges_between.setdefault((source, target), []).append(edge)
+    cycles = set()
+    for length in (3, 4):
+        for path in itertools.permutations(range(assets), length):
+            if path[0] != min(path):
+                continue
+            hops = [edges_between.get((path[i], path[(i + 1) % length]), []) for i in range(length)]
+            cycles.update(itertools.product(*hops))
+    return cycles
+
+
+def brute_force_profit(edges, bids, asks, fee):
+    value = 1.0
+    for edge in edges:
+        pair = edge // 2
+        value *= bids[pair] * (1 - fee) if edge % 2 == 0 else (1 - fee) / asks[pair]
+    return value - 1
+
+
+def as_tuples(cycles):
+    return [tuple(edge for edge in row if edge >= 0) for row in cycles.tolist()]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_cycle_index_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    registry = random_registry(rng)
+    sources, targets = pair_edges(registry.base_ids, registry.quote_ids)
+    cycles = as_tuples(find_cycles(sources, targets, len(registry.assets)))
+    assert cycles and len(cycles) == len(set(cycles))
+    assert set(cycles) == brute_force_cycles(sources, targets, len(registry.assets))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_profits_and_pair_index_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    registry = random_registry(rng)
+    quotes = QuoteTable(registry)
+    scanner = ArbitrageScanner(quotes, fee=0.001, min_profit=-0.99, max_results=10_000)
+    scanner.attach()
+    cycles = as_tuples(np.where(scanner.cycles >= 2 * scanner.pairs, -1, scanner.cycles))
+
+    symbols = registry.symbols()
+    mids = rng.uniform(0.5, 2.0, len(symbols))
+    bids, asks = mids * 0.999, mids * 1.001
+    quotes.ingest({"channel": "ticker", "data": [
+        {"symbol": symbol, "bid": bid, "ask": ask} for symbol, bid, ask in zip(symbols, bids, asks)]})
+    expected = np.array([brute_force_profit(cycle, bids, asks, 0.001) for cycle in cycles])
+    np.testing.assert_allclose(np.expm1(scanner.values), expected, rtol=1e-9, atol=1e-12)
+
+    # One pair moves: only its cycles are re-evaluated, and they match again
+    pair = int(rng.integers(len(symbols)))
+    bids[pair], asks[pair] = bids[pair] * 1.05, asks[pair] * 1.05
+    quotes.ingest({"channel": "ticker", "data": [
+        {"symbol": symbols[pair], "bid": bids[pair], "ask": asks[pair]}]})
+    touched = {index for index, cycle in enumerate(cycles) if any(edge // 2 == pair for edge in cycle)}
+    assert set(scanner.cycles_of(np.array([pair])).tolist()) == touched
+    expected = np.array([brute_force_profit(cycle, bids, asks, 0.001) for cycle in cycles])
+    np.testing.assert_allclose(np.expm1(scanner.values), expected, rtol=1e-9, atol=1e-12)
+
+    ranked = scanner.scan(limit=len(cycles))
+    assert [opportunity["profit"] for opportunity in ranked] == pytest.approx(sorted(expected, reverse=True))
+    best = ranked[0] if ranked else None
+    if best is not None:
+        index = int(np.argmax(expected))
+        edges = cycles[index]
+        assert best["pairs"] == [symbols[edge // 2] for edge in edges]
+        assert best["sides"] == ["sell" if edge % 2 == 0 else "buy" for edge in edges]
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+import pytest
+
+from backfill import backfill_gaps, missing_minutes, prime_history
+from candle_store import MINUTE_NS, CandleStore
+from rest_client import ohlc_records
+
+
+class FakeRestClient:
+    """
+    Answers ohlc_many() from canned REST rows, calling `during` before each response.
+    """
+
+    def __init__(self, rows, during=None):
+        self.rows = rows
+        self.during = during
+        self.requests = []
+
+    def ohlc_many(self, requests_, interval=1, stop_event=None):
+        for symbol, since in requests_:
+            self.requests.append((symbol, since))
+            if self.during is not None:
+                self.during()
+            rows = [row for row in self.rows[symbol] if since is None or row[0] * 1_000_000_000 > since]
+            yield symbol, ohlc_records(symbol, rows, interval), None
+
+
+def rest_row(minute, close):
+    return [minute * 60, close, close, close, close, close, 1.0, 1]
+
+
+def current_minute():
+    # Stay clear of a minute boundary, the test must finish within the same minute
+    if time.time_ns() % MINUTE_NS > MINUTE_NS - 2_000_000_000:
+        time.sleep(2.5)
+    return time.time_ns() // MINUTE_NS
+
+
+def test_priming_keeps_the_candles_already_streamed():
+    minute = current_minute()
+    store = CandleStore(capacity=120)
+    # REST returns the last 10 minutes, ending with the current, uncommitted candle
+    client = FakeRestClient({"A/USD": [rest_row(m, 1.0) for m in range(minute - 9, minute + 1)]})
+
+    def stream():
+        # Candles the WebSocket delivered before the response arrived
+        for m, close in ((minute - 1, 2.0), (minute, 2.5)):
+            store.upsert_row("A/USD", {"open": close, "high": close, "low": close, "close": close,
+                                       "vwap": close, "volume": 3.0, "trades": 5,
+                                       "interval_begin": m * MINUTE_NS, "timestamp": m * MINUTE_NS + 1})
+
+    client.during = stream
+    primed = prime_history(store, client, ["A/USD"], minutes=10)
+    columns = store.columns(["A/USD"])
+    closes = dict(zip((columns["interval_begin"] // MINUTE_NS).tolist(), columns["close"].tolist()))
+    assert primed == 8
+    assert closes[minute - 1] == 2.0 and closes[minute] == 2.5
+    assert [closes[m] for m in range(minute - 9, minute - 1)] == [1.0] * 8
+
+
+def test_priming_drops_the_open_rest_candle():
+    minute = current_minute()
+    store = CandleStore(capacity=120)
+    client = FakeRestClient({"A/USD": [rest_row(m, 1.0) for m in range(minute - 4, minute + 1)]})
+    assert prime_history(store, client, ["A/USD"], minutes=5) == 4
+    assert store.last_interval_begin("A/USD") == (minute - 1) * MINUTE_NS
+
+
+def test_current_pairs_are_not_primed():
+    minute = current_minute()
+    store = CandleStore(capacity=120)
+    store.upsert_row("A/USD", {"open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "vwap": 1.0, "volume": 1.0,
+                               "trades": 1, "interval_begin": minute * MINUTE_NS, "timestamp": minute * MINUTE_NS})
+    client = FakeRestClient({"A/USD": [], "B/USD": []})
+    prime_history(store, client, ["A/USD", "B/USD"], minutes=5)
+    assert [symbol for symbol, _ in client.requests] == ["B/USD"]
+
+
+def stored_minutes(store, symbol):
+    return (store.columns([symbol])["interval_begin"] // MINUTE_NS).tolist()
+
+
+def stream(store, symbol, minutes):
+    for minute in minutes:
+        store.upsert_row(symbol, {"open": 2.0, "high": 2.0, "low": 2.0, "close": 2.0, "vwap": 2.0, "volume": 1.0,
+                                  "trades": 1, "interval_begin": minute * MINUTE_NS,
+                                  "timestamp": minute * MINUTE_NS + 1})
+
+
+@pytest.mark.parametrize("live, missing", [
+    ([0, 4, 5, 6], [1, 2, 3]),        # Right after the disconnect
+    ([0, 1, 2, 5, 6], [3, 4]),        # In the middle
+    ([0, 1, 2, 3, 4, 6], [5]),        # Just before the newest candle
+    ([0, 2, 4, 6], [1, 3, 5]),        # Several
+    ([0, 1, 2, 3, 4, 5, 6], []),      # None
+])
+def test_backfill_fills_exactly_the_missing_minutes(live, missing):
+    store = CandleStore(capacity=60)
+    stream(store, "A/USD", live)
+    assert (missing_minutes(store, "A/USD", 0) // MINUTE_NS).tolist() == missing
+
+    client = FakeRestClient({"A/USD": [rest_row(minute, 1.0) for minute in range(8)]})
+    filled = backfill_gaps(store, {"A/USD": 0}, client)
+    assert filled == len(missing)
+    assert stored_minutes(store, "A/USD") == list(range(7))
+    # The streamed candles, the open one included, are left alone
+    columns = store.columns(["A/USD"])
+    assert columns["close"][np.isin(columns["interval_begin"] // MINUTE_NS, live)].tolist() == [2.0] * len(live)
+    assert client.requests == ([("A/USD", 0)] if missing else [])
+
+
+def test_minutes_older_than_a_full_buffer_are_not_missing():
+    store = CandleStore(capacity=5)
+    stream(store, "A/USD", [0] + list(range(10, 12)) + [13, 14, 15])
+    assert stored_minutes(store, "A/USD") == [10, 11, 13, 14, 15]
+    assert (missing_minutes(store, "A/USD", 0) // MINUTE_NS).tolist() == [12]
+
+
+def test_backfill_skips_pairs_without_a_newer_candle():
+    store = CandleStore(capacity=60)
+    stream(store, "A/USD", [0, 1])
+    client = FakeRestClient({"A/USD": [], "B/USD": []})
+    assert backfill_gaps(store, {"A/USD": 1, "B/USD": None, "C/USD": 0}, client) == 0
+    assert client.requests == []
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from candle_store import APPENDED, COLUMN_DTYPES, MINUTE_NS, UPDATED, CandleStore
+
+
+def make_columns(symbol, minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    count = len(minutes)
+    columns = {name: rng.uniform(1, 100, count).astype(dtype) for name, dtype in COLUMN_DTYPES.items()}
+    columns["interval_begin"] = np.asarray(minutes, dtype=np.int64) * MINUTE_NS
+    columns["symbol"] = np.array([symbol] * count, dtype=object)
+    return columns
+
+
+def upsert_rows(store, columns):
+    names = list(COLUMN_DTYPES)
+    for index, symbol in enumerate(columns["symbol"].tolist()):
+        store.upsert_row(symbol, {name: columns[name][index].item() for name in names})
+
+
+def assert_same(store, expected):
+    assert store.symbols() == expected.symbols()
+    for finalized_only in (False, True):
+        got, want = store.columns(finalized_only=finalized_only), expected.columns(finalized_only=finalized_only)
+        if want is None:
+            assert got is None
+            continue
+        for name in ["symbol"] + list(COLUMN_DTYPES):
+            np.testing.assert_array_equal(got[name], want[name], err_msg=name)
+
+
+def test_block_repeating_its_first_candle_keeps_the_previous_one():
+    store = CandleStore(capacity=10)
+    store.upsert_columns(make_columns("A", [0]))
+    store.upsert_columns(make_columns("A", [1, 1, 2, 2], seed=1))
+    assert (store.columns()["interval_begin"] // MINUTE_NS).tolist() == [0, 1, 2]
+
+
+def test_block_into_empty_buffer():
+    store, expected = CandleStore(capacity=10), CandleStore(capacity=10)
+    columns = make_columns("A", [3, 3, 4, 4, 5])
+    store.upsert_columns(columns)
+    upsert_rows(expected, columns)
+    assert_same(store, expected)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_upsert_columns_matches_per_row_upsert(seed):
+    rng = np.random.default_rng(seed)
+    capacity = int(rng.integers(2, 12))
+    store, expected = CandleStore(capacity=capacity), CandleStore(capacity=capacity)
+    seen = {store: [], expected: []}
+    store.add_listener(lambda symbol, row, result: seen[store].append((symbol, row["interval_begin"], result)))
+    expected.add_listener(lambda symbol, row, result: seen[expected].append((symbol, row["interval_begin"], result)))
+
+    minute = {"A": 0, "B": 0}
+    for block in range(8):
+        symbols, minutes = [], []
+        for _ in range(int(rng.integers(1, 12))):
+            symbol = "A" if rng.random() < 0.6 else "B"
+            step = rng.choice([0, 0, 1, 1, 2, -1])  # repeats, next minute, gaps and late rows
+            minute[symbol] = max(minute[symbol] + step, 0)
+            symbols.append(symbol)
+            minutes.append(minute[symbol])
+        columns = make_columns("A", minutes, seed=seed * 100 + block)
+        columns["symbol"] = np.array(symbols, dtype=object)
+        store.upsert_columns(columns)
+        upsert_rows(expected, columns)
+        assert_same(store, expected)
+    # Blocks are applied per symbol, so only each symbol's own order is comparable
+    for symbol in minute:
+        assert [item for item in seen[store] if item[0] == symbol] == \
+            [item for item in seen[expected] if item[0] == symbol]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_unique_groups_match_per_row_upsert(seed):
+    rng = np.random.default_rng(seed)
+    store, expected = CandleStore(capacity=6), CandleStore(capacity=6)
+    start = 0
+    for block in range(6):
+        minutes = start + np.cumsum(rng.integers(1, 3, int(rng.integers(1, 9)))) - int(rng.integers(0, 2))
+        columns = make_columns("A", minutes, seed=block)
+        store.upsert_columns(columns, groups=[("A", 0, len(minutes), True)])
+        upsert_rows(expected, columns)
+        assert_same(store, expected)
+        start = int(minutes[-1])
+
+
+def test_block_results_seen_by_listeners():
+    store = CandleStore(capacity=10)
+    store.upsert_columns(make_columns("A", [0]))
+    results = []
+    store.add_listener(lambda symbol, row, result: results.append((row["interval_begin"] // MINUTE_NS, result)))
+    store.upsert_columns(make_columns("A", [0, 1, 1, 2]))
+    assert results == [(0, UPDATED), (1, APPENDED), (1, UPDATED), (2, APPENDED)]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from candle_store import MINUTE_NS, CandleStore
+from cross_rates import CrossRates
+from pair_registry import PairRegistry
+
+SYMBOLS = ["A/USD", "B/USD", "USD/C", "A/B", "C/A", "D/A", "D/B", "E/D", "E/USD", "F/E", "C/B", "G/F"]
+
+
+def candle(minute, close, trades):
+    return {"open": close, "high": close, "low": close, "close": close, "vwap": close, "volume": 1.0,
+            "trades": trades, "interval_begin": minute * MINUTE_NS, "timestamp": minute * MINUTE_NS + 1}
+
+
+def rebuilt(store, registry):
+    fresh = CrossRates(store, numeraire="USD", registry=registry)
+    fresh.rebuild()
+    return fresh
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_updates_match_a_full_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    registry = PairRegistry(SYMBOLS)
+    store = CandleStore(capacity=100)
+    # Some pairs have no candle yet, they get their first one during the updates
+    priced = [symbol for symbol in SYMBOLS if rng.random() < 0.8]
+    trades = {symbol: int(rng.integers(1, 1000)) for symbol in SYMBOLS}
+    minutes = dict.fromkeys(SYMBOLS, 0)
+    for symbol in priced:
+        store.upsert_row(symbol, candle(0, float(rng.uniform(0.5, 2.0)), trades[symbol]))
+
+    rates = CrossRates(store, numeraire="USD", registry=registry)
+    rates.attach()
+    for step in range(200):
+        symbol = SYMBOLS[int(rng.integers(len(SYMBOLS)))]
+        # Revisions of the open candle, or a new minute without trades, leave the liquidity and the tree alone
+        if rng.random() < 0.5 and symbol in priced:
+            row = candle(minutes[symbol], float(rng.uniform(0.5, 2.0)), trades[symbol])
+        else:
+            minutes[symbol] += 1
+            trades[symbol] = 0
+            row = candle(minutes[symbol], float(rng.uniform(0.5, 2.0)), 0)
+            priced.append(symbol)
+        store.upsert_row(symbol, row)
+
+        fresh = rebuilt(store, registry)
+        np.testing.assert_array_equal(rates.parent, fresh.parent)
+        np.testing.assert_allclose(rates.prices(), fresh.prices(), rtol=1e-9, equal_nan=True)
+    assert rates.shifted > 0 and rates.rebuilds == 1
+    rates.detach()
+
+
+def test_prices_follow_the_most_liquid_path():
+    registry = PairRegistry(["A/USD", "B/USD", "A/B"])
+    store = CandleStore(capacity=10)
+    store.upsert_row("A/USD", candle(0, 2.0, 1))
+    store.upsert_row("B/USD", candle(0, 4.0, 100))
+    store.upsert_row("A/B", candle(0, 0.25, 100))
+    rates = CrossRates(store, numeraire="USD", registry=registry)
+    rates.attach()
+    # A is priced through B (1.0), not through its thin USD pair (2.0)
+    assert rates.path("A") == ["B/USD", "A/B"]
+    assert rates.price("A") == pytest.approx(1.0)
+    store.upsert_row("B/USD", candle(0, 8.0, 100))
+    assert rates.price("A") == pytest.approx(2.0) and rates.price("B") == pytest.approx(8.0)
+    assert rates.price("USD", numeraire="B") == pytest.approx(1 / 8.0)
+
+
+def test_removed_pair_unprices_its_subtree_until_rebuild():
+    registry = PairRegistry(["A/USD", "B/A"])
+    store = CandleStore(capacity=10)
+    store.upsert_row("A/USD", candle(0, 2.0, 10))
+    store.upsert_row("B/A", candle(0, 3.0, 10))
+    rates = CrossRates(store, numeraire="USD", registry=registry)
+    rates.attach()
+    assert rates.price("B") == pytest.approx(6.0)
+    rates.remove(["A/USD"])
+    assert np.isnan(rates.price("A")) and np.isnan(rates.price("B"))
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_store import APPENDED, MINUTE_NS, UPDATED
+from indicators import IndicatorEngine, compute_indicators
+from pair_registry import PairRegistry
+
+
+def reference_rsi(closes, period=14):
+    """
+    Wilder's RSI as in TA-Lib: seeded with the simple average of the first `period` changes.
+    """
+    changes = np.diff(closes)
+    gains, losses = np.clip(changes, 0, None), np.clip(-changes, 0, None)
+    values = np.full(len(closes), np.nan)
+    if len(changes) < period:
+        return values
+    gain, loss = gains[:period].mean(), losses[:period].mean()
+    values[period] = 100 * gain / (gain + loss)
+    for position in range(period, len(changes)):
+        gain = (gain * (period - 1) + gains[position]) / period
+        loss = (loss * (period - 1) + losses[position]) / period
+        values[position + 1] = 100 * gain / (gain + loss)
+    return values
+
+
+def make_candles(count, level=100.0, scale=0.01, seed=0):
+    rng = np.random.default_rng(seed)
+    close = level * np.exp(np.cumsum(rng.normal(0, scale, count)))
+    return {"open": close, "high": close * 1.001, "low": close * 0.999, "close": close,
+            "volume": rng.uniform(0.1, 5, count), "vwap": close,
+            "interval_begin": np.arange(count, dtype=np.int64) * MINUTE_NS,
+            "symbol": np.array(["A/USD"] * count, dtype=object)}
+
+
+def test_rsi_matches_wilder_seeded_with_the_simple_average():
+    candles = make_candles(200)
+    result = compute_indicators(candles, {"rsi": ("rsi", 14)})["rsi"]
+    np.testing.assert_allclose(result, reference_rsi(candles["close"]), rtol=1e-10, equal_nan=True)
+    assert np.isnan(result[:14]).all() and not np.isnan(result[14])
+
+
+def test_bollinger_keeps_its_precision_at_high_price_levels():
+    # Tiny moves on a large level: a sum of squares loses every digit of the variance
+    candles = make_candles(300, level=1e8, scale=1e-7)
+    result = compute_indicators(candles, {"bb": ("bollinger", 20, 2.0)})
+    closes = pd.Series(candles["close"])
+    mid, std = closes.rolling(20).mean(), closes.rolling(20).std(ddof=0)
+    np.testing.assert_allclose(result["bb_upper"] - result["bb_mid"], (2 * std).to_numpy(), rtol=1e-6, equal_nan=True)
+    np.testing.assert_allclose(result["bb_mid"], mid.to_numpy(), rtol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize("updates", [1, 3])
+def test_streaming_matches_batch(updates):
+    candles = make_candles(120, seed=1)
+    batch = compute_indicators(candles)
+    engine = IndicatorEngine(registry=PairRegistry(["A/USD"]))
+    names = ["open", "high", "low", "close", "volume", "vwap", "interval_begin"]
+    for position in range(120):
+        row = {name: candles[name][position] for name in names}
+        # Updates of the open candle before its final values
+        for update in range(updates - 1):
+            engine.update("A/USD", dict(row, close=row["close"] * 1.01), APPENDED if update == 0 else UPDATED)
+        engine.update("A/USD", row, APPENDED if updates == 1 else UPDATED)
+        for column, values in batch.items():
+            assert engine.values[column][0] == pytest.approx(values[position], rel=1e-9, nan_ok=True), column
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from ingest_queue import IngestPipeline, IngestQueue, frame_channel
+
+
+def ohlc_frame(symbol, minute, close):
+    return json.dumps({"channel": "ohlc", "type": "update", "data": [
+        {"symbol": symbol, "interval_begin": f"2025-02-03T00:{minute:02d}:00.000000000Z", "close": close}]})
+
+
+def ticker_frame(symbol, **fields):
+    return json.dumps({"channel": "ticker", "type": "update", "data": [dict(symbol=symbol, **fields)]})
+
+
+def overflowing_queue():
+    queue = IngestQueue(maxsize=2, policy="coalesce")
+    queue.put(ohlc_frame("A/USD", 0, 1.0))
+    queue.put(ohlc_frame("A/USD", 0, 1.1))
+    return queue
+
+
+def test_frames_come_back_in_order_with_receipt_times():
+    queue = IngestQueue(maxsize=10)
+    frames = [ohlc_frame("A/USD", minute, 1.0) for minute in range(3)]
+    for frame in frames:
+        queue.put(frame)
+    got, received, keys, messages = queue.get(timeout=0)
+    assert got == frames and len(received) == 3 and keys == [0, 0, 0] and messages == []
+    assert received == sorted(received)
+
+
+def test_overflowing_candles_keep_the_newest_update():
+    queue = overflowing_queue()
+    queue.put(ohlc_frame("A/USD", 0, 1.2))
+    queue.put(ohlc_frame("A/USD", 1, 2.0))
+    queue.put(ohlc_frame("A/USD", 0, 1.3))
+    assert queue.coalesced == 1 and queue.dropped == 0
+
+    frames, _, _, messages = queue.get(timeout=0)
+    assert len(frames) == 2 and messages == []
+    frames, _, _, messages = queue.get(timeout=0)
+    assert frames == []
+    assert [(message["channel"], [record["close"] for record in message["data"]]) for message in messages] == \
+        [("ohlc", [1.3, 2.0])]
+
+
+def test_overflowing_tickers_keep_the_latest_quote_per_pair():
+    queue = overflowing_queue()
+    queue.put(ticker_frame("A/USD", bid=1.0, ask=1.1, last=1.05))
+    queue.put(ticker_frame("B/USD", bid=5.0, ask=5.1))
+    queue.put(ticker_frame("A/USD", bid=1.2, ask=1.3))
+    queue.get(timeout=0)
+    _, _, _, messages = queue.get(timeout=0)
+    tickers = next(message for message in messages if message["channel"] == "ticker")
+    assert tickers["data"] == [{"symbol": "B/USD", "bid": 5.0, "ask": 5.1},
+                               {"symbol": "A/USD", "bid": 1.2, "ask": 1.3, "last": 1.05}]
+    assert tickers["received"] is not None
+    assert queue.coalesced == 1 and queue.dropped == 0
+
+
+def test_unmergeable_frames_are_counted_per_channel():
+    queue = overflowing_queue()
+    queue.put(json.dumps({"channel": "trade", "data": []}))
+    queue.put(json.dumps({"channel": "book", "data": []}))
+    queue.put(json.dumps({"channel": "book", "data": []}))
+    queue.put("not json")
+    assert queue.dropped == 4
+    assert queue.dropped_channels == {"trade": 1, "book": 2, "invalid": 1}
+
+
+def test_pending_candles_are_bounded():
+    queue = overflowing_queue()
+    for minute in range(5):
+        queue.put(ohlc_frame("A/USD", minute, 1.0))
+    assert len(queue.pending) == 2
+    assert queue.dropped_channels == {"ohlc": 3}
+
+
+@pytest.mark.parametrize("policy", ["drop_newest", "drop_oldest"])
+def test_drop_policies_count_per_channel(policy):
+    queue = IngestQueue(maxsize=1, policy=policy)
+    queue.put(ohlc_frame("A/USD", 0, 1.0))
+    queue.put(ticker_frame("A/USD", bid=1.0))
+    assert queue.dropped_channels == {"ticker" if policy == "drop_newest" else "ohlc": 1}
+
+
+def test_frame_channel():
+    assert frame_channel(ticker_frame("A/USD")) == "ticker"
+    assert frame_channel('{"method": "pong"}') == "unknown"
+
+
+def test_pipeline_applies_frames_then_coalesced_messages():
+    handled, sunk = [], []
+    pipeline = IngestPipeline(lambda frame, received: handled.append(json.loads(frame)["data"][0]["close"]),
+                              sunk.append, maxsize=2)
+    queue = pipeline.queues[0]
+    for close in (1.0, 1.1, 1.2, 1.3):
+        pipeline.put(ohlc_frame("A/USD", 0, close))
+    pipeline.put(ticker_frame("A/USD", bid=1.0))
+    pipeline.start()
+    pipeline.stop()
+    assert handled == [1.0, 1.1]
+    assert [(message["channel"], len(message["data"])) for message in sunk] == [("ohlc", 1), ("ticker", 1)]
+    assert sunk[0]["data"][0]["close"] == 1.3
+    assert queue.processed == 4
+
+
+def test_pipeline_measures_handling_time_per_connection():
+    pipeline = IngestPipeline(lambda frame, received: sum(range(20000)), lambda message: None, workers=1)
+    for index in range(30):
+        pipeline.put(ohlc_frame("A/USD", index, 1.0), key=4 if index % 3 == 0 else 1)
+    pipeline.start()
+    pipeline.stop()
+    busy = {key: pipeline.take_busy(key) for key in (1, 4, 7)}
+    assert busy[1] > busy[4] > 0 and busy[7] == 0
+    assert pipeline.take_busy(1) == 0
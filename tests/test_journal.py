@@ -0,0 +1,143 @@
+import numpy as np
+
+from candle_store import COLUMN_DTYPES, MINUTE_NS, CandleStore
+from journal import CandleJournal
+
+
+def candle(minute, close):
+    row = {name: dtype(0) for name, dtype in COLUMN_DTYPES.items()}
+    row.update(open=close, high=close, low=close, close=close, vwap=close, volume=1.0, trades=1,
+               interval_begin=minute * MINUTE_NS, timestamp=minute * MINUTE_NS + 1)
+    return row
+
+
+def restored(path):
+    journal = CandleJournal(str(path))
+    store = CandleStore(capacity=60)
+    journal.restore(store)
+    journal.stop(snapshot=False)
+    return store
+
+
+def assert_same(store, expected):
+    got, want = store.columns(), expected.columns()
+    if want is None:
+        assert got is None
+        return
+    for name in ["symbol"] + list(COLUMN_DTYPES):
+        np.testing.assert_array_equal(got[name], want[name], err_msg=name)
+
+
+def test_restore_replays_repeated_updates(tmp_path):
+    store = CandleStore(capacity=60)
+    journal = CandleJournal(str(tmp_path))
+    journal.attach(store)
+    for symbol in ("A/USD", "B/USD"):
+        for minute, close in [(0, 1.0), (0, 1.5), (1, 2.0), (1, 2.5), (2, 3.0)]:
+            store.upsert_row(symbol, candle(minute, close))
+    journal.stop(snapshot=False)
+
+    restored_store = restored(tmp_path)
+    assert_same(restored_store, store)
+    assert restored_store.columns()["close"].tolist() == [1.5, 2.5, 3.0, 1.5, 2.5, 3.0]
+
+
+def test_restore_from_snapshot_and_journal_tail(tmp_path):
+    rng = np.random.default_rng(0)
+    store = CandleStore(capacity=60)
+    journal = CandleJournal(str(tmp_path))
+    journal.attach(store)
+    minute = 0
+    for step in range(300):
+        minute += int(rng.choice([0, 0, 1]))
+        store.upsert_row(["A/USD", "B/USD", "C/USD"][step % 3], candle(minute, float(rng.uniform(1, 2))))
+        if step == 150:
+            journal.snapshot(store)
+    journal.stop(snapshot=False)
+
+    assert_same(restored(tmp_path), store)
+
+
+def test_restore_applies_removals(tmp_path):
+    store = CandleStore(capacity=60)
+    journal = CandleJournal(str(tmp_path))
+    journal.attach(store)
+    store.upsert_row("A/USD", candle(0, 1.0))
+    store.upsert_row("B/USD", candle(0, 1.0))
+    journal.snapshot(store)
+    store.upsert_row("A/USD", candle(1, 2.0))
+    store.remove(["A/USD"])
+    journal.remove(["A/USD"])
+    store.upsert_row("B/USD", candle(1, 2.0))
+    journal.stop(snapshot=False)
+
+    restored_store = restored(tmp_path)
+    assert restored_store.symbols() == ["B/USD"]
+    assert_same(restored_store, store)
+
+
+def test_relisted_symbol_keeps_candles_after_its_removal(tmp_path):
+    store = CandleStore(capacity=60)
+    journal = CandleJournal(str(tmp_path))
+    journal.attach(store)
+    store.upsert_row("A/USD", candle(0, 1.0))
+    store.remove(["A/USD"])
+    journal.remove(["A/USD"])
+    store.upsert_row("A/USD", candle(5, 2.0))
+    journal.stop(snapshot=False)
+
+    assert_same(restored(tmp_path), store)
+
+
+def test_record_cut_short_is_ignored(tmp_path):
+    store = CandleStore(capacity=60)
+    journal = CandleJournal(str(tmp_path))
+    journal.attach(store)
+    store.upsert_row("A/USD", candle(0, 1.0))
+    store.upsert_row("A/USD", candle(1, 2.0))
+    journal.stop(snapshot=False)
+    segment = journal._segment_path(journal.segment)
+    with open(segment, "ab") as f:
+        f.write(b"\0" * 10)
+
+    assert_same(restored(tmp_path), store)
+
+
+def journal_with_snapshot(path):
+    store = CandleStore(capacity=60)
+    journal = CandleJournal(str(path))
+    journal.attach(store)
+    store.upsert_row("A/USD", candle(0, 1.0))
+    journal.snapshot(store)
+    store.upsert_row("A/USD", candle(1, 2.0))
+    store.upsert_row("B/USD", candle(1, 3.0))
+    journal.stop(snapshot=False)
+    return store
+
+
+def test_corrupt_snapshot_falls_back_to_the_journal_tail(tmp_path):
+    journal_with_snapshot(tmp_path)
+    snapshot_path = tmp_path / "snapshot.npz"
+    snapshot_path.write_bytes(snapshot_path.read_bytes()[:40])
+
+    restored_store = restored(tmp_path)
+    assert restored_store.symbols() == ["A/USD", "B/USD"]
+    assert restored_store.columns()["close"].tolist() == [2.0, 3.0]
+
+
+def test_empty_snapshot_is_ignored(tmp_path):
+    journal_with_snapshot(tmp_path)
+    (tmp_path / "snapshot.npz").write_bytes(b"")
+    assert restored(tmp_path).columns()["close"].tolist() == [2.0, 3.0]
+
+
+def test_symbol_ids_missing_from_symbols_file_are_skipped(tmp_path):
+    journal_with_snapshot(tmp_path)
+    # symbols.txt lost its last line: the snapshot is fine, B/USD's record is not
+    (tmp_path / "symbols.txt").write_text("A/USD\n")
+    restored_store = restored(tmp_path)
+    assert restored_store.symbols() == ["A/USD"]
+    assert restored_store.columns()["close"].tolist() == [1.0, 2.0]
+
+    (tmp_path / "symbols.txt").write_text("")
+    assert restored(tmp_path).columns() is None
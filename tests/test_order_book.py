@@ -0,0 +1,101 @@
+import zlib
+
+import numpy as np
+
+from order_book import BookManager, OrderBook, book_checksum, format_level
+
+
+def level(price, qty):
+    return {"price": price, "qty": qty}
+
+
+def snapshot(symbol="BTC/USD", checksum=None):
+    entry = {"symbol": symbol, "bids": [level(100.0, 0.5), level(99.5, 2.0)],
+             "asks": [level(100.5, 1.25), level(101.0, 3.0)]}
+    if checksum is not None:
+        entry["checksum"] = checksum
+    return {"channel": "book", "type": "snapshot", "data": [entry]}
+
+
+def expected(text):
+    return zlib.crc32(text.encode())
+
+
+# Asks lowest first, then bids highest first, price then qty (2 and 3 decimals)
+SNAPSHOT_TEXT = "10050" + "1250" + "10100" + "3000" + "10000" + "500" + "9950" + "2000"
+
+
+def test_format_level_drops_the_point_and_leading_zeros():
+    assert format_level(0.05005, 5) == "5005"
+    assert format_level(100.5, 2) == "10050"
+    assert format_level(0.5, 3) == "500"
+    assert format_level(45285.2, 1) == "452852"
+
+
+def test_book_checksum_matches_the_concatenated_levels():
+    checksum = book_checksum(np.array([100.5, 101.0]), np.array([1.25, 3.0]),
+                             np.array([100.0, 99.5]), np.array([0.5, 2.0]), 2, 3)
+    assert checksum == expected(SNAPSHOT_TEXT)
+
+
+def test_book_checksum_only_uses_ten_levels_per_side():
+    asks = np.arange(1.0, 13.0)
+    bids = -np.arange(1.0, 13.0)
+    qtys = np.ones(12)
+    assert book_checksum(asks, qtys, bids, qtys, 1, 1) == book_checksum(asks[:10], qtys[:10], bids[:10],
+                                                                      qtys[:10], 1, 1)
+
+
+def test_snapshot_and_updates_keep_the_checksum():
+    book = OrderBook("BTC/USD", depth=10, price_decimals=2, qty_decimals=3)
+    entry = snapshot(checksum=expected(SNAPSHOT_TEXT))["data"][0]
+    assert book.apply_snapshot(entry)
+    assert book.best_bid() == (100.0, 0.5) and book.best_ask() == (100.5, 1.25)
+
+    # Remove the best ask, change a bid and insert a new best bid
+    update = {"symbol": "BTC/USD", "asks": [level(100.5, 0)], "bids": [level(99.5, 1.0), level(100.25, 0.75)]}
+    text = "10100" + "3000" + "10025" + "750" + "10000" + "500" + "9950" + "1000"
+    update["checksum"] = expected(text)
+    assert book.apply_update(update)
+    assert book.checksum() == expected(text)
+    assert book.best_bid() == (100.25, 0.75) and book.best_ask() == (101.0, 3.0)
+    assert book.valid and book.mismatches == 0
+
+
+def test_full_side_drops_levels_beyond_the_depth():
+    book = OrderBook("BTC/USD", depth=2, price_decimals=2, qty_decimals=3)
+    book.apply_snapshot(snapshot()["data"][0])
+    book.apply_update({"symbol": "BTC/USD", "bids": [level(100.25, 1.0), level(98.0, 1.0)]})
+    prices, qtys = book.depth()["bids"]
+    assert prices.tolist() == [100.25, 100.0] and qtys.tolist() == [1.0, 0.5]
+
+
+def test_checksum_is_not_checked_without_precisions():
+    book = OrderBook("BTC/USD")
+    assert book.apply_snapshot(snapshot(checksum=1)["data"][0])
+    assert book.valid and book.mismatches == 0
+
+
+def test_mismatch_invalidates_the_book_until_the_next_snapshot():
+    failed = []
+    manager = BookManager(depth=10, precisions={"BTC/USD": (2, 3)}, on_mismatch=failed.append)
+    manager.ingest(snapshot(checksum=expected(SNAPSHOT_TEXT)))
+    assert manager.book("BTC/USD").valid and failed == []
+
+    manager.ingest({"channel": "book", "type": "update",
+                    "data": [{"symbol": "BTC/USD", "bids": [level(99.0, 1.0)], "checksum": 12345}]})
+    assert failed == ["BTC/USD"] and not manager.book("BTC/USD").valid
+
+    # Updates are skipped until a snapshot makes the book valid again
+    manager.ingest({"channel": "book", "type": "update",
+                    "data": [{"symbol": "BTC/USD", "bids": [level(98.0, 1.0)]}]})
+    manager.ingest(snapshot(checksum=expected(SNAPSHOT_TEXT)))
+    assert manager.book("BTC/USD").valid
+    assert manager.metrics()["mismatches"] == 1 and manager.metrics()["skipped"] == 1
+
+
+def test_set_precisions_reformats_existing_levels():
+    manager = BookManager(depth=10)
+    manager.ingest(snapshot())
+    manager.set_precisions({"BTC/USD": (2, 3)})
+    assert manager.book("BTC/USD").checksum() == expected(SNAPSHOT_TEXT)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_store import MINUTE_NS, CandleStore
+from pair_registry import PairRegistry
+from panel import UniversePanel
+
+START = 1_000  # Minute of the first candle, not a multiple of the window
+
+
+def row(minute, close):
+    return {"open": close, "high": close, "low": close, "close": close, "vwap": close, "volume": 2 * close,
+            "trades": 1, "interval_begin": minute * MINUTE_NS, "timestamp": minute * MINUTE_NS + 1}
+
+
+def make_panel(window=5, symbols=("A/USD", "B/USD")):
+    registry = PairRegistry(list(symbols))
+    return UniversePanel(window=window, fields=["close", "volume"], registry=registry), registry
+
+
+def test_values_come_back_in_time_order():
+    panel, _ = make_panel()
+    for minute in range(START, START + 5):
+        panel.update("A/USD", row(minute, float(minute)), None)
+    panel.update("B/USD", row(START + 3, 7.0), None)
+    values = panel.values("close")
+    assert values[0].tolist() == [float(minute) for minute in range(START, START + 5)]
+    np.testing.assert_array_equal(values[1], [np.nan, np.nan, np.nan, 7.0, np.nan])
+    assert panel.values("close", minutes=2)[0].tolist() == [START + 3.0, START + 4.0]
+    assert panel.times().tolist() == [minute * MINUTE_NS for minute in range(START, START + 5)]
+
+    df = panel.to_dataframe("volume")
+    assert list(df.columns) == ["A/USD", "B/USD"]
+    assert df.index.is_monotonic_increasing
+    assert df.index[-1] == pd.Timestamp(np.datetime64((START + 4) * MINUTE_NS, "ns"))
+    assert df["A/USD"].tolist() == [2.0 * minute for minute in range(START, START + 5)]
+
+
+@pytest.mark.parametrize("step", [2, 5, 7])
+def test_ring_wraps_when_the_head_moves(step):
+    window = 5
+    panel, _ = make_panel(window)
+    for minute in range(START, START + window):
+        panel.update("A/USD", row(minute, float(minute)), None)
+    head = START + window - 1
+    panel.update("B/USD", row(head + step, 1.0), None)
+
+    assert panel.head == head + step
+    expected = np.full(window, np.nan)
+    for index, minute in enumerate(range(head + step - window + 1, head + step + 1)):
+        if START <= minute <= head:
+            expected[index] = minute
+    # Minutes the head moved over are cleared, not left holding candles from a window ago
+    np.testing.assert_array_equal(panel.values("close")[0], expected)
+    assert panel.values("close")[1, -1] == 1.0
+    assert np.isnan(panel.values("close")[1, :-1]).all()
+
+
+def test_stale_candles_are_counted_and_not_written():
+    panel, _ = make_panel()
+    panel.update("A/USD", row(START + 10, 1.0), None)
+    panel.update("A/USD", row(START + 5, 2.0), None)   # One minute before the window
+    panel.update("A/USD", row(START + 6, 3.0), None)   # Oldest minute of the window
+    assert panel.stale == 1 and panel.updates == 2
+    np.testing.assert_array_equal(panel.values("close")[0], [3.0, np.nan, np.nan, np.nan, 1.0])
+
+    columns = {"symbol": np.array(["A/USD", "B/USD"], dtype=object),
+               "interval_begin": np.array([START, START + 8]) * MINUTE_NS,
+               "close": np.array([4.0, 5.0]), "volume": np.array([1.0, 1.0])}
+    panel.ingest_columns(columns)
+    assert panel.stale == 2
+    assert panel.cross_section("close", (START + 8) * MINUTE_NS)[1] == 5.0
+    assert np.isnan(panel.cross_section("close", START * MINUTE_NS)).all()
+
+
+def test_pairs_registered_later_grow_the_panel():
+    panel, registry = make_panel()
+    panel.update("A/USD", row(START, 1.0), None)
+    registry.add("C/USD")
+    panel.update("C/USD", row(START, 3.0), None)
+    assert panel.size == 3
+    assert panel.matrices["close"].flags["F_CONTIGUOUS"]
+    assert panel.cross_section("close").tolist()[::2] == [1.0, 3.0]
+
+    registry.add("D/USD")
+    panel.ingest_columns({"symbol": np.array(["D/USD"], dtype=object), "interval_begin": np.array([START * MINUTE_NS]),
+                          "close": np.array([4.0]), "volume": np.array([8.0])})
+    assert panel.size == 4 and panel.cross_section("volume")[3] == 8.0
+
+    panel.update("X/USD", row(START, 1.0), None)
+    assert panel.unknown == 1
+
+
+def test_attach_follows_the_store():
+    panel, _ = make_panel()
+    store = CandleStore(capacity=10)
+    store.upsert_row("A/USD", row(START, 1.0))
+    panel.attach(store)
+    store.upsert_row("A/USD", row(START + 1, 2.0))
+    store.upsert_row("B/USD", row(START + 1, 3.0))
+    np.testing.assert_array_equal(panel.values("close", minutes=2), [[1.0, 2.0], [np.nan, 3.0]])
+    panel.detach()
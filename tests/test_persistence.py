@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_store import CANDLE_COLUMNS, MINUTE_NS, CandleStore
+from data_operations import symbol_file_path
+from persistence import CsvAppendWriter, open_line_path, read_candle_csv, recover_tail
+
+
+def candle(minute, close):
+    return {"open": close, "high": close + 1, "low": close - 1, "close": close, "trades": 2, "volume": 0.5,
+            "vwap": close, "interval_begin": minute * MINUTE_NS, "timestamp": minute * MINUTE_NS + 1000}
+
+
+def on_disk(save_path, symbol):
+    return read_candle_csv(symbol_file_path(symbol, str(save_path)))[CANDLE_COLUMNS]
+
+
+def in_store(store, symbol):
+    return store.symbol_frame(symbol)[CANDLE_COLUMNS].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("durable", [False, True])
+def test_incremental_writes_match_store(tmp_path, durable):
+    rng = np.random.default_rng(0)
+    store = CandleStore(capacity=500)
+    writer = CsvAppendWriter(str(tmp_path), durable=durable)
+    minute = {"A/USD": 0, "B/USD": 0}
+    for step in range(300):
+        symbol = "A/USD" if rng.random() < 0.7 else "B/USD"
+        minute[symbol] += int(rng.choice([0, 0, 1, 2]))
+        store.upsert_row(symbol, candle(minute[symbol], float(rng.uniform(1, 2))))
+        if step % 7 == 0:
+            writer.write(store)
+    writer.write(store)
+    for symbol in minute:
+        pd.testing.assert_frame_equal(on_disk(tmp_path, symbol), in_store(store, symbol), check_dtype=False)
+
+
+def test_open_candle_goes_to_the_sidecar_and_the_file_only_grows(tmp_path):
+    store = CandleStore(capacity=60)
+    writer = CsvAppendWriter(str(tmp_path), durable=True)
+    file_path = symbol_file_path("A/USD", str(tmp_path))
+    store.upsert_row("A/USD", candle(0, 1.0))
+    writer.write(store)
+    store.upsert_row("A/USD", candle(0, 1.5))
+    writer.write(store)
+    assert on_disk(tmp_path, "A/USD")["close"].tolist() == [1.5]
+
+    sizes = [os.path.getsize(file_path)]
+    for minute in range(1, 4):
+        store.upsert_row("A/USD", candle(minute, float(minute)))
+        writer.write(store)
+        sizes.append(os.path.getsize(file_path))
+    assert sizes == sorted(sizes)
+    # Earlier bytes are never rewritten, the finalized lines are only appended
+    with open(file_path, "rb") as f:
+        assert f.read().count(b"\n") == 1 + 3
+    assert on_disk(tmp_path, "A/USD")["close"].tolist() == [1.5, 1.0, 2.0, 3.0]
+    assert len(pd.read_csv(open_line_path(file_path))) == 1
+
+
+def test_reader_skips_a_line_being_appended(tmp_path):
+    store = CandleStore(capacity=60)
+    writer = CsvAppendWriter(str(tmp_path))
+    for minute in range(3):
+        store.upsert_row("A/USD", candle(minute, float(minute)))
+    writer.write(store)
+    with open(symbol_file_path("A/USD", str(tmp_path)), "ab") as f:
+        f.write(b"A/USD,3.0,4.0,2")
+    assert on_disk(tmp_path, "A/USD")["close"].tolist() == [0.0, 1.0, 2.0]
+
+
+def test_stale_sidecar_does_not_override_finalized_candles(tmp_path):
+    store = CandleStore(capacity=60)
+    writer = CsvAppendWriter(str(tmp_path))
+    store.upsert_row("A/USD", candle(0, 1.0))
+    writer.write(store)
+    file_path = symbol_file_path("A/USD", str(tmp_path))
+    stale = open(open_line_path(file_path), "rb").read()
+    store.upsert_row("A/USD", candle(0, 1.5))
+    store.upsert_row("A/USD", candle(1, 2.0))
+    writer.write(store)
+    # A crash after the append but before the sidecar was replaced
+    with open(open_line_path(file_path), "wb") as f:
+        f.write(stale)
+    assert on_disk(tmp_path, "A/USD")["close"].tolist() == [1.5]
+
+
+def test_retire_archives_the_sidecar(tmp_path):
+    store = CandleStore(capacity=60)
+    writer = CsvAppendWriter(str(tmp_path))
+    store.upsert_row("A/USD", candle(0, 1.0))
+    writer.write(store)
+    writer.retire(["A/USD"])
+    assert sorted(os.listdir(tmp_path / "delisted")) == ["A_USD_data.csv", "A_USD_data.csv.open"]
+
+
+def test_backfilled_gap_rewrites_the_file(tmp_path):
+    store = CandleStore(capacity=60)
+    writer = CsvAppendWriter(str(tmp_path))
+    for minute in (0, 1, 3, 4):
+        store.upsert_row("A/USD", candle(minute, float(minute)))
+    writer.write(store)
+    store.upsert_row("A/USD", candle(2, 2.0))
+    writer.write(store)
+    pd.testing.assert_frame_equal(on_disk(tmp_path, "A/USD"), in_store(store, "A/USD"), check_dtype=False)
+
+
+def test_recover_tail_drops_a_line_cut_short(tmp_path):
+    path = tmp_path / "file.csv"
+    path.write_bytes(b"header\nrow 1\nrow 2 cut sh")
+    assert recover_tail(str(path)) == len(b"header\nrow 1\n")
+    assert path.read_bytes() == b"header\nrow 1\n"
+    assert recover_tail(str(path)) == len(b"header\nrow 1\n")
+
+
+def test_restart_after_torn_write_merges_file_and_store(tmp_path):
+    store = CandleStore(capacity=60)
+    writer = CsvAppendWriter(str(tmp_path), durable=True)
+    for minute in range(5):
+        store.upsert_row("A/USD", candle(minute, float(minute)))
+    writer.write(store)
+    # A crash in the middle of the next write leaves half a line behind
+    file_path = symbol_file_path("A/USD", str(tmp_path))
+    with open(file_path, "ab") as f:
+        f.write(b"A/USD,5.0,6.0,4")
+
+    store.upsert_row("A/USD", candle(5, 5.0))
+    restarted = CsvAppendWriter(str(tmp_path), durable=True)
+    restarted.write(store)
+    pd.testing.assert_frame_equal(on_disk(tmp_path, "A/USD"), in_store(store, "A/USD"), check_dtype=False)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
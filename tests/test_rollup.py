@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from candle_store import MINUTE_NS, CandleStore
+from rollup import CandleRollup
+
+START = int(np.datetime64("2025-02-03T00:00", "m").astype(np.int64))
+INTERVALS = (5, 15, 60, 240)
+
+
+def random_candles(rng, minutes):
+    closes = 100 + np.cumsum(rng.normal(0, 1, minutes))
+    opens = closes + rng.normal(0, 0.5, minutes)
+    frame = pd.DataFrame({
+        "open": opens,
+        "high": np.maximum(opens, closes) + rng.uniform(0, 1, minutes),
+        "low": np.minimum(opens, closes) - rng.uniform(0, 1, minutes),
+        "close": closes,
+        "volume": rng.uniform(0.1, 5, minutes),
+        "vwap": (opens + closes) / 2,
+        "trades": rng.integers(1, 50, minutes),
+        "minute": START + np.arange(minutes),
+    })
+    # Minutes without trades have no candle
+    return frame[rng.random(minutes) > 0.1].reset_index(drop=True)
+
+
+def as_row(candle):
+    minute = int(candle["minute"])
+    row = {name: candle[name] for name in ("open", "high", "low", "close", "volume", "vwap")}
+    row.update(trades=int(candle["trades"]), interval_begin=minute * MINUTE_NS, timestamp=minute * MINUTE_NS + 59)
+    return row
+
+
+def resampled(frame, interval):
+    df = frame.set_index(pd.to_datetime(frame["minute"] * MINUTE_NS))
+    df = df.assign(notional=df["vwap"] * df["volume"])
+    bars = df.resample(f"{interval}min").agg({"open": "first", "high": "max", "low": "min", "close": "last",
+                                               "volume": "sum", "trades": "sum", "notional": "sum"})
+    bars = bars[df["close"].resample(f"{interval}min").count() > 0]
+    bars["vwap"] = bars.pop("notional") / bars["volume"]
+    return bars
+
+
+def assert_matches_pandas(rollup, frame):
+    for interval in INTERVALS:
+        columns = rollup.tiers[interval].columns(["A/USD"])
+        got = pd.DataFrame({name: columns[name] for name in ("open", "high", "low", "close", "volume", "trades",
+                                                             "vwap")},
+                           index=pd.to_datetime(columns["interval_begin"]))
+        expected = resampled(frame, interval)
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_freq=False, check_names=False,
+                                      rtol=1e-12)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rollups_match_pandas_resample(seed):
+    rng = np.random.default_rng(seed)
+    frame = random_candles(rng, 720)
+    store = CandleStore(capacity=1000)
+    rollup = CandleRollup(store, intervals=INTERVALS)
+    rollup.attach()
+    for _, candle in frame.iterrows():
+        # A few updates of the open candle before its final value
+        partial = as_row(candle)
+        store.upsert_row("A/USD", dict(partial, close=partial["open"], volume=0.01))
+        store.upsert_row("A/USD", partial)
+    assert_matches_pandas(rollup, frame)
+
+    # A revised candle inside buckets that are already rolled up, and a backfilled minute
+    index = 37
+    frame.loc[index, ["high", "volume", "close"]] = [frame.loc[index, "high"] + 10, 9.0, frame.loc[index, "close"] + 1]
+    store.upsert_row("A/USD", as_row(frame.loc[index]))
+    missing = sorted(set(range(START, START + 720)) - set(frame["minute"].tolist()))[0]
+    filled = dict(frame.iloc[0], minute=missing)
+    frame = pd.concat([frame, pd.DataFrame([filled])]).sort_values("minute").reset_index(drop=True)
+    store.upsert_row("A/USD", as_row(pd.Series(filled)))
+    assert_matches_pandas(rollup, frame)
+    rollup.detach()
+
+
+def test_attach_rolls_up_candles_already_stored():
+    rng = np.random.default_rng(7)
+    frame = random_candles(rng, 120)
+    store = CandleStore(capacity=200)
+    for _, candle in frame.iterrows():
+        store.upsert_row("A/USD", as_row(candle))
+    rollup = CandleRollup(store, intervals=INTERVALS)
+    rollup.attach()
+    assert_matches_pandas(rollup, frame)
+
+
+def test_bars_are_finalized_once_their_interval_ends():
+    store = CandleStore(capacity=100)
+    rollup = CandleRollup(store, intervals=(5, 15))
+    rollup.attach()
+    for minute in range(START, START + 7):
+        store.upsert_row("A/USD", {"open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0, "vwap": 1.0,
+                                   "trades": 1, "interval_begin": minute * MINUTE_NS,
+                                   "timestamp": minute * MINUTE_NS})
+    assert len(rollup.to_dataframe(5, finalized_only=True)) == 1
+    rollup.finalize((START + 10) * MINUTE_NS)
+    assert len(rollup.to_dataframe(5, finalized_only=True)) == 2
+    assert len(rollup.to_dataframe(15, finalized_only=True)) == 0
+
+
+def test_interval_must_be_a_multiple_of_the_base():
+    with pytest.raises(ValueError):
+        CandleRollup(CandleStore(capacity=10, interval=5), intervals=(12,))
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from fetch_pairs import ShardSupervisor, WebSocketHandler
+from pair_registry import PairRegistry
+from shard_planner import ShardPlanner, plan_shards, seed_rates
+
+PAIRS = [f"P{index}/USD" for index in range(8)]
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def connected_handler(tmp_path, pairs=PAIRS, chunk_size=4):
+    """
+    A handler whose shards are 'connected' to fake sockets, nothing is started.
+    """
+    planner = ShardPlanner(chunk_size=chunk_size, data_path=str(tmp_path))
+    handler = WebSocketHandler(pairs=list(pairs), chunk_size=chunk_size, planner=planner,
+                               registry=PairRegistry(list(pairs)))
+    for index, group in enumerate(handler.connections):
+        supervisor = ShardSupervisor(handler, group, index)
+        supervisor.ws = FakeSocket()
+        supervisor.connected = True
+        handler.supervisors.append(supervisor)
+    return handler
+
+
+def subscriptions(supervisor, method="subscribe"):
+    return [symbol for message in supervisor.ws.sent if message["method"] == method
+            for symbol in message["params"]["symbol"]]
+
+
+def test_plan_spreads_the_load_and_respects_the_chunk_size():
+    rates = {pair: float(rate) for pair, rate in zip(PAIRS, [100, 90, 10, 10, 5, 5, 1, 1])}
+    shards = plan_shards(rates, chunk_size=4)
+    assert sorted(pair for shard in shards for pair in shard) == sorted(PAIRS)
+    assert all(len(shard) <= 4 for shard in shards)
+    loads = [sum(rates[pair] for pair in shard) for shard in shards]
+    assert max(loads) - min(loads) <= 20
+
+
+def test_seed_rates_count_rows_and_default_to_the_median(tmp_path):
+    (tmp_path / "P0_USD_data.csv").write_text("header\n" + "row\n" * 10)
+    (tmp_path / "P1_USD_data.csv").write_text("header\n" + "row\n" * 30)
+    assert seed_rates(["P0/USD", "P1/USD", "P2/USD"], str(tmp_path)) == {"P0/USD": 10.0, "P1/USD": 30.0,
+                                                                        "P2/USD": 20.0}
+
+
+def test_rebalance_moves_pairs_without_double_subscribing(tmp_path):
+    handler = connected_handler(tmp_path)
+    hot, cold = handler.supervisors
+    planner = handler.planner
+    planner.rates = dict.fromkeys(PAIRS, 1.0)
+    for pair in hot.pairs:
+        planner.rates[pair] = 10.0
+    planner.chunk_size = 8
+
+    moved = planner.rebalance(handler.supervisors)
+    assert moved
+    # Every pair is carried by exactly one connection
+    carried = hot.pairs + cold.pairs
+    assert sorted(carried) == sorted(PAIRS) and len(set(carried)) == len(carried)
+    assert not set(moved) & set(hot.pairs) and set(moved) <= set(cold.pairs)
+    # Subscribed on the cold connection, then unsubscribed from the hot one, once per channel
+    assert sorted(subscriptions(cold)) == sorted(moved)
+    assert sorted(subscriptions(hot, "unsubscribe")) == sorted(moved)
+    assert subscriptions(hot) == [] and subscriptions(cold, "unsubscribe") == []
+
+    # Balanced now: nothing moves back
+    assert planner.rebalance(handler.supervisors) == []
+    # Subscribing a pair a connection already carries sends nothing
+    cold.subscribe(moved)
+    assert sorted(subscriptions(cold)) == sorted(moved)
+
+
+def test_rebalance_respects_the_room_left(tmp_path):
+    handler = connected_handler(tmp_path)
+    hot, cold = handler.supervisors
+    planner = handler.planner
+    planner.rates = dict.fromkeys(PAIRS, 0.1)
+    for pair in hot.pairs:
+        planner.rates[pair] = 10.0
+    # The cold connection is already full
+    assert planner.rebalance(handler.supervisors) == []
+    assert hot.ws.sent == [] and cold.ws.sent == []
+
+
+def test_busy_connection_is_relieved_even_when_balanced(tmp_path):
+    handler = connected_handler(tmp_path)
+    hot, cold = handler.supervisors
+    planner = handler.planner
+    planner.rates = dict.fromkeys(PAIRS, 1.0)
+    planner.rates[hot.pairs[0]] = 1.2
+    planner.chunk_size = 8
+    hot.busy_fraction = lambda: 0.9
+    cold.busy_fraction = lambda: 0.1
+    moved = planner.rebalance(handler.supervisors)
+    assert moved and set(moved) <= set(cold.pairs)
+
+
+@pytest.mark.parametrize("count", [1, 3])
+def test_place_fills_existing_connections_first(tmp_path, count):
+    planner = ShardPlanner(chunk_size=4, data_path=str(tmp_path))
+    planner.plan(PAIRS[:6])
+    placed, new_groups = planner.place([f"N{index}/USD" for index in range(count)], [PAIRS[:3], PAIRS[3:6]])
+    assert sum(len(group) for group in placed.values()) == min(count, 2)
+    assert sum(len(group) for group in new_groups) == count - min(count, 2)
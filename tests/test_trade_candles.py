@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from trade_candles import SECOND_NS, TradeCandleBuilder, trade_columns
+
+
+def trade(symbol, second, price, qty):
+    stamp = np.datetime64("2025-02-03T00:00:00", "ns") + np.timedelta64(int(second * SECOND_NS), "ns")
+    return {"symbol": symbol, "price": price, "qty": qty, "timestamp": str(stamp) + "Z"}
+
+
+def expected_candles(trades, duration):
+    candles = {}
+    for record in trades:
+        begin = int(np.datetime64(record["timestamp"][:-1], "ns").astype(np.int64))
+        begin -= begin % (duration * SECOND_NS)
+        candle = candles.setdefault((record["symbol"], begin), [])
+        candle.append((record["price"], record["qty"]))
+    return {key: {"open": rows[0][0], "high": max(price for price, _ in rows), "low": min(price for price, _ in rows),
+                  "close": rows[-1][0], "trades": len(rows), "volume": sum(qty for _, qty in rows),
+                  "vwap": sum(price * qty for price, qty in rows) / sum(qty for _, qty in rows),
+                  "timestamp": key[1] + duration * SECOND_NS}
+            for key, rows in candles.items()}
+
+
+def test_batches_merge_into_the_same_candles():
+    rng = np.random.default_rng(0)
+    trades = [trade(["A/USD", "B/USD"][int(rng.integers(2))], float(second), float(rng.uniform(1, 2)),
+                    float(rng.uniform(0.1, 1)))
+              for second in np.sort(rng.uniform(0, 30, 200))]
+    builder = TradeCandleBuilder([1, 5], capacity=100)
+    for start in range(0, len(trades), 17):
+        builder.ingest({"channel": "trade", "data": trades[start:start + 17]})
+
+    for duration in (1, 5):
+        columns = builder.stores[duration].columns()
+        got = {(symbol, begin): index for index, (symbol, begin)
+               in enumerate(zip(columns["symbol"], columns["interval_begin"].tolist()))}
+        want = expected_candles(trades, duration)
+        assert set(got) == set(want)
+        for key, index in got.items():
+            for name, value in want[key].items():
+                assert np.isclose(columns[name][index], value), (key, name)
+
+
+def test_quiet_pair_is_finalized():
+    builder = TradeCandleBuilder([1], grace=0)
+    builder.add_trades(trade_columns([trade("A/USD", 0.2, 1.0, 1.0)]))
+    begin = int(builder.stores[1].columns()["interval_begin"][0])
+    assert builder.finalize(begin + SECOND_NS // 2) == 0
+    assert builder.finalize(begin + SECOND_NS) == 1
+    assert builder.stores[1].columns(finalized_only=True) is not None
+
+
+def test_background_thread_finalizes_ended_candles():
+    builder = TradeCandleBuilder([1], grace=0)
+    now = np.datetime64(time.time_ns() - 2 * SECOND_NS, "ns")
+    builder.add_trades(trade_columns([{"symbol": "A/USD", "price": 1.0, "qty": 1.0, "timestamp": str(now) + "Z"}]))
+    builder.start()
+    deadline = time.monotonic() + 3
+    while builder.finalized == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    builder.stop()
+    assert builder.finalized == 1
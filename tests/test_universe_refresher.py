@@ -0,0 +1,74 @@
+import os
+
+from candle_store import COLUMN_DTYPES, MINUTE_NS, CandleStore
+from journal import CandleJournal
+from persistence import BackgroundFlusher, CsvAppendWriter
+from test_shard_planner import PAIRS, connected_handler, subscriptions
+from universe_refresher import UniverseRefresher, diff_universe
+
+
+def asset_pairs(pairs):
+    return {pair.replace("/", ""): {"wsname": pair, "altname": pair.replace("/", ""), "pair_decimals": 2,
+                                    "lot_decimals": 8} for pair in pairs}
+
+
+def candle(minute, close):
+    row = {name: dtype(0) for name, dtype in COLUMN_DTYPES.items()}
+    row.update(open=close, high=close, low=close, close=close, vwap=close, volume=1.0, trades=1,
+               interval_begin=minute * MINUTE_NS, timestamp=minute * MINUTE_NS + 1)
+    return row
+
+
+def test_diff_universe_matches_legacy_names():
+    added, removed = diff_universe(["XBT/USD", "ETH/USD", "OLD/USD"], ["BTC/USD", "ETH/USD", "NEW/USD"])
+    assert added == ["NEW/USD"] and removed == ["OLD/USD"]
+
+
+def test_delisted_pair_can_be_listed_again(tmp_path):
+    handler = connected_handler(tmp_path / "rates")
+    save_path = str(tmp_path / "data")
+    flusher = BackgroundFlusher(handler.store, CsvAppendWriter(save_path))
+    journal = CandleJournal(str(tmp_path / "journal"))
+    journal.attach(handler.store)
+    refresher = UniverseRefresher(handler, flusher=flusher, evict=[journal], cache=None)
+    for pair in PAIRS:
+        handler.store.upsert_row(pair, candle(0, 1.0))
+    flusher.flush()
+
+    delisted = "P3/USD"
+    carrier = next(supervisor for supervisor in handler.supervisors if delisted in supervisor.pairs)
+    other = next(supervisor for supervisor in handler.supervisors if supervisor is not carrier)
+    added, removed = refresher.refresh(asset_pairs([pair for pair in PAIRS if pair != delisted]))
+    assert added == [] and removed == [delisted]
+    assert subscriptions(carrier, "unsubscribe") == [delisted]
+    assert other.ws.sent == []
+    assert delisted not in handler.subscribed_pairs() and delisted not in handler.store.symbols()
+    assert sorted(os.listdir(os.path.join(save_path, "delisted"))) == ["P3_USD_data.csv", "P3_USD_data.csv.open"]
+
+    added, removed = refresher.refresh(asset_pairs(PAIRS))
+    assert added == [delisted] and removed == []
+    # Subscribed again on one connection, without a new connection or touching the others' pairs
+    assert len(handler.supervisors) == 2
+    assert sorted(handler.subscribed_pairs()) == sorted(PAIRS)
+    assert sum(subscriptions(supervisor).count(delisted) for supervisor in handler.supervisors) == 1
+
+    handler.store.upsert_row(delisted, candle(5, 2.0))
+    flusher.flush()
+    files = sorted(name for name in os.listdir(save_path) if name.startswith("P3_USD"))
+    assert files == ["P3_USD_data.csv", "P3_USD_data.csv.open"]
+    journal.stop(snapshot=False)
+
+    # A restart only sees the candles collected since the pair came back
+    restored = CandleStore(capacity=60)
+    CandleJournal(str(tmp_path / "journal")).restore(restored)
+    assert (restored.columns([delisted])["interval_begin"] // MINUTE_NS).tolist() == [5]
+    assert refresher.metrics()["added"] == 1 and refresher.metrics()["removed"] == 1
+
+
+def test_a_response_removing_too_much_removes_nothing(tmp_path):
+    # Room left on the connections, so no new one is opened
+    handler = connected_handler(tmp_path, chunk_size=5)
+    refresher = UniverseRefresher(handler, cache=None)
+    added, removed = refresher.refresh(asset_pairs(PAIRS[:2] + ["NEW/USD"]))
+    assert removed == [] and added == ["NEW/USD"]
+    assert sorted(handler.subscribed_pairs()) == sorted(PAIRS + ["NEW/USD"]) and len(handler.supervisors) == 2
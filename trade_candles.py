@@ -0,0 +1,182 @@
+import threading
+import time
+import numpy as np
+
+from candle_store import CandleStore
+
+SECOND_NS = 1_000_000_000
+
+
+def trade_columns(records):
+    """
+    Converts the records of Kraken 'trade' messages to columns: symbol (object),
+    price, qty and timestamp (int64 ns), in arrival order.
+    """
+    return {
+        "symbol": np.array([record["symbol"] for record in records], dtype=object),
+        "price": np.fromiter((record["price"] for record in records), dtype=np.float64, count=len(records)),
+        "qty": np.fromiter((record["qty"] for record in records), dtype=np.float64, count=len(records)),
+        # Kraken's timestamps end in 'Z', which datetime64 does not accept
+        "timestamp": np.array([record["timestamp"][:-1] for record in records],
+                              dtype="datetime64[ns]").view(np.int64),
+    }
+
+
+def aggregate_trades(trades, step):
+    """
+    Builds one candle per (symbol, interval) from a batch of trades.
+
+    Args:
+    - trades (dict): Columns as returned by trade_columns().
+    - step (int): Candle duration in ns.
+
+    Returns:
+    - dict: Candle columns (CSV layout, interval_begin/timestamp as int64 ns) sorted
+      by symbol then interval_begin, plus 'pv' (sum of price * qty). None when empty.
+      Like Kraken's 'ohlc' candles, `timestamp` is the end of the interval.
+    """
+    if len(trades["price"]) == 0:
+        return None
+    names, codes = np.unique(trades["symbol"], return_inverse=True)
+    begins = trades["timestamp"] - trades["timestamp"] % step
+    # Stable, so trades keep their arrival order within a candle
+    order = np.lexsort((begins, codes))
+    codes, begins = codes[order], begins[order]
+    price, qty = trades["price"][order], trades["qty"][order]
+
+    starts = np.flatnonzero(np.append(True, (codes[1:] != codes[:-1]) | (begins[1:] != begins[:-1])))
+    stops = np.append(starts[1:], len(codes))
+    volume = np.add.reduceat(qty, starts)
+    pv = np.add.reduceat(price * qty, starts)
+    close = price[stops - 1]
+    return {
+        "symbol": names[codes[starts]],
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": close,
+        "trades": (stops - starts).astype(np.int64),
+        "volume": volume,
+        "vwap": np.divide(pv, volume, out=close.copy(), where=volume > 0),
+        "interval_begin": begins[starts],
+        "timestamp": begins[starts] + step,
+        "pv": pv,
+    }
+
+
+class TradeCandleBuilder:
+    """
+    Builds candles of arbitrary (sub-minute) duration from Kraken's 'trade' channel.
+
+    Every batch of trades is aggregated per (symbol, interval) with NumPy and
+    merged into the candles already stored for those intervals, so a candle
+    receives one update per batch however many trades it contains. Each
+    duration has its own CandleStore with the same columns as crypto_data/;
+    its `interval` is in minutes like Kraken's (e.g. 0.25 for 15 seconds) and
+    `timestamp` is the end of the interval, as in Kraken's 'ohlc' candles.
+
+    A candle is finalized when the next one of its pair starts or, for a pair
+    that goes quiet, by finalize(), which start() calls from a background
+    thread on every boundary of the shortest duration, `grace` seconds late
+    so trades still in flight for the interval are merged first.
+
+    Args:
+    - seconds (list): Candle durations in seconds.
+    - capacity (int): Candles kept per symbol and duration.
+    - grace (float): Seconds after an interval ends before its candle is finalized.
+    """
+
+    def __init__(self, seconds=(1, 5, 15), capacity=900, grace=0.5):
+        self.seconds = sorted(seconds)
+        self.stores = {duration: CandleStore(capacity, interval=duration / 60) for duration in self.seconds}
+        # Merging reads a candle before writing it, batches are applied one at a time
+        self.lock = threading.Lock()
+        self.grace = grace
+        self.trades = 0
+        self.batches = 0
+        self.finalized = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def ingest(self, data):
+        """
+        Adds the trades of a parsed Kraken 'trade' message (snapshot or update).
+        """
+        if data.get("data"):
+            self.add_trades(trade_columns(data["data"]))
+
+    def add_trades(self, trades):
+        """
+        Aggregates a batch of trades (columns as returned by trade_columns()) into every duration.
+        """
+        with self.lock:
+            for duration, store in self.stores.items():
+                candles = aggregate_trades(trades, duration * SECOND_NS)
+                if candles is not None:
+                    self._merge(store, candles)
+                    store.upsert_columns(candles)
+            self.trades += len(trades["price"])
+            self.batches += 1
+
+    def _merge(self, store, candles):
+        """
+        Folds the candles already stored for the same (symbol, interval_begin) into `candles`, in place.
+        """
+        for index, (symbol, begin) in enumerate(zip(candles["symbol"], candles["interval_begin"].tolist())):
+            stored = store.candle(symbol, begin)
+            if stored is None:
+                continue
+            volume = stored["volume"] + candles["volume"][index]
+            pv = stored["vwap"] * stored["volume"] + candles["pv"][index]
+            candles["open"][index] = stored["open"]
+            candles["high"][index] = max(stored["high"], candles["high"][index])
+            candles["low"][index] = min(stored["low"], candles["low"][index])
+            candles["trades"][index] += stored["trades"]
+            candles["volume"][index] = volume
+            candles["vwap"][index] = pv / volume if volume > 0 else candles["close"][index]
+
+    def finalize(self, now=None):
+        """
+        Finalizes every candle whose interval has ended by `now` (ns, defaults to the clock).
+        """
+        now = time.time_ns() if now is None else now
+        finalized = sum(store.finalize_before(now) for store in self.stores.values())
+        self.finalized += finalized
+        return finalized
+
+    def start(self):
+        """
+        Finalizes ended candles from a background thread until stop().
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="trade-candles", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        step = self.seconds[0]
+        while not self.stop_event.wait(step - (time.time() - self.grace) % step):
+            try:
+                self.finalize(time.time_ns() - int(self.grace * SECOND_NS))
+            except Exception as e:
+                print(f"Trade candle error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def remove(self, symbols):
+        """
+        Drops the candles of the given symbols from every duration.
+        """
+        symbols = list(symbols)
+        with self.lock:
+            return sum(store.remove(symbols) for store in self.stores.values())
+
+    def to_dataframe(self, seconds, symbols=None, newest_first=False, finalized_only=False):
+        """
+        DataFrame (CSV column layout) of the candles of one duration.
+        """
+        return self.stores[seconds].to_dataframe(symbols, newest_first, finalized_only)
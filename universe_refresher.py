@@ -0,0 +1,139 @@
+import threading
+import time
+
+from order_book import book_precisions
+from pair_registry import PAIR_CACHE, pair_records, v2_symbol, write_pair_cache
+
+
+def diff_universe(subscribed, listed):
+    """
+    Compares the subscribed pairs with the pairs Kraken lists.
+
+    Args:
+    - subscribed (iterable): Pairs currently collected, by v2 name or wsname.
+    - listed (iterable): v2 names of the pairs in AssetPairs.
+
+    Returns:
+    - list: Listed pairs that are not subscribed (new listings).
+    - list: Subscribed pairs that are no longer listed, as they were subscribed.
+    """
+    subscribed = {v2_symbol(pair): pair for pair in subscribed}
+    listed = set(listed)
+    added = sorted(listed - set(subscribed))
+    removed = sorted(pair for symbol, pair in subscribed.items() if symbol not in listed)
+    return added, removed
+
+
+class UniverseRefresher:
+    """
+    Follows listings and delistings while the collector runs.
+
+    Every `period` seconds AssetPairs is fetched and diffed against the pairs
+    the handler is subscribed to. New pairs are subscribed on the least loaded
+    connections that have room (or on a new connection) and delisted pairs are
+    unsubscribed on the connections carrying them, so every other connection
+    keeps its socket and its subscriptions. Delisted pairs are then evicted
+    from the handler's stores, from every object in `evict` (e.g. a
+    CandleRollup) and from the flusher's writer, which archives their files.
+    The pair cache is rewritten, so the next start begins with the new universe.
+
+    A response that would remove more than `max_removed` of the subscribed
+    pairs is taken for a bad response: its new pairs are added but nothing is
+    removed.
+
+    Args:
+    - handler (WebSocketHandler): Collector to keep up to date.
+    - period (float): Seconds between refreshes.
+    - flusher (BackgroundFlusher): Flusher whose writer forgets delisted pairs.
+    - evict (list): Other objects with a remove(symbols) method.
+    - archive (bool): Move the files of delisted pairs to <save_path>/delisted/.
+    - max_removed (float): Largest share of the universe removed by one refresh.
+    - cache (str): Pair cache to rewrite, None to leave it alone.
+    """
+
+    def __init__(self, handler, period=3600.0, flusher=None, evict=(), archive=True, max_removed=0.2,
+                 cache=PAIR_CACHE):
+        self.handler = handler
+        self.period = period
+        self.flusher = flusher
+        self.evict = list(evict)
+        self.archive = archive
+        self.max_removed = max_removed
+        self.cache = cache
+
+        self.refreshes = 0
+        self.added = 0
+        self.removed = 0
+        self.last_refresh = None
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def refresh(self, asset_pairs=None):
+        """
+        Fetches AssetPairs (unless given) and applies the difference to the handler.
+
+        Returns:
+        - list: Pairs subscribed.
+        - list: Pairs unsubscribed and evicted.
+        """
+        handler = self.handler
+        if asset_pairs is None:
+            asset_pairs = handler.rest_client.asset_pairs()
+        records = pair_records(asset_pairs)
+        if not records:
+            return [], []
+        subscribed = handler.subscribed_pairs()
+        added, removed = diff_universe(subscribed, [record["symbol"] for record in records])
+        if len(removed) > self.max_removed * max(len(subscribed), 1):
+            print(f"AssetPairs would remove {len(removed)} of {len(subscribed)} pairs, not removing any")
+            removed = []
+
+        for record in records:
+            handler.registry.add(record["symbol"], record)
+        if added:
+            if handler.books is not None:
+                handler.books.set_precisions(book_precisions(asset_pairs))
+            added = handler.add_pairs(added)
+        if removed:
+            handler.remove_pairs(removed)
+            for other in self.evict:
+                other.remove(removed)
+            if self.flusher is not None:
+                self.flusher.retire(removed, self.archive)
+        if self.cache:
+            write_pair_cache(records, self.cache)
+
+        self.refreshes += 1
+        self.added += len(added)
+        self.removed += len(removed)
+        self.last_refresh = time.time()
+        if added or removed:
+            print(f"Universe refreshed: {len(added)} pairs listed {added[:10]}, "
+                  f"{len(removed)} delisted {removed[:10]}")
+        return added, removed
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="universe-refresher", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.period):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Universe refresh error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def metrics(self):
+        return {
+            "refreshes": self.refreshes,
+            "added": self.added,
+            "removed": self.removed,
+            "last_refresh": self.last_refresh,
+        }